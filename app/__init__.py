@@ -48,4 +48,19 @@ def create_app(config_name='default'):
     app.register_blueprint(accountant_bp, url_prefix='/accountant')
     app.register_blueprint(api_bp, url_prefix='/api')
     
+    # Register service hooks and maintenance commands
+    from app.services import autocomplete, booking, cache, counters, events, ids, patient_search, phone_numbers, profiler, query_budget, schema, waitlist
+    cache.init_app(app)
+    patient_search.init_app(app)
+    phone_numbers.init_app(app)
+    schema.init_app(app)
+    booking.init_app(app)
+    waitlist.init_app(app)
+    ids.init_app(app)
+    counters.init_app(app)
+    events.init_app(app)
+    query_budget.init_app(app)
+    profiler.init_app(app)
+    autocomplete.init_app(app)
+    
     return app
\ No newline at end of file
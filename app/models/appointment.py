@@ -3,6 +3,10 @@ from app import db
 
 class Appointment(db.Model):
     __tablename__ = 'appointments'
+    __table_args__ = (
+        # Conflict probes and day/range loads per doctor
+        db.Index('ix_appointments_doctor_date_time', 'doctor_id', 'appointment_date', 'appointment_time'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     appointment_id = db.Column(db.String(20), unique=True, nullable=False, index=True)
@@ -25,7 +29,10 @@ class Appointment(db.Model):
     follow_up_date = db.Column(db.Date)
     
     # Billing
-    consultation_fee = db.Column(db.Decimal(10, 2), default=0.0)
+    consultation_fee = db.Column(db.Numeric(10, 2), default=0.0)
+    
+    # Recurrence
+    series_id = db.Column(db.Integer, db.ForeignKey('appointment_series.id'), index=True)
     
     # System fields
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -50,9 +57,8 @@ class Appointment(db.Model):
     
     def generate_appointment_id(self):
         """Generate unique appointment ID."""
-        date_str = self.appointment_date.strftime('%Y%m%d') if self.appointment_date else datetime.now().strftime('%Y%m%d')
-        timestamp = datetime.now().strftime('%H%M%S')
-        return f'APT{date_str}{timestamp}'
+        from app.services.ids import allocate_id
+        return allocate_id('APT', self.appointment_date)
     
     @property
     def appointment_datetime(self):
@@ -153,52 +159,164 @@ class Appointment(db.Model):
             'reason_for_visit': self.reason_for_visit,
             'consultation_fee': float(self.consultation_fee) if self.consultation_fee else 0,
             'duration': self.duration,
+            'series_id': self.series_id,
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
     
     @staticmethod
-    def get_available_slots(doctor_id, appointment_date, duration=30):
+    def get_available_slots(doctor_id, appointment_date, duration=30, granularity=None):
         """Get available time slots for a doctor on a specific date."""
-        from datetime import timedelta
-        
-        # Define working hours (can be made configurable)
-        start_time = time(9, 0)  # 9:00 AM
-        end_time = time(17, 0)   # 5:00 PM
-        
-        # Get existing appointments for the doctor on that date
-        existing_appointments = Appointment.query.filter(
-            Appointment.doctor_id == doctor_id,
-            Appointment.appointment_date == appointment_date,
-            Appointment.status != 'cancelled'
-        ).all()
-        
-        # Generate all possible time slots
-        available_slots = []
-        current_time = datetime.combine(appointment_date, start_time)
-        end_datetime = datetime.combine(appointment_date, end_time)
-        
-        while current_time + timedelta(minutes=duration) <= end_datetime:
-            slot_time = current_time.time()
-            
-            # Check if this slot conflicts with existing appointments
-            is_available = True
-            for appointment in existing_appointments:
-                apt_start = datetime.combine(appointment_date, appointment.appointment_time)
-                apt_end = apt_start + timedelta(minutes=appointment.duration)
-                slot_start = current_time
-                slot_end = current_time + timedelta(minutes=duration)
-                
-                # Check for overlap
-                if not (slot_end <= apt_start or slot_start >= apt_end):
-                    is_available = False
-                    break
-            
-            if is_available:
-                available_slots.append(slot_time.strftime('%H:%M'))
-            
-            current_time += timedelta(minutes=duration)
-        
-        return available_slots
+        from app.services.scheduling import available_slots
+        return available_slots(doctor_id, appointment_date, duration, granularity)
+    
+    def __repr__(self):
+        return f'<Appointment {self.appointment_id}: {self.patient.full_name if self.patient else "Unknown"} with {self.doctor.full_name if self.doctor else "Unknown"}>'
+
+class AppointmentSeries(db.Model):
+    __tablename__ = 'appointment_series'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    patient_id = db.Column(db.Integer, db.ForeignKey('patients.id'), nullable=False)
+    doctor_id = db.Column(db.Integer, db.ForeignKey('staff.id'), nullable=False)
+    
+    # Recurrence rule
+    frequency = db.Column(db.Enum('daily', 'weekly', 'biweekly', name='series_frequencies'), nullable=False)
+    start_date = db.Column(db.Date, nullable=False)
+    end_date = db.Column(db.Date, nullable=False)  # Date of the last occurrence
+    occurrences = db.Column(db.Integer, nullable=False)  # Occurrences in the rule, booked or not
+    appointment_time = db.Column(db.Time, nullable=False)
+    duration = db.Column(db.Integer, default=30)  # Duration in minutes
+    appointment_type = db.Column(db.Enum('Consultation', 'Follow-up', 'Emergency', 'Checkup', 'Surgery', name='appointment_types'), nullable=False)
+    reason_for_visit = db.Column(db.Text)
+    
+    # System fields
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_by = db.Column(db.Integer, db.ForeignKey('users.id'))
+    
+    # Relationships
+    appointments = db.relationship('Appointment', backref='series', lazy='dynamic')
+    
+    def to_dict(self):
+        """Convert series to dictionary."""
+        return {
+            'id': self.id,
+            'patient_id': self.patient_id,
+            'doctor_id': self.doctor_id,
+            'frequency': self.frequency,
+            'start_date': self.start_date.isoformat() if self.start_date else None,
+            'end_date': self.end_date.isoformat() if self.end_date else None,
+            'occurrences': self.occurrences,
+            'appointment_time': self.appointment_time.strftime('%H:%M') if self.appointment_time else None,
+            'duration': self.duration,
+            'appointment_type': self.appointment_type
+        }
+    
+    def __repr__(self):
+        return f'<AppointmentSeries {self.id}: {self.frequency} from {self.start_date}>'
+
+class SlotHold(db.Model):
+    __tablename__ = 'slot_holds'
+    __table_args__ = (
+        db.Index('ix_slot_holds_doctor_date_time', 'doctor_id', 'appointment_date', 'appointment_time'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    hold_token = db.Column(db.String(36), unique=True, nullable=False, index=True)
+    doctor_id = db.Column(db.Integer, db.ForeignKey('staff.id'), nullable=False)
+    patient_id = db.Column(db.Integer, db.ForeignKey('patients.id'))
+    appointment_date = db.Column(db.Date, nullable=False)
+    appointment_time = db.Column(db.Time, nullable=False)
+    duration = db.Column(db.Integer, default=30)  # Duration in minutes
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    created_by = db.Column(db.Integer, db.ForeignKey('users.id'))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    @property
+    def is_expired(self):
+        """Check if the hold has lapsed."""
+        return self.expires_at <= datetime.utcnow()
+    
+    def to_dict(self):
+        """Convert hold to dictionary."""
+        return {
+            'hold_token': self.hold_token,
+            'doctor_id': self.doctor_id,
+            'patient_id': self.patient_id,
+            'appointment_date': self.appointment_date.isoformat() if self.appointment_date else None,
+            'appointment_time': self.appointment_time.strftime('%H:%M') if self.appointment_time else None,
+            'duration': self.duration,
+            'expires_at': self.expires_at.isoformat() if self.expires_at else None
+        }
+    
+    def __repr__(self):
+        return f'<SlotHold {self.hold_token}: Doctor {self.doctor_id} at {self.appointment_date} {self.appointment_time}>'
+
+class WaitlistEntry(db.Model):
+    __tablename__ = 'waitlist_entries'
+    __table_args__ = (
+        # Cancellation backfill matches on doctor, or department for any-doctor entries
+        db.Index('ix_waitlist_doctor_status_dates', 'doctor_id', 'status', 'earliest_date', 'latest_date'),
+        db.Index('ix_waitlist_department_status_dates', 'department', 'status', 'earliest_date', 'latest_date'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    patient_id = db.Column(db.Integer, db.ForeignKey('patients.id'), nullable=False)
+    doctor_id = db.Column(db.Integer, db.ForeignKey('staff.id'))  # Empty: any doctor of the department
+    department = db.Column(db.String(100))
+    
+    # Preferred dates and daily time window
+    earliest_date = db.Column(db.Date, nullable=False)
+    latest_date = db.Column(db.Date, nullable=False)
+    window_start = db.Column(db.Time)
+    window_end = db.Column(db.Time)
+    
+    # Requested appointment
+    duration = db.Column(db.Integer, default=30)  # Duration in minutes
+    appointment_type = db.Column(db.Enum('Consultation', 'Follow-up', 'Emergency', 'Checkup', 'Surgery', name='appointment_types'), nullable=False)
+    reason_for_visit = db.Column(db.Text)
+    priority = db.Column(db.Enum('low', 'medium', 'high', 'urgent', name='priority_levels'), default='medium')
+    auto_book = db.Column(db.Boolean, default=False)  # Book freed slots without asking first
+    status = db.Column(db.Enum('waiting', 'offered', 'booked', 'cancelled', name='waitlist_status'), default='waiting')
+    
+    # Pending offer and final booking
+    hold_token = db.Column(db.String(36))
+    offer_expires_at = db.Column(db.DateTime)
+    appointment_id = db.Column(db.Integer, db.ForeignKey('appointments.id'))
+    
+    # System fields
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_by = db.Column(db.Integer, db.ForeignKey('users.id'))
+    
+    # Relationships
+    patient = db.relationship('Patient', backref='waitlist_entries')
+    doctor = db.relationship('Staff', backref='waitlist_entries')
+    appointment = db.relationship('Appointment')
+    hold = db.relationship('SlotHold', primaryjoin='foreign(WaitlistEntry.hold_token) == SlotHold.hold_token',
+                           viewonly=True, uselist=False)
+    
+    def to_dict(self):
+        """Convert waitlist entry to dictionary."""
+        hold = self.hold if self.status == 'offered' else None
+        return {
+            'id': self.id,
+            'patient_id': self.patient_id,
+            'patient_name': self.patient.full_name if self.patient else '',
+            'doctor_id': self.doctor_id,
+            'department': self.department,
+            'earliest_date': self.earliest_date.isoformat() if self.earliest_date else None,
+            'latest_date': self.latest_date.isoformat() if self.latest_date else None,
+            'window_start': self.window_start.strftime('%H:%M') if self.window_start else None,
+            'window_end': self.window_end.strftime('%H:%M') if self.window_end else None,
+            'duration': self.duration,
+            'appointment_type': self.appointment_type,
+            'priority': self.priority,
+            'auto_book': self.auto_book,
+            'status': self.status,
+            'offer': hold.to_dict() if hold else None,
+            'appointment_id': self.appointment_id,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
     
     def __repr__(self):
-        return f'<Appointment {self.appointment_id}: {self.patient.full_name if self.patient else "Unknown"} with {self.doctor.full_name if self.doctor else "Unknown"}>'
\ No newline at end of file
+        return f'<WaitlistEntry {self.id}: Patient {self.patient_id} ({self.status})>'
\ No newline at end of file
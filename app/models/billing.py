@@ -4,6 +4,10 @@ from app import db
 
 class Bill(db.Model):
     __tablename__ = 'bills'
+    __table_args__ = (
+        # Keyset pagination order
+        db.Index('ix_bills_created_at_id', 'created_at', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     bill_number = db.Column(db.String(20), unique=True, nullable=False, index=True)
@@ -13,10 +17,10 @@ class Bill(db.Model):
     # Bill Details
     bill_date = db.Column(db.Date, default=date.today)
     due_date = db.Column(db.Date, nullable=False)
-    total_amount = db.Column(db.Decimal(10, 2), nullable=False, default=0.0)
-    paid_amount = db.Column(db.Decimal(10, 2), default=0.0)
-    discount_amount = db.Column(db.Decimal(10, 2), default=0.0)
-    tax_amount = db.Column(db.Decimal(10, 2), default=0.0)
+    total_amount = db.Column(db.Numeric(10, 2), nullable=False, default=0.0)
+    paid_amount = db.Column(db.Numeric(10, 2), default=0.0)
+    discount_amount = db.Column(db.Numeric(10, 2), default=0.0)
+    tax_amount = db.Column(db.Numeric(10, 2), default=0.0)
     
     # Status and Notes
     status = db.Column(db.Enum('draft', 'pending', 'paid', 'partially_paid', 'overdue', 'cancelled', name='bill_status'), default='pending')
@@ -29,6 +33,8 @@ class Bill(db.Model):
     
     # Relationships
     bill_items = db.relationship('BillItem', backref='bill', lazy='dynamic', cascade='all, delete-orphan')
+    # Read-only list of the same rows, for eager loading (see services.loading); write through bill_items
+    items = db.relationship('BillItem', viewonly=True, order_by='BillItem.id')
     payments = db.relationship('Payment', backref='bill', lazy='dynamic', cascade='all, delete-orphan')
     appointment = db.relationship('Appointment', backref='bills')
     creator = db.relationship('User', backref='created_bills')
@@ -45,9 +51,8 @@ class Bill(db.Model):
     
     def generate_bill_number(self):
         """Generate unique bill number."""
-        date_str = date.today().strftime('%Y%m%d')
-        timestamp = datetime.now().strftime('%H%M%S')
-        return f'BILL{date_str}{timestamp}'
+        from app.services.ids import allocate_id
+        return allocate_id('BILL')
     
     @property
     def outstanding_amount(self):
@@ -142,7 +147,7 @@ class Bill(db.Model):
             'status': self.status,
             'is_overdue': self.is_overdue,
             'payment_percentage': self.payment_percentage,
-            'items': [item.to_dict() for item in self.bill_items]
+            'items': [item.to_dict() for item in self.items]
         }
     
     def __repr__(self):
@@ -156,8 +161,8 @@ class BillItem(db.Model):
     description = db.Column(db.String(200), nullable=False)
     service_type = db.Column(db.Enum('consultation', 'procedure', 'medication', 'lab_test', 'imaging', 'room_charge', 'other', name='service_types'), nullable=False)
     quantity = db.Column(db.Integer, default=1)
-    unit_price = db.Column(db.Decimal(10, 2), nullable=False)
-    total_price = db.Column(db.Decimal(10, 2))
+    unit_price = db.Column(db.Numeric(10, 2), nullable=False)
+    total_price = db.Column(db.Numeric(10, 2))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     def __init__(self, bill_id, description, quantity, unit_price, service_type='consultation'):
@@ -184,11 +189,17 @@ class BillItem(db.Model):
 
 class Payment(db.Model):
     __tablename__ = 'payments'
+    __table_args__ = (
+        # Keyset pagination order
+        db.Index('ix_payments_created_at_id', 'created_at', 'id'),
+        # Revenue series: range scan on date, sums read from the index
+        db.Index('ix_payments_payment_date_amount', 'payment_date', 'amount'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     payment_id = db.Column(db.String(20), unique=True, nullable=False, index=True)
     bill_id = db.Column(db.Integer, db.ForeignKey('bills.id'), nullable=False)
-    amount = db.Column(db.Decimal(10, 2), nullable=False)
+    amount = db.Column(db.Numeric(10, 2), nullable=False)
     payment_date = db.Column(db.Date, default=date.today)
     payment_method = db.Column(db.Enum('cash', 'card', 'bank_transfer', 'insurance', 'cheque', name='payment_methods'), nullable=False)
     reference_number = db.Column(db.String(50))
@@ -213,9 +224,8 @@ class Payment(db.Model):
     
     def generate_payment_id(self):
         """Generate unique payment ID."""
-        date_str = date.today().strftime('%Y%m%d')
-        timestamp = datetime.now().strftime('%H%M%S')
-        return f'PAY{date_str}{timestamp}'
+        from app.services.ids import allocate_id
+        return allocate_id('PAY')
     
     def refund(self, reason=None):
         """Refund the payment."""
@@ -0,0 +1,15 @@
+from datetime import datetime
+from app import db
+
+class DashboardCounter(db.Model):
+    """A dashboard figure kept up to date as records change."""
+    __tablename__ = 'dashboard_counters'
+    
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    # Day a "today" figure was counted for; NULL for figures that don't depend on the day
+    as_of = db.Column(db.Date)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<DashboardCounter {self.name}: {self.value}>'
\ No newline at end of file
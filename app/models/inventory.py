@@ -3,6 +3,10 @@ from app import db
 
 class InventoryItem(db.Model):
     __tablename__ = 'inventory_items'
+    __table_args__ = (
+        # Keyset pagination order
+        db.Index('ix_inventory_items_name_id', 'name', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     item_code = db.Column(db.String(20), unique=True, nullable=False, index=True)
@@ -17,8 +21,8 @@ class InventoryItem(db.Model):
     unit_of_measure = db.Column(db.String(20), default='pieces')
     
     # Pricing
-    unit_cost = db.Column(db.Decimal(10, 2), default=0.0)
-    selling_price = db.Column(db.Decimal(10, 2), default=0.0)
+    unit_cost = db.Column(db.Numeric(10, 2), default=0.0)
+    selling_price = db.Column(db.Numeric(10, 2), default=0.0)
     
     # Supplier Information
     supplier_name = db.Column(db.String(200))
@@ -64,9 +68,8 @@ class InventoryItem(db.Model):
             'Emergency': 'EMR'
         }
         
-        cat_code = category_codes.get(self.category, 'ITM')
-        timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-        return f'{cat_code}{timestamp}'
+        from app.services.ids import allocate_id
+        return allocate_id(category_codes.get(self.category, 'ITM'))
     
     @property
     def is_low_stock(self):
@@ -266,8 +269,8 @@ class ReorderRequest(db.Model):
     approved_date = db.Column(db.Date)
     
     # Cost
-    estimated_cost = db.Column(db.Decimal(10, 2))
-    actual_cost = db.Column(db.Decimal(10, 2))
+    estimated_cost = db.Column(db.Numeric(10, 2))
+    actual_cost = db.Column(db.Numeric(10, 2))
     
     # System fields
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -294,9 +297,8 @@ class ReorderRequest(db.Model):
     
     def generate_request_id(self):
         """Generate unique request ID."""
-        date_str = date.today().strftime('%Y%m%d')
-        timestamp = datetime.now().strftime('%H%M%S')
-        return f'REQ{date_str}{timestamp}'
+        from app.services.ids import allocate_id
+        return allocate_id('REQ')
     
     def approve(self, approved_quantity=None, approver_id=None):
         """Approve the reorder request."""
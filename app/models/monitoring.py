@@ -0,0 +1,41 @@
+from datetime import datetime
+from app import db
+
+class SlowQuery(db.Model):
+    """A statement that took longer than ``SLOW_QUERY_MS``, with its request's totals."""
+    __tablename__ = 'slow_queries'
+    __table_args__ = (
+        # Newest first, optionally per endpoint
+        db.Index('ix_slow_queries_recorded_at_id', 'recorded_at', 'id'),
+        db.Index('ix_slow_queries_endpoint_recorded_at', 'endpoint', 'recorded_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    recorded_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    endpoint = db.Column(db.String(100))
+    method = db.Column(db.String(10))
+    path = db.Column(db.String(255))
+    # Statement text only: bound values can carry patient details
+    statement = db.Column(db.Text, nullable=False)
+    duration_ms = db.Column(db.Float, nullable=False)
+    request_statements = db.Column(db.Integer)
+    request_db_ms = db.Column(db.Float)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    
+    def to_dict(self):
+        """Convert slow query entry to dictionary."""
+        return {
+            'id': self.id,
+            'recorded_at': self.recorded_at.isoformat() if self.recorded_at else None,
+            'endpoint': self.endpoint,
+            'method': self.method,
+            'path': self.path,
+            'statement': self.statement,
+            'duration_ms': self.duration_ms,
+            'request_statements': self.request_statements,
+            'request_db_ms': self.request_db_ms,
+            'user_id': self.user_id
+        }
+    
+    def __repr__(self):
+        return f'<SlowQuery {self.endpoint}: {self.duration_ms:.0f} ms>'
\ No newline at end of file
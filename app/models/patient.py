@@ -3,6 +3,14 @@ from app import db
 
 class Patient(db.Model):
     __tablename__ = 'patients'
+    __table_args__ = (
+        # Keyset pagination order
+        db.Index('ix_patients_created_at_id', 'created_at', 'id'),
+        # Patient picker order
+        db.Index('ix_patients_first_name_last_name_id', 'first_name', 'last_name', 'id'),
+        # Phone lookups and prefix searches (LIKE 'digits%' on PostgreSQL)
+        db.Index('ix_patients_phone_digits', 'phone_digits', postgresql_ops={'phone_digits': 'varchar_pattern_ops'}),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     patient_id = db.Column(db.String(20), unique=True, nullable=False, index=True)
@@ -17,6 +25,10 @@ class Patient(db.Model):
     emergency_contact_phone = db.Column(db.String(15))
     emergency_contact_relation = db.Column(db.String(50))
     
+    # Digits-only phone numbers, kept in sync by app.services.phone_numbers
+    phone_digits = db.Column(db.String(20))
+    emergency_contact_phone_digits = db.Column(db.String(20), index=True)
+    
     # Medical Information
     blood_group = db.Column(db.Enum('A+', 'A-', 'B+', 'B-', 'AB+', 'AB-', 'O+', 'O-', name='blood_groups'))
     allergies = db.Column(db.Text)
@@ -48,9 +60,8 @@ class Patient(db.Model):
     
     def generate_patient_id(self):
         """Generate unique patient ID."""
-        from datetime import datetime
-        timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-        return f'P{timestamp}'
+        from app.services.ids import allocate_id
+        return allocate_id('P')
     
     @property
     def full_name(self):
@@ -120,4 +131,15 @@ class MedicalRecord(db.Model):
     doctor = db.relationship('Staff', backref='medical_records')
     
     def __repr__(self):
-        return f'<MedicalRecord {self.id}: Patient {self.patient_id}>'
\ No newline at end of file
+        return f'<MedicalRecord {self.id}: Patient {self.patient_id}>'
+
+class PatientNameKey(db.Model):
+    __tablename__ = 'patient_name_keys'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    patient_id = db.Column(db.Integer, db.ForeignKey('patients.id', ondelete='CASCADE'), nullable=False, index=True)
+    name = db.Column(db.String(50), nullable=False)  # Lower-cased name token
+    phonetic_key = db.Column(db.String(20), nullable=False, index=True)
+    
+    def __repr__(self):
+        return f'<PatientNameKey {self.phonetic_key}: Patient {self.patient_id}>'
\ No newline at end of file
@@ -0,0 +1,11 @@
+from app import db
+
+class IdSequence(db.Model):
+    """Counter behind one family of record codes, e.g. ``APT``."""
+    __tablename__ = 'id_sequences'
+    
+    name = db.Column(db.String(20), primary_key=True)
+    next_value = db.Column(db.BigInteger, nullable=False, default=1)
+    
+    def __repr__(self):
+        return f'<IdSequence {self.name}: {self.next_value}>'
\ No newline at end of file
@@ -3,6 +3,10 @@ from app import db
 
 class Staff(db.Model):
     __tablename__ = 'staff'
+    __table_args__ = (
+        # Keyset pagination order
+        db.Index('ix_staff_created_at_id', 'created_at', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     staff_id = db.Column(db.String(20), unique=True, nullable=False, index=True)
@@ -15,6 +19,9 @@ class Staff(db.Model):
     email = db.Column(db.String(120), nullable=False)
     address = db.Column(db.Text)
     
+    # Digits-only phone number, kept in sync by app.services.phone_numbers
+    phone_digits = db.Column(db.String(20), index=True)
+    
     # Professional Information
     department = db.Column(db.String(100), nullable=False)
     specialization = db.Column(db.String(100))
@@ -24,9 +31,10 @@ class Staff(db.Model):
     
     # Employment Information
     hire_date = db.Column(db.Date, default=date.today)
-    salary = db.Column(db.Decimal(10, 2))
+    salary = db.Column(db.Numeric(10, 2))
     shift = db.Column(db.Enum('Morning', 'Evening', 'Night', 'Rotating', name='shift_types'), default='Morning')
     is_available = db.Column(db.Boolean, default=True)
+    booking_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Bumped on every booking change
     
     # System fields
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -68,9 +76,8 @@ class Staff(db.Model):
             'Pharmacy': 'PH'
         }
         
-        dept_code = department_codes.get(self.department, 'GN')
-        timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-        return f'{dept_code}{timestamp}'
+        from app.services.ids import allocate_id
+        return allocate_id(department_codes.get(self.department, 'GN'))
     
     @property
     def full_name(self):
@@ -104,17 +111,16 @@ class Staff(db.Model):
             StaffSchedule.work_date.between(week_start, week_end)
         ).order_by(StaffSchedule.work_date)
     
-    def is_available_at(self, appointment_date, appointment_time):
+    def is_available_at(self, appointment_date, appointment_time, duration=30):
         """Check if staff is available at given date and time."""
-        # Check if staff has conflicting appointments
-        existing_appointment = Appointment.query.filter(
-            Appointment.doctor_id == self.id,
-            Appointment.appointment_date == appointment_date,
-            Appointment.appointment_time == appointment_time,
-            Appointment.status != 'cancelled'
-        ).first()
+        from app.services.booking import find_conflicts, find_hold_conflicts
         
-        return existing_appointment is None and self.is_available
+        # Check if staff has overlapping appointments or holds
+        if find_conflicts(self.id, appointment_date, appointment_time, duration):
+            return False
+        if find_hold_conflicts(self.id, appointment_date, appointment_time, duration):
+            return False
+        return self.is_available
     
     def to_dict(self):
         """Convert staff to dictionary."""
@@ -138,6 +144,10 @@ class Staff(db.Model):
 
 class StaffSchedule(db.Model):
     __tablename__ = 'staff_schedules'
+    __table_args__ = (
+        # Weekly shift lookups per doctor
+        db.Index('ix_staff_schedules_staff_date', 'staff_id', 'work_date'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     staff_id = db.Column(db.Integer, db.ForeignKey('staff.id'), nullable=False)
@@ -0,0 +1,354 @@
+"""
+In-process prefix index for patient and staff autocomplete.
+
+Each kind of record keeps its lower-cased keys (first name, last name,
+"first last", "last first", record ID and phone digits) in sorted chunks
+with parallel arrays of row ids, so a prefix lookup is two bisects followed
+by a short forward scan, and adding a record shifts one chunk rather than
+every key. Labels are kept once per record and suggestions are returned as
+compact (id, label) pairs.
+
+The index is built from the database when the app starts (or on first use
+if the tables didn't exist yet) and then kept current from the
+``Patient``/``Staff`` mapper events; a session's changes are applied in one
+batch when it commits, so rolled back writes never show up. Each process
+has its own copy. A background thread rebuilds it every ``AUTOCOMPLETE_REFRESH_SECONDS`` to
+pick up writes made by other workers: new indexes are loaded off to the side,
+commits made meanwhile are replayed onto them, and they replace the old ones
+in one assignment, so lookups never wait for a rebuild.
+
+Memory grows with the number of keys, six per record, most of it the key
+strings themselves; ``benchmarks/autocomplete.py`` measures it together
+with lookup and commit times.
+"""
+
+import os
+import re
+import threading
+import time
+import weakref
+from array import array
+from bisect import bisect_left, bisect_right
+from flask import current_app
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, object_session
+from app import db
+from app.models.patient import Patient
+from app.models.staff import Staff
+
+_CHANGES_KEY = 'autocomplete_changes'
+# Keys per chunk of a PrefixIndex; chunks split when they grow past twice this
+CHUNK_SIZE = 1000
+_PHONE_QUERY = re.compile(r'[\d\s()+\-.]+')
+
+class PrefixIndex:
+    """Prefix index of labelled records over sorted chunks of keys.
+    
+    Keys are split into sorted chunks of ``CHUNK_SIZE`` to twice that, with a
+    parallel array of row ids per chunk and the last key of every chunk, so
+    adding or removing a key shifts one chunk instead of the whole index.
+    """
+    
+    def __init__(self):
+        self._chunks = []
+        self._chunk_ids = []
+        self._maxes = []
+        self._labels = {}
+        self._entry_keys = {}
+        self._lock = threading.Lock()
+    
+    def __len__(self):
+        return len(self._labels)
+    
+    def add(self, record_id, label, keys):
+        """Insert or replace a record."""
+        self.apply([(record_id, (record_id, label, keys))])
+    
+    def remove(self, record_id):
+        """Drop a record if present."""
+        self.apply([(record_id, None)])
+    
+    def apply(self, changes):
+        """Apply (record_id, entry) changes in one go; a None entry removes the record."""
+        changes = [
+            (record_id, None if entry is None else (entry[1], _sorted_keys(entry[2])))
+            for record_id, entry in changes
+        ]
+        with self._lock:
+            for record_id, entry in changes:
+                self._remove(record_id)
+                if entry is None:
+                    continue
+                label, keys = entry
+                for key in keys:
+                    self._insert(key, record_id)
+                self._labels[record_id] = label
+                self._entry_keys[record_id] = keys
+    
+    def _insert(self, key, record_id):
+        if not self._chunks:
+            self._chunks.append([key])
+            self._chunk_ids.append(array('l', [record_id]))
+            self._maxes.append(key)
+            return
+        chunk = min(bisect_left(self._maxes, key), len(self._maxes) - 1)
+        keys, ids = self._chunks[chunk], self._chunk_ids[chunk]
+        position = bisect_right(keys, key)
+        keys.insert(position, key)
+        ids.insert(position, record_id)
+        self._maxes[chunk] = keys[-1]
+        if len(keys) > 2 * CHUNK_SIZE:
+            self._chunks[chunk:chunk + 1] = [keys[:CHUNK_SIZE], keys[CHUNK_SIZE:]]
+            self._chunk_ids[chunk:chunk + 1] = [ids[:CHUNK_SIZE], ids[CHUNK_SIZE:]]
+            self._maxes[chunk:chunk + 1] = [keys[CHUNK_SIZE - 1], keys[-1]]
+    
+    def _delete(self, key, record_id):
+        # Equal keys can run on over several chunks
+        chunk = bisect_left(self._maxes, key)
+        while chunk < len(self._chunks):
+            keys, ids = self._chunks[chunk], self._chunk_ids[chunk]
+            position = bisect_left(keys, key)
+            while position < len(keys) and keys[position] == key:
+                if ids[position] == record_id:
+                    del keys[position]
+                    del ids[position]
+                    if keys:
+                        self._maxes[chunk] = keys[-1]
+                    else:
+                        del self._chunks[chunk], self._chunk_ids[chunk], self._maxes[chunk]
+                    return
+                position += 1
+            if position < len(keys):
+                return
+            chunk += 1
+    
+    def _remove(self, record_id):
+        for key in self._entry_keys.pop(record_id, ()):
+            self._delete(key, record_id)
+        self._labels.pop(record_id, None)
+    
+    def load(self, entries):
+        """Replace the whole index from (id, label, keys) tuples."""
+        pairs = []
+        labels = {}
+        entry_keys = {}
+        for record_id, label, keys in entries:
+            keys = _sorted_keys(keys)
+            labels[record_id] = label
+            entry_keys[record_id] = keys
+            pairs.extend((key, record_id) for key in keys)
+        pairs.sort()
+        chunks = [pairs[start:start + CHUNK_SIZE] for start in range(0, len(pairs), CHUNK_SIZE)]
+        
+        with self._lock:
+            self._chunks = [[key for key, _ in chunk] for chunk in chunks]
+            self._chunk_ids = [array('l', (record_id for _, record_id in chunk)) for chunk in chunks]
+            self._maxes = [chunk[-1][0] for chunk in chunks]
+            self._labels = labels
+            self._entry_keys = entry_keys
+    
+    def search(self, prefix, limit=10):
+        """Return up to ``limit`` (id, label) pairs whose keys start with prefix."""
+        results = []
+        seen = set()
+        with self._lock:
+            chunk = bisect_left(self._maxes, prefix)
+            position = bisect_left(self._chunks[chunk], prefix) if chunk < len(self._chunks) else 0
+            while chunk < len(self._chunks) and len(results) < limit:
+                keys, ids = self._chunks[chunk], self._chunk_ids[chunk]
+                while position < len(keys) and len(results) < limit:
+                    if not keys[position].startswith(prefix):
+                        return results
+                    record_id = ids[position]
+                    if record_id not in seen:
+                        seen.add(record_id)
+                        results.append((record_id, self._labels[record_id]))
+                    position += 1
+                chunk += 1
+                position = 0
+        return results
+
+def _sorted_keys(keys):
+    return tuple(sorted(set(key for key in keys if key)))
+
+def _digits(value):
+    return re.sub(r'\D', '', value or '')
+
+def _name_keys(first_name, last_name):
+    first = ' '.join((first_name or '').lower().split())
+    last = ' '.join((last_name or '').lower().split())
+    return [first, last, f'{first} {last}', f'{last} {first}']
+
+def _patient_entry(patient_id, first_name, last_name, code, phone):
+    label = f'{first_name} {last_name} ({code})'
+    keys = _name_keys(first_name, last_name) + [(code or '').lower(), _digits(phone)]
+    return patient_id, label, keys
+
+def _staff_entry(staff_id, first_name, last_name, code, phone, department):
+    label = f'{first_name} {last_name} - {department}'
+    keys = _name_keys(first_name, last_name) + [(code or '').lower(), _digits(phone)]
+    return staff_id, label, keys
+
+_SOURCES = {
+    'patient': (
+        Patient,
+        (Patient.id, Patient.first_name, Patient.last_name, Patient.patient_id, Patient.phone),
+        _patient_entry
+    ),
+    'staff': (
+        Staff,
+        (Staff.id, Staff.first_name, Staff.last_name, Staff.staff_id, Staff.phone, Staff.department),
+        _staff_entry
+    ),
+}
+
+class _EngineIndexes:
+    def __init__(self):
+        self.indexes = None
+        # Commits made while a rebuild runs, replayed onto its result
+        self.pending = None
+        self.refresher_pid = None
+        self.lock = threading.Lock()
+        self.build_lock = threading.Lock()
+
+# Indexes per engine, so separate apps (and test databases) never mix
+_registry = weakref.WeakKeyDictionary()
+
+def _state():
+    engine = db.engine
+    state = _registry.get(engine)
+    if state is None:
+        state = _registry.setdefault(engine, _EngineIndexes())
+    return state
+
+def _build():
+    """New indexes loaded from the database."""
+    indexes = {kind: PrefixIndex() for kind in _SOURCES}
+    for kind, (model, columns, make_entry) in _SOURCES.items():
+        rows = db.session.query(*columns).filter(model.is_active == True).yield_per(5000)
+        indexes[kind].load(make_entry(*row) for row in rows)
+    return indexes
+
+def _apply(indexes, changes):
+    """Apply (kind, record_id, entry) changes, one batch per index."""
+    by_kind = {}
+    for kind, record_id, entry in changes:
+        by_kind.setdefault(kind, []).append((record_id, entry))
+    for kind, kind_changes in by_kind.items():
+        indexes[kind].apply(kind_changes)
+
+def _rebuild(state, if_missing=False):
+    """Build new indexes off to the side and swap them in; lookups never wait on it."""
+    with state.build_lock:
+        if if_missing and state.indexes is not None:
+            return
+        with state.lock:
+            state.pending = []
+        try:
+            indexes = _build()
+        except Exception:
+            with state.lock:
+                state.pending = None
+            raise
+        with state.lock:
+            _apply(indexes, state.pending)
+            state.pending = None
+            state.indexes = indexes
+
+def _refresh(app, state):
+    while True:
+        time.sleep(app.config['AUTOCOMPLETE_REFRESH_SECONDS'])
+        try:
+            with app.app_context():
+                _rebuild(state)
+        except Exception:
+            app.logger.exception('Refreshing the autocomplete index failed')
+
+def _start_refresher(state):
+    # Threads don't survive a fork, so each worker process starts its own
+    with state.lock:
+        if state.refresher_pid == os.getpid():
+            return
+        state.refresher_pid = os.getpid()
+    app = current_app._get_current_object()
+    threading.Thread(target=_refresh, args=(app, state), name='autocomplete-refresh', daemon=True).start()
+
+def _indexes():
+    state = _state()
+    if state.indexes is None:
+        # Not built at startup, e.g. because the tables didn't exist yet
+        _rebuild(state, if_missing=True)
+    _start_refresher(state)
+    return state.indexes
+
+def normalize_query(term):
+    """Lower-case a query; phone-looking queries are reduced to digits."""
+    term = ' '.join((term or '').lower().split())
+    if _PHONE_QUERY.fullmatch(term) and any(char.isdigit() for char in term):
+        return _digits(term)
+    return term
+
+def suggest(kind, term, limit=10):
+    """Return (id, label) suggestions for a patient or staff prefix."""
+    if kind not in _SOURCES:
+        raise ValueError(f'Unknown autocomplete kind: {kind}')
+    prefix = normalize_query(term)
+    if not prefix:
+        return []
+    return _indexes()[kind].search(prefix, limit)
+
+def _stage(connection, target, kind, entry):
+    session = object_session(target)
+    if session is None:
+        return
+    engine = connection.engine
+    session.info.setdefault(_CHANGES_KEY, {})[(engine, kind, target.id)] = entry
+
+def _entry_for(kind, target):
+    if not target.is_active:
+        return None
+    _, columns, make_entry = _SOURCES[kind]
+    return make_entry(*(getattr(target, column.key) for column in columns))
+
+def _listen(kind, model):
+    def stage_saved(mapper, connection, target):
+        _stage(connection, target, kind, _entry_for(kind, target))
+    
+    def stage_deleted(mapper, connection, target):
+        _stage(connection, target, kind, None)
+    
+    event.listen(model, 'after_insert', stage_saved)
+    event.listen(model, 'after_update', stage_saved)
+    event.listen(model, 'after_delete', stage_deleted)
+
+for _kind, (_model, _, _) in _SOURCES.items():
+    _listen(_kind, _model)
+
+@event.listens_for(Session, 'after_commit')
+def _apply_changes(session):
+    changes = session.info.pop(_CHANGES_KEY, None)
+    if not changes:
+        return
+    by_engine = {}
+    for (engine, kind, record_id), entry in changes.items():
+        by_engine.setdefault(engine, []).append((kind, record_id, entry))
+    for engine, engine_changes in by_engine.items():
+        state = _registry.get(engine)
+        if state is None:
+            continue
+        with state.lock:
+            indexes = state.indexes
+            if state.pending is not None:
+                state.pending.extend(engine_changes)
+        if indexes is not None:
+            _apply(indexes, engine_changes)
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_changes(session):
+    session.info.pop(_CHANGES_KEY, None)
+
+def init_app(app):
+    """Build the indexes at startup; each worker refreshes them in the background."""
+    with app.app_context():
+        if inspect(db.engine).has_table(Patient.__tablename__):
+            _rebuild(_state())
\ No newline at end of file
@@ -0,0 +1,345 @@
+"""
+Appointment booking and conflict detection.
+
+A booking conflicts with any non-cancelled appointment of the same doctor
+whose ``[time, time + duration)`` overlaps its own, including appointments
+from the previous day that run past midnight. The probe is a single range
+query on the ``(doctor_id, appointment_date, appointment_time)`` index.
+
+Concurrent bookings for the same doctor are serialized by an optimistic
+version check on the doctor's staff row: a writer reads ``booking_version``
+and claims the doctor with ``UPDATE ... SET booking_version = v + 1 WHERE
+booking_version = v`` before probing, retrying with the new version when
+another writer got there first. The successful update also holds the row
+(or, on SQLite, the database) until commit, so the probe and the insert that
+follows can't interleave with another booking. PostgreSQL additionally
+enforces the rule with an exclusion constraint, so overlapping rows cannot be
+committed even by code that skips this module.
+
+A slot can be held for ``SLOT_HOLD_SECONDS`` while the booking form is
+filled in: ``hold_slot`` reserves it under a token, ``confirm_hold`` turns the
+hold into an appointment and ``release_hold`` gives it up. Active holds block
+other bookings like appointments do; expired ones are ignored and removed in
+bulk by ``flask sweep-holds``. ``flask hold-stress`` fires concurrent holds
+at one slot to check that exactly one of them wins.
+"""
+
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+import click
+from flask import current_app
+from sqlalchemy import DDL, event
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models.appointment import Appointment, SlotHold
+from app.models.staff import Staff
+from app.services.scheduling import FREE_STATUSES, MINUTES_PER_DAY, from_minutes, to_minutes
+
+EXCLUSION_CONSTRAINT = 'ex_appointments_doctor_overlap'
+
+_exclusion_ddl = [
+    DDL('CREATE EXTENSION IF NOT EXISTS btree_gist'),
+    DDL(
+        f'ALTER TABLE appointments ADD CONSTRAINT {EXCLUSION_CONSTRAINT} '
+        'EXCLUDE USING gist ('
+        'doctor_id WITH =, '
+        "tsrange(appointment_date + appointment_time, "
+        "appointment_date + appointment_time + COALESCE(duration, 30) * interval '1 minute') WITH &&"
+        ") WHERE (status <> 'cancelled')"
+    ),
+]
+
+for _ddl in _exclusion_ddl:
+    event.listen(Appointment.__table__, 'after_create', _ddl.execute_if(dialect='postgresql'))
+
+class BookingConflict(ValueError):
+    """Raised when a booking overlaps an existing appointment."""
+    
+    def __init__(self, message, conflicts=()):
+        super().__init__(message)
+        self.conflicts = list(conflicts)
+
+class HoldExpired(ValueError):
+    """Raised when a slot hold is unknown or has lapsed."""
+
+def _overlapping(rows, appointment_date, start, end):
+    """Rows from the given day or the day before overlapping [start, end)."""
+    previous_day = appointment_date - timedelta(days=1)
+    overlapping = []
+    for row in rows:
+        other_start = to_minutes(row.appointment_time)
+        if row.appointment_date == previous_day:
+            other_start -= MINUTES_PER_DAY
+        other_end = other_start + (row.duration or 30)
+        if other_start < end and start < other_end:
+            overlapping.append(row)
+    return overlapping
+
+def find_conflicts(doctor_id, appointment_date, appointment_time, duration=30, exclude_id=None):
+    """Non-cancelled appointments of the doctor overlapping the given time."""
+    start = to_minutes(appointment_time)
+    end = start + (duration or 30)
+    previous_day = appointment_date - timedelta(days=1)
+    
+    query = Appointment.query.filter(
+        Appointment.doctor_id == doctor_id,
+        Appointment.appointment_date.in_([previous_day, appointment_date]),
+        Appointment.status.notin_(FREE_STATUSES)
+    )
+    if end < MINUTES_PER_DAY:
+        # Same-day appointments starting after the new one ends can't overlap
+        query = query.filter(db.or_(
+            Appointment.appointment_date == previous_day,
+            Appointment.appointment_time < from_minutes(end)
+        ))
+    if exclude_id is not None:
+        query = query.filter(Appointment.id != exclude_id)
+    
+    return _overlapping(query.all(), appointment_date, start, end)
+
+def find_hold_conflicts(doctor_id, appointment_date, appointment_time, duration=30, exclude_token=None):
+    """Active holds on the doctor overlapping the given time."""
+    start = to_minutes(appointment_time)
+    end = start + (duration or 30)
+    previous_day = appointment_date - timedelta(days=1)
+    
+    query = SlotHold.query.filter(
+        SlotHold.doctor_id == doctor_id,
+        SlotHold.appointment_date.in_([previous_day, appointment_date]),
+        SlotHold.expires_at > datetime.utcnow()
+    )
+    if exclude_token is not None:
+        query = query.filter(SlotHold.hold_token != exclude_token)
+    return _overlapping(query.all(), appointment_date, start, end)
+
+def claim_doctor(doctor_id):
+    """Bump the doctor's booking version, holding their row until commit.
+    
+    Raises BookingConflict if the doctor doesn't exist or other writers keep
+    winning for ``BOOKING_RETRY_LIMIT`` attempts.
+    """
+    table = Staff.__table__
+    for _ in range(current_app.config['BOOKING_RETRY_LIMIT']):
+        version = db.session.execute(
+            db.select(table.c.booking_version).where(table.c.id == doctor_id)
+        ).scalar()
+        if version is None:
+            raise BookingConflict('Doctor not found.')
+        claimed = db.session.execute(
+            table.update()
+            .where(table.c.id == doctor_id, table.c.booking_version == version)
+            # Leave updated_at alone; a booking doesn't change the staff record
+            .values(booking_version=version + 1, updated_at=table.c.updated_at)
+        ).rowcount
+        if claimed:
+            return version + 1
+    raise BookingConflict('Doctor is busy with other bookings; please try again.')
+
+def check_available(doctor_id, appointment_date, appointment_time, duration=30, exclude_id=None, exclude_token=None):
+    """Claim the doctor and raise BookingConflict if the time overlaps another booking or hold."""
+    claim_doctor(doctor_id)
+    conflicts = find_conflicts(doctor_id, appointment_date, appointment_time, duration, exclude_id)
+    if conflicts:
+        raise BookingConflict('Doctor is not available at the selected time.', conflicts)
+    if find_hold_conflicts(doctor_id, appointment_date, appointment_time, duration, exclude_token):
+        raise BookingConflict('The selected time is being held for another booking.')
+
+def _insert_appointment(**fields):
+    """Add and flush an appointment in a savepoint, so a rejected row undoes only itself."""
+    appointment = Appointment(**fields)
+    try:
+        with db.session.begin_nested():
+            db.session.add(appointment)
+    except IntegrityError as e:
+        if EXCLUSION_CONSTRAINT in str(e.orig):
+            raise BookingConflict('Doctor is not available at the selected time.') from e
+        raise
+    return appointment
+
+def create_appointment(patient_id, doctor_id, appointment_date, appointment_time, appointment_type, duration=30, hold_token=None, **kwargs):
+    """Add a conflict-checked appointment to the session; the caller commits.
+    
+    ``hold_token`` names a hold of the caller's that the booking may overlap.
+    If the database rejects the row as overlapping, BookingConflict is raised
+    and the rest of the caller's transaction is left as it was.
+    """
+    check_available(doctor_id, appointment_date, appointment_time, duration, exclude_token=hold_token)
+    return _insert_appointment(
+        patient_id=patient_id,
+        doctor_id=doctor_id,
+        appointment_date=appointment_date,
+        appointment_time=appointment_time,
+        appointment_type=appointment_type,
+        duration=duration,
+        **kwargs
+    )
+
+def place_hold(doctor_id, appointment_date, appointment_time, duration=30, patient_id=None, user_id=None, seconds=None):
+    """Add a conflict-checked SlotHold to the session; the caller commits."""
+    if seconds is None:
+        seconds = current_app.config['SLOT_HOLD_SECONDS']
+    check_available(doctor_id, appointment_date, appointment_time, duration)
+    hold = SlotHold(
+        hold_token=str(uuid.uuid4()),
+        doctor_id=doctor_id,
+        patient_id=patient_id,
+        appointment_date=appointment_date,
+        appointment_time=appointment_time,
+        duration=duration,
+        expires_at=datetime.utcnow() + timedelta(seconds=seconds),
+        created_by=user_id
+    )
+    db.session.add(hold)
+    db.session.flush()
+    return hold
+
+def hold_slot(doctor_id, appointment_date, appointment_time, duration=30, patient_id=None, user_id=None, seconds=None):
+    """Reserve a slot for a short while and commit; returns the SlotHold."""
+    try:
+        hold = place_hold(doctor_id, appointment_date, appointment_time, duration, patient_id, user_id, seconds)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return hold
+
+def get_active_hold(hold_token):
+    """Return the hold for a token, raising HoldExpired if it's gone or lapsed."""
+    hold = SlotHold.query.filter_by(hold_token=hold_token).first()
+    if hold is None or hold.is_expired:
+        raise HoldExpired('The slot hold has expired; please pick the time again.')
+    return hold
+
+def confirm_hold(hold_token, appointment_type, patient_id=None, **kwargs):
+    """Book the held slot and drop the hold; the caller commits.
+    
+    Raises HoldExpired or BookingConflict with nothing of the booking left in
+    the session.
+    """
+    hold = get_active_hold(hold_token)
+    patient_id = patient_id or hold.patient_id
+    if patient_id is None:
+        raise ValueError('A patient is required to confirm the booking.')
+    
+    check_available(hold.doctor_id, hold.appointment_date, hold.appointment_time, hold.duration, exclude_token=hold_token)
+    # Claimed first, so on SQLite the savepoint opens inside the transaction
+    with db.session.begin_nested():
+        # The hold may have lapsed or been swept since it was read
+        if not db.session.execute(
+            db.delete(SlotHold).where(SlotHold.id == hold.id, SlotHold.expires_at > datetime.utcnow())
+            .execution_options(synchronize_session='fetch')
+        ).rowcount:
+            raise HoldExpired('The slot hold has expired; please pick the time again.')
+        appointment = _insert_appointment(
+            patient_id=patient_id,
+            doctor_id=hold.doctor_id,
+            appointment_date=hold.appointment_date,
+            appointment_time=hold.appointment_time,
+            appointment_type=appointment_type,
+            duration=hold.duration,
+            **kwargs
+        )
+    return appointment
+
+def release_hold(hold_token):
+    """Give up a hold; returns whether one was removed."""
+    removed = db.session.execute(
+        db.delete(SlotHold).where(SlotHold.hold_token == hold_token)
+        .execution_options(synchronize_session='fetch')
+    ).rowcount
+    db.session.commit()
+    return bool(removed)
+
+def sweep_expired_holds():
+    """Delete every lapsed hold in one statement; returns how many went."""
+    removed = db.session.execute(
+        db.delete(SlotHold).where(SlotHold.expires_at <= datetime.utcnow())
+        .execution_options(synchronize_session='fetch')
+    ).rowcount
+    db.session.commit()
+    return removed
+
+def hold_stress(app, doctor_id, appointment_date, appointment_time, attempts=200, workers=20):
+    """Race ``attempts`` holds for one slot from ``workers`` threads.
+    
+    Returns counts of holds won, conflicts and other errors; a sound booking
+    path wins exactly once. The winning hold is released afterwards.
+    """
+    start = threading.Barrier(min(workers, attempts))
+    
+    def attempt(_):
+        with app.app_context():
+            try:
+                start.wait(timeout=5)
+            except threading.BrokenBarrierError:
+                pass
+            try:
+                return 'won', hold_slot(doctor_id, appointment_date, appointment_time, seconds=60).hold_token
+            except BookingConflict:
+                return 'conflict', None
+            except Exception as e:
+                return 'error', repr(e)
+            finally:
+                db.session.remove()
+    
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(attempt, range(attempts)))
+    
+    counts = {'won': 0, 'conflict': 0, 'error': 0}
+    errors = []
+    with app.app_context():
+        for outcome, detail in results:
+            counts[outcome] += 1
+            if outcome == 'won':
+                release_hold(detail)
+            elif outcome == 'error':
+                errors.append(detail)
+    return counts, errors
+
+def install_exclusion_constraint():
+    """Add the overlap exclusion constraint to an existing PostgreSQL database."""
+    connection = db.session.connection()
+    if connection.dialect.name != 'postgresql':
+        return False
+    exists = connection.execute(
+        db.text('SELECT 1 FROM pg_constraint WHERE conname = :name'),
+        {'name': EXCLUSION_CONSTRAINT}
+    ).scalar()
+    if not exists:
+        for ddl in _exclusion_ddl:
+            connection.execute(db.text(ddl.statement))
+    db.session.commit()
+    return True
+
+def init_app(app):
+    """Register the booking constraint and slot hold commands."""
+    @app.cli.command('booking-constraints')
+    def booking_constraints_command():
+        """Add the appointment overlap constraint on PostgreSQL."""
+        if install_exclusion_constraint():
+            print('Appointment overlap constraint is in place.')
+        else:
+            print('Overlap constraint is only used on PostgreSQL; nothing to do.')
+    
+    @app.cli.command('sweep-holds')
+    def sweep_holds_command():
+        """Delete expired slot holds."""
+        print(f'Removed {sweep_expired_holds()} expired slot holds.')
+    
+    @app.cli.command('hold-stress')
+    @click.argument('doctor_id', type=int)
+    @click.option('--attempts', default=200, help='Number of concurrent hold attempts.')
+    @click.option('--workers', default=20, help='Number of threads making them.')
+    def hold_stress_command(doctor_id, attempts, workers):
+        """Race concurrent holds for one far-future slot of a doctor."""
+        # Far enough ahead to stay clear of real bookings
+        slot_date = date.today() + timedelta(days=3650)
+        slot_time = from_minutes(3 * 60)
+        counts, errors = hold_stress(current_app._get_current_object(), doctor_id, slot_date, slot_time, attempts, workers)
+        print(f"{attempts} attempts: {counts['won']} won, {counts['conflict']} conflicts, {counts['error']} errors")
+        for error in errors[:5]:
+            print(f'  {error}')
+        if counts['won'] != 1:
+            raise click.ClickException('Expected exactly one hold to win.')
\ No newline at end of file
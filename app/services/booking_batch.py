@@ -0,0 +1,265 @@
+"""
+Bulk appointment changes.
+
+``apply_batch`` takes a list of create/move/cancel operations, claims every
+doctor involved, and loads all their appointments and active holds for the
+affected days with one query each. Operations are then checked in order
+against an in-memory timeline per doctor, where each entry spans
+``[start, end)`` in absolute minutes (day ordinal * 1440 + minute of day), so
+appointments running past midnight need no special handling. Accepted
+operations update the timeline as they go, so a batch can free a slot with
+one operation and fill it with the next.
+
+Everything is written in a single transaction. With ``atomic`` set the batch
+is all-or-nothing; otherwise rejected operations are skipped and the rest
+are applied. Either way each operation gets its own result.
+"""
+
+from bisect import bisect_left, insort
+from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models.appointment import Appointment, SlotHold
+from app.models.patient import Patient
+from app.models.staff import Staff
+from app.services.booking import EXCLUSION_CONSTRAINT, BookingConflict, claim_doctor
+from app.services.scheduling import FREE_STATUSES, MINUTES_PER_DAY, to_minutes
+
+OPERATIONS = ('create', 'move', 'cancel')
+
+class _Timeline:
+    """Sorted busy intervals of one doctor."""
+    
+    def __init__(self):
+        self.intervals = []
+        self.longest = 0
+    
+    def add(self, start, end, key):
+        insort(self.intervals, (start, end, key))
+        self.longest = max(self.longest, end - start)
+    
+    def remove(self, start, end, key):
+        position = bisect_left(self.intervals, (start, end, key))
+        if position < len(self.intervals) and self.intervals[position] == (start, end, key):
+            del self.intervals[position]
+    
+    def overlapping(self, start, end, ignore=None):
+        """Keys of intervals overlapping [start, end), ignoring one key."""
+        # Only intervals starting before end, and no earlier than the longest one allows, can overlap
+        position = bisect_left(self.intervals, (end,))
+        keys = []
+        while position > 0:
+            position -= 1
+            other_start, other_end, key = self.intervals[position]
+            if other_start <= start - self.longest:
+                break
+            if other_end > start and key != ignore:
+                keys.append(key)
+        return keys
+
+def _span(day, appointment_time, duration):
+    start = day.toordinal() * MINUTES_PER_DAY + to_minutes(appointment_time)
+    return start, start + (duration or 30)
+
+def _parse(operation):
+    """Validate one raw operation into a dict of typed fields; raises ValueError."""
+    if not isinstance(operation, dict):
+        raise ValueError('Operation must be an object')
+    kind = operation.get('op')
+    if kind not in OPERATIONS:
+        raise ValueError(f"Operation must be one of {', '.join(OPERATIONS)}")
+    
+    parsed = {'op': kind}
+    if kind in ('move', 'cancel'):
+        if not isinstance(operation.get('id'), int):
+            raise ValueError('Appointment id is required')
+        parsed['id'] = operation['id']
+    
+    for field in ('patient_id', 'doctor_id', 'duration'):
+        value = operation.get(field)
+        if value is not None and (not isinstance(value, int) or value <= 0):
+            raise ValueError(f'{field} must be a positive integer')
+        parsed[field] = value
+    try:
+        parsed['date'] = datetime.strptime(operation['date'], '%Y-%m-%d').date() if operation.get('date') else None
+        parsed['time'] = datetime.strptime(operation['time'], '%H:%M').time() if operation.get('time') else None
+    except (TypeError, ValueError):
+        raise ValueError('Invalid date or time format')
+    
+    if kind == 'create':
+        missing = [field for field in ('patient_id', 'doctor_id', 'date', 'time') if not parsed[field]]
+        if missing or not operation.get('appointment_type'):
+            raise ValueError('Patient, doctor, date, time and appointment type are required')
+        parsed['duration'] = parsed['duration'] or 30
+        parsed['appointment_type'] = operation['appointment_type']
+        parsed['reason_for_visit'] = operation.get('reason_for_visit', '')
+    elif kind == 'move' and not any(parsed[field] for field in ('doctor_id', 'date', 'time', 'duration')):
+        raise ValueError('A move needs a new doctor, date, time or duration')
+    return parsed
+
+def _pending(parsed, results, *kinds):
+    """Operations of the given kinds not yet rejected, as (index, item, result)."""
+    for index, (item, result) in enumerate(zip(parsed, results)):
+        if item and 'status' not in result and item['op'] in kinds:
+            yield index, item, result
+
+def apply_batch(operations, user_id=None, atomic=False):
+    """Apply create/move/cancel operations in one transaction.
+    
+    Returns ``(results, applied)``: one result dict per operation, in order,
+    and the number of operations written. Raises BookingConflict if the
+    database rejects the batch as overlapping.
+    """
+    results = []
+    parsed = []
+    for index, operation in enumerate(operations):
+        results.append({'index': index, 'op': operation.get('op') if isinstance(operation, dict) else None})
+        try:
+            parsed.append(_parse(operation))
+        except ValueError as e:
+            parsed.append(None)
+            results[index].update(status='error', error=str(e))
+    
+    # Appointments being moved or cancelled, in one query
+    target_ids = {item['id'] for item in parsed if item and item['op'] != 'create'}
+    targets = {}
+    if target_ids:
+        targets = {appointment.id: appointment for appointment in Appointment.query.filter(Appointment.id.in_(target_ids))}
+    for _, item, result in _pending(parsed, results, 'move', 'cancel'):
+        appointment = targets.get(item['id'])
+        if appointment is None:
+            result.update(status='error', error='Appointment not found')
+        elif not (appointment.can_be_rescheduled() if item['op'] == 'move' else appointment.can_be_cancelled()):
+            result.update(status='error', error=f'Appointment is {appointment.status}')
+    
+    # Moves keep whatever they don't change
+    for _, item, _ in _pending(parsed, results, 'move'):
+        current = targets[item['id']]
+        item['doctor_id'] = item['doctor_id'] or current.doctor_id
+        item['date'] = item['date'] or current.appointment_date
+        item['time'] = item['time'] or current.appointment_time
+        item['duration'] = item['duration'] or current.duration or 30
+    
+    doctor_ids = {item['doctor_id'] for _, item, _ in _pending(parsed, results, 'create', 'move')}
+    patient_ids = {item['patient_id'] for _, item, _ in _pending(parsed, results, 'create')}
+    known_doctors = set()
+    known_patients = set()
+    if doctor_ids:
+        known_doctors = {row[0] for row in db.session.query(Staff.id).filter(Staff.id.in_(doctor_ids))}
+    if patient_ids:
+        known_patients = {row[0] for row in db.session.query(Patient.id).filter(Patient.id.in_(patient_ids))}
+    for _, item, result in _pending(parsed, results, 'create', 'move'):
+        if item['doctor_id'] not in known_doctors:
+            result.update(status='error', error='Doctor not found')
+        elif item['op'] == 'create' and item['patient_id'] not in known_patients:
+            result.update(status='error', error='Patient not found')
+    
+    # Claim every doctor involved in a fixed order, then load their busy time for the affected days
+    doctor_ids = {item['doctor_id'] for _, item, _ in _pending(parsed, results, 'create', 'move')}
+    doctor_ids |= {targets[item['id']].doctor_id for _, item, _ in _pending(parsed, results, 'move', 'cancel')}
+    for doctor_id in sorted(doctor_ids):
+        claim_doctor(doctor_id)
+    
+    days = [item['date'] for _, item, _ in _pending(parsed, results, 'create', 'move')]
+    timelines = {doctor_id: _Timeline() for doctor_id in doctor_ids}
+    labels = {}
+    if days:
+        first_day, last_day = min(days) - timedelta(days=1), max(days)
+        appointments = db.session.query(
+            Appointment.id, Appointment.appointment_id, Appointment.doctor_id,
+            Appointment.appointment_date, Appointment.appointment_time, Appointment.duration
+        ).filter(
+            Appointment.doctor_id.in_(doctor_ids),
+            Appointment.appointment_date >= first_day,
+            Appointment.appointment_date <= last_day,
+            Appointment.status.notin_(FREE_STATUSES)
+        )
+        for row_id, code, doctor_id, day, start_time, duration in appointments:
+            labels[('appointment', row_id)] = code
+            timelines[doctor_id].add(*_span(day, start_time, duration), ('appointment', row_id))
+        holds = db.session.query(
+            SlotHold.hold_token, SlotHold.doctor_id,
+            SlotHold.appointment_date, SlotHold.appointment_time, SlotHold.duration
+        ).filter(
+            SlotHold.doctor_id.in_(doctor_ids),
+            SlotHold.appointment_date >= first_day,
+            SlotHold.appointment_date <= last_day,
+            SlotHold.expires_at > datetime.utcnow()
+        )
+        for token, doctor_id, day, start_time, duration in holds:
+            labels[('hold', token)] = 'slot hold'
+            timelines[doctor_id].add(*_span(day, start_time, duration), ('hold', token))
+    
+    # Check operations in order against the timelines, updating them as they're accepted;
+    # placed tracks where each touched appointment sits so far (None once cancelled)
+    placed = {}
+    accepted = []
+    for index, item, result in list(_pending(parsed, results, *OPERATIONS)):
+        key = ('appointment', item['id']) if item['op'] != 'create' else ('operation', index)
+        if item['op'] != 'create' and key not in placed:
+            current = targets[item['id']]
+            placed[key] = (current.doctor_id, *_span(current.appointment_date, current.appointment_time, current.duration))
+        if item['op'] != 'create' and placed[key] is None:
+            result.update(status='error', error='Appointment is cancelled')
+            continue
+        
+        if item['op'] != 'cancel':
+            start, end = _span(item['date'], item['time'], item['duration'])
+            conflicts = timelines[item['doctor_id']].overlapping(start, end, ignore=key)
+            if conflicts:
+                result.update(status='error', error='Doctor is not available at the selected time.',
+                              conflicts=sorted(labels[other] for other in conflicts))
+                continue
+        
+        if placed.get(key):
+            doctor_id, old_start, old_end = placed[key]
+            timelines[doctor_id].remove(old_start, old_end, key)
+        if item['op'] == 'cancel':
+            placed[key] = None
+        else:
+            placed[key] = (item['doctor_id'], start, end)
+            labels[key] = targets[item['id']].appointment_id if item['op'] == 'move' else f'operation {index}'
+            timelines[item['doctor_id']].add(start, end, key)
+        result['status'] = 'ok'
+        accepted.append((item, result))
+    
+    if atomic and len(accepted) < len(parsed):
+        db.session.rollback()
+        for _, result in accepted:
+            result['status'] = 'skipped'
+        return results, 0
+    
+    for item, result in accepted:
+        if item['op'] == 'create':
+            appointment = Appointment(
+                patient_id=item['patient_id'],
+                doctor_id=item['doctor_id'],
+                appointment_date=item['date'],
+                appointment_time=item['time'],
+                appointment_type=item['appointment_type'],
+                duration=item['duration'],
+                reason_for_visit=item['reason_for_visit'],
+                created_by=user_id
+            )
+            db.session.add(appointment)
+            # The code is assigned on creation; reading it after the commit would reload every row
+            result['appointment_id'] = appointment.appointment_id
+            continue
+        appointment = targets[item['id']]
+        if item['op'] == 'cancel':
+            appointment.status = 'cancelled'
+        else:
+            appointment.doctor_id = item['doctor_id']
+            appointment.appointment_date = item['date']
+            appointment.appointment_time = item['time']
+            appointment.duration = item['duration']
+        result['appointment_id'] = appointment.appointment_id
+    
+    try:
+        db.session.commit()
+    except IntegrityError as e:
+        db.session.rollback()
+        if EXCLUSION_CONSTRAINT in str(e.orig):
+            raise BookingConflict('Doctor is not available at the selected time.') from e
+        raise
+    return results, len(accepted)
\ No newline at end of file
@@ -0,0 +1,441 @@
+"""
+Shared cache for dashboard and report payloads.
+
+Every workstation polls the same dashboard figures, so payloads that don't
+depend on the user are computed once and cached under a key with the tables
+they read as tags. ``fetch`` serves an entry while it is fresh
+(``CACHE_TTL_SECONDS``). For ``CACHE_STALE_SECONDS`` after that, it still
+serves the stale value but recomputes it in a background thread, so a poller
+never waits. Entries are dropped as soon as a transaction that wrote one of
+their tables commits. Writes are noted from flushes and from DML run through
+the session, and ``invalidate_on_commit`` covers anything else, such as
+``bulk_save_objects``.
+
+Every invalidation also bumps a version per tag, kept in the backend next to
+the entries. A value is stored only if the versions of its tags are still
+the ones read before it was computed, so no worker stores a value computed
+across another worker's commit. The backend does the comparison and the
+write in one step.
+
+The store is picked with ``CACHE_BACKEND``:
+
+* ``memory``: an LRU dict per process (``CACHE_MAX_ENTRIES``). Other workers'
+  commits only reach it through the TTL.
+* ``sqlite``: a SQLite file at ``CACHE_URL`` shared by all workers on a host.
+* ``redis``: a Redis server (or anything speaking its protocol) at
+  ``CACHE_URL``; needs the ``redis`` package.
+
+Hits, stale hits, misses, revalidations and invalidations are counted per
+process (``stats``). ``tables_committed`` is sent after each invalidation for
+anything else that follows table changes.
+"""
+
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from blinker import Namespace
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+_TABLES_KEY = 'cache_invalidate_tables'
+
+# Versioned with the tags of every entry and bumped by ``clear``
+ALL_TAG = '*'
+
+# Sent with ``tables`` after a commit that wrote to them, once the cache has dropped their entries
+tables_committed = Namespace().signal('tables-committed')
+
+class MemoryBackend:
+    """LRU of entries in this process."""
+    
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._tags = {}
+        self._versions = {}
+        self._lock = threading.Lock()
+    
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[2] <= time.time():
+                self._discard(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[:3]
+    
+    def version(self, tags):
+        with self._lock:
+            return self._version(tags)
+    
+    def _version(self, tags):
+        return sum(self._versions.get(tag, 0) for tag in {ALL_TAG, *tags})
+    
+    def set(self, key, value, fresh_until, stale_until, tags, version):
+        with self._lock:
+            if self._version(tags) != version:
+                return
+            self._discard(key)
+            self._entries[key] = (value, fresh_until, stale_until, tuple(tags))
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._discard(next(iter(self._entries)))
+    
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            for tag in entry[3]:
+                keys = self._tags.get(tag)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del self._tags[tag]
+    
+    def invalidate(self, tags):
+        with self._lock:
+            for tag in set(tags):
+                self._versions[tag] = self._versions.get(tag, 0) + 1
+            keys = set().union(*(self._tags.get(tag, ()) for tag in tags))
+            for key in keys:
+                self._discard(key)
+            return len(keys)
+    
+    def clear(self):
+        with self._lock:
+            self._versions[ALL_TAG] = self._versions.get(ALL_TAG, 0) + 1
+            self._entries.clear()
+            self._tags.clear()
+    
+    def __len__(self):
+        return len(self._entries)
+
+class SQLiteBackend:
+    """Entries in a SQLite file shared by the workers of a host."""
+    
+    # Sets between purges of entries past their stale window
+    PURGE_INTERVAL = 100
+    
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._sets = 0
+        with self._connect() as connection:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS cache_entries '
+                '(key TEXT PRIMARY KEY, value BLOB NOT NULL, fresh_until REAL NOT NULL, stale_until REAL NOT NULL)'
+            )
+            connection.execute('CREATE TABLE IF NOT EXISTS cache_tags (tag TEXT NOT NULL, key TEXT NOT NULL, PRIMARY KEY (tag, key))')
+            connection.execute('CREATE TABLE IF NOT EXISTS cache_tag_versions (tag TEXT PRIMARY KEY, version INTEGER NOT NULL)')
+            connection.execute('CREATE INDEX IF NOT EXISTS ix_cache_entries_stale_until ON cache_entries (stale_until)')
+    
+    def _connect(self):
+        # sqlite3 connections can't be shared between threads; one per thread and process
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5)
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+    
+    def get(self, key):
+        row = self._connect().execute(
+            'SELECT value, fresh_until, stale_until FROM cache_entries WHERE key = ? AND stale_until > ?',
+            (key, time.time())
+        ).fetchone()
+        if row is None:
+            return None
+        return pickle.loads(row[0]), row[1], row[2]
+    
+    @staticmethod
+    def _version_sql(tags):
+        tags = sorted({ALL_TAG, *tags})
+        marks = ', '.join('?' * len(tags))
+        return f'SELECT COALESCE(SUM(version), 0) FROM cache_tag_versions WHERE tag IN ({marks})', tags
+    
+    def version(self, tags):
+        sql, parameters = self._version_sql(tags)
+        return self._connect().execute(sql, parameters).fetchone()[0]
+    
+    def set(self, key, value, fresh_until, stale_until, tags, version):
+        sql, parameters = self._version_sql(tags)
+        with self._connect() as connection:
+            # The write lock taken by the INSERT covers the version check
+            stored = connection.execute(
+                'INSERT OR REPLACE INTO cache_entries (key, value, fresh_until, stale_until) '
+                f'SELECT ?, ?, ?, ? WHERE ({sql}) = ?',
+                (key, pickle.dumps(value), fresh_until, stale_until, *parameters, version)
+            ).rowcount
+            if not stored:
+                return
+            connection.execute('DELETE FROM cache_tags WHERE key = ?', (key,))
+            connection.executemany('INSERT INTO cache_tags (tag, key) VALUES (?, ?)', [(tag, key) for tag in set(tags)])
+            self._sets += 1
+            if self._sets % self.PURGE_INTERVAL == 0:
+                connection.execute(
+                    'DELETE FROM cache_tags WHERE key IN (SELECT key FROM cache_entries WHERE stale_until <= ?)',
+                    (time.time(),)
+                )
+                connection.execute('DELETE FROM cache_entries WHERE stale_until <= ?', (time.time(),))
+    
+    def invalidate(self, tags):
+        tags = list(tags)
+        marks = ', '.join('?' * len(tags))
+        with self._connect() as connection:
+            self._bump(connection, tags)
+            removed = connection.execute(
+                f'DELETE FROM cache_entries WHERE key IN (SELECT key FROM cache_tags WHERE tag IN ({marks}))', tags
+            ).rowcount
+            connection.execute(f'DELETE FROM cache_tags WHERE tag IN ({marks})', tags)
+        return removed
+    
+    @staticmethod
+    def _bump(connection, tags):
+        connection.executemany(
+            'INSERT INTO cache_tag_versions (tag, version) VALUES (?, 1) '
+            'ON CONFLICT (tag) DO UPDATE SET version = version + 1',
+            [(tag,) for tag in sorted(set(tags))]
+        )
+    
+    def clear(self):
+        with self._connect() as connection:
+            self._bump(connection, [ALL_TAG])
+            connection.execute('DELETE FROM cache_entries')
+            connection.execute('DELETE FROM cache_tags')
+    
+    def __len__(self):
+        return self._connect().execute('SELECT COUNT(*) FROM cache_entries WHERE stale_until > ?', (time.time(),)).fetchone()[0]
+
+class RedisBackend:
+    """Entries in Redis, shared by every worker using the same server."""
+    
+    PREFIX = 'hms:cache:'
+    
+    def __init__(self, url):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError('CACHE_BACKEND=redis needs the redis package (pip install redis)') from e
+        self._client = redis.Redis.from_url(url)
+        self._watch_error = redis.WatchError
+    
+    def _version_key(self, tag):
+        return f'{self.PREFIX}version:{tag}'
+    
+    def _version_keys(self, tags):
+        return [self._version_key(tag) for tag in sorted({ALL_TAG, *tags})]
+    
+    def get(self, key):
+        raw = self._client.get(self.PREFIX + key)
+        return pickle.loads(raw) if raw is not None else None
+    
+    def version(self, tags):
+        return sum(int(value or 0) for value in self._client.mget(self._version_keys(tags)))
+    
+    def set(self, key, value, fresh_until, stale_until, tags, version):
+        expires_ms = max(int((stale_until - time.time()) * 1000), 1)
+        version_keys = self._version_keys(tags)
+        with self._client.pipeline() as pipeline:
+            try:
+                # The write is dropped if an invalidation bumps a version after the check
+                pipeline.watch(*version_keys)
+                if sum(int(value or 0) for value in pipeline.mget(version_keys)) != version:
+                    return
+                pipeline.multi()
+                pipeline.set(self.PREFIX + key, pickle.dumps((value, fresh_until, stale_until)), px=expires_ms)
+                for tag in set(tags):
+                    pipeline.sadd(f'{self.PREFIX}tag:{tag}', key)
+                pipeline.execute()
+            except self._watch_error:
+                pass
+    
+    def invalidate(self, tags):
+        pipeline = self._client.pipeline()
+        for tag in set(tags):
+            pipeline.incr(self._version_key(tag))
+        pipeline.execute()
+        removed = 0
+        for tag in set(tags):
+            tag_key = f'{self.PREFIX}tag:{tag}'
+            pipeline = self._client.pipeline()
+            pipeline.smembers(tag_key)
+            pipeline.delete(tag_key)
+            keys, _ = pipeline.execute()
+            if keys:
+                removed += self._client.delete(*[self.PREFIX + key.decode() for key in keys])
+        return removed
+    
+    def clear(self):
+        self._client.incr(self._version_key(ALL_TAG))
+        keys = [key for key in self._client.scan_iter(match=self.PREFIX + '*') if b':version:' not in key]
+        if keys:
+            self._client.delete(*keys)
+    
+    def __len__(self):
+        return sum(1 for key in self._client.scan_iter(match=self.PREFIX + '*') if b':tag:' not in key and b':version:' not in key)
+
+class Cache:
+    """Stale-while-revalidate cache over a backend."""
+    
+    COUNTERS = ('hits', 'stale_hits', 'misses', 'revalidations', 'invalidations')
+    
+    def __init__(self, backend, ttl, stale):
+        self.backend = backend
+        self.ttl = ttl
+        self.stale = stale
+        self._counts = dict.fromkeys(self.COUNTERS, 0)
+        self._refreshing = set()
+        self._lock = threading.Lock()
+    
+    def _count(self, counter):
+        with self._lock:
+            self._counts[counter] += 1
+    
+    def fetch(self, key, compute, tags=(), ttl=None, stale=None):
+        """Cached value of ``compute()`` under ``key``, invalidated by writes to ``tags`` tables.
+        
+        ``compute`` may run in a background thread (with an app context but no
+        request), so it must not depend on the current user or request.
+        """
+        ttl = self.ttl if ttl is None else ttl
+        stale = self.stale if stale is None else stale
+        entry = self.backend.get(key)
+        if entry is not None:
+            value, fresh_until, _ = entry
+            if fresh_until > time.time():
+                self._count('hits')
+            else:
+                self._count('stale_hits')
+                self._revalidate(key, compute, tags, ttl, stale)
+            return value
+        
+        self._count('misses')
+        version = self.backend.version(tags)
+        value = compute()
+        self._store(key, value, tags, ttl, stale, version)
+        return value
+    
+    def _store(self, key, value, tags, ttl, stale, version):
+        # Not stored if any of the tags was invalidated, by any worker, since ``version`` was read
+        now = time.time()
+        self.backend.set(key, value, now + ttl, now + ttl + stale, tags, version)
+    
+    def _revalidate(self, key, compute, tags, ttl, stale):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+        app = current_app._get_current_object()
+        version = self.backend.version(tags)
+        
+        def refresh():
+            try:
+                with app.app_context():
+                    self._store(key, compute(), tags, ttl, stale, version)
+                self._count('revalidations')
+            except Exception:
+                app.logger.exception('Cache revalidation failed for %s', key)
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+        
+        threading.Thread(target=refresh, name=f'cache-refresh-{key}', daemon=True).start()
+    
+    def invalidate(self, tags):
+        """Drop entries tagged with any of the tables."""
+        if not tags:
+            return 0
+        self._count('invalidations')
+        return self.backend.invalidate(tags)
+    
+    def clear(self):
+        self.backend.clear()
+    
+    def stats(self):
+        """Counters of this process plus the number of entries in the backend."""
+        with self._lock:
+            counts = dict(self._counts)
+        lookups = counts['hits'] + counts['stale_hits'] + counts['misses']
+        counts['hit_ratio'] = round((counts['hits'] + counts['stale_hits']) / lookups, 4) if lookups else None
+        counts['entries'] = len(self.backend)
+        counts['backend'] = type(self.backend).__name__
+        return counts
+
+def create_backend(config):
+    """Backend named by ``CACHE_BACKEND``; raises ValueError for an unknown one."""
+    name = config['CACHE_BACKEND']
+    if name == 'memory':
+        return MemoryBackend(config['CACHE_MAX_ENTRIES'])
+    if name == 'sqlite':
+        if config['CACHE_URL']:
+            return SQLiteBackend(config['CACHE_URL'])
+        os.makedirs(current_app.instance_path, exist_ok=True)
+        return SQLiteBackend(os.path.join(current_app.instance_path, 'cache.sqlite'))
+    if name == 'redis':
+        return RedisBackend(config['CACHE_URL'] or 'redis://localhost:6379/0')
+    raise ValueError(f'Unknown CACHE_BACKEND {name!r}; use memory, sqlite or redis')
+
+def get_cache():
+    """The current app's cache."""
+    return current_app.extensions['hms_cache']
+
+def fetch(key, compute, tags=(), ttl=None, stale=None):
+    """``Cache.fetch`` on the current app's cache."""
+    return get_cache().fetch(key, compute, tags, ttl, stale)
+
+def invalidate_on_commit(*tables):
+    """Invalidate entries tagged with the tables when the session commits."""
+    from app import db
+    db.session().info.setdefault(_TABLES_KEY, set()).update(tables)
+
+@event.listens_for(Session, 'after_flush')
+def _note_flushed_tables(session, flush_context):
+    tables = session.info.setdefault(_TABLES_KEY, set())
+    for target in list(session.new) + list(session.deleted):
+        tables.add(target.__table__.name)
+    for target in session.dirty:
+        if session.is_modified(target, include_collections=False):
+            tables.add(target.__table__.name)
+
+@event.listens_for(Session, 'do_orm_execute')
+def _note_statement_tables(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = getattr(orm_execute_state.statement, 'table', None)
+        if table is not None and getattr(table, 'name', None):
+            orm_execute_state.session.info.setdefault(_TABLES_KEY, set()).add(table.name)
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_committed_tables(session):
+    tables = session.info.pop(_TABLES_KEY, None)
+    if tables and has_app_context() and 'hms_cache' in current_app.extensions:
+        current_app.extensions['hms_cache'].invalidate(tables)
+        tables_committed.send(current_app._get_current_object(), tables=tables)
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_tables(session):
+    session.info.pop(_TABLES_KEY, None)
+
+def init_app(app):
+    """Create the app's cache and register its commands."""
+    with app.app_context():
+        backend = create_backend(app.config)
+    app.extensions['hms_cache'] = Cache(backend, app.config['CACHE_TTL_SECONDS'], app.config['CACHE_STALE_SECONDS'])
+    
+    @app.cli.command('cache-stats')
+    def cache_stats_command():
+        """Show cache counters for this process and the number of entries."""
+        for name, value in app.extensions['hms_cache'].stats().items():
+            print(f'{name}: {value}')
+    
+    @app.cli.command('cache-clear')
+    def cache_clear_command():
+        """Drop every cached payload."""
+        app.extensions['hms_cache'].clear()
+        print('Cache cleared.')
\ No newline at end of file
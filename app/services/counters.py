@@ -0,0 +1,335 @@
+"""
+Dashboard counters.
+
+The dashboards show the same handful of figures (active patients, today's
+appointments, pending and overdue bills, low stock, ...), and counting them
+on every page load scanned several large tables. Each figure is instead a row
+of ``dashboard_counters`` that mapper events keep current: every insert,
+update or delete of a counted model works out how it changes each figure it
+affects, and the changes of a flush are applied to the rows with one UPDATE
+in the same transaction, so they commit or roll back with the data. Reading
+the dashboards is then one primary-key lookup (``read``).
+
+Figures about "today" (appointments today, overdue bills, ...) are stored
+with the day they were counted for. Changes only apply to a row counted for
+the current day, and the first read of a new day (or of a missing row)
+recounts it, with all stale figures in one query (see ``stats``). The
+recount is only stored over rows no flush has touched since they were read,
+so a change committed meanwhile is never overwritten. Bulk SQL writes
+bypass the events, so ``flask counters-reconcile`` recounts everything and
+fixes any drift; schedule it to run periodically.
+"""
+
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from sqlalchemy import bindparam, event, inspect
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, object_session
+from app import db
+from app.models.appointment import Appointment
+from app.models.billing import Bill, Payment
+from app.models.dashboard import DashboardCounter
+from app.models.inventory import InventoryItem, ReorderRequest
+from app.models.patient import Patient
+from app.models.staff import Staff
+from app.services import cache, stats
+
+_DELTAS_KEY = 'dashboard_counter_deltas'
+_WROTE_KEY = 'dashboard_counter_session_wrote'
+
+OPEN_BILL_STATUSES = ('pending', 'partially_paid')
+
+# Statements a read adds when it recounts (the first read of a day): the
+# recount, the update and insert of its rows, and on SQLite the savepoint
+# around them
+RECOUNT_STATEMENTS = 5
+
+class Counter:
+    """One dashboard figure: a count (or sum of ``amount``) of ``model`` rows.
+    
+    ``where(day)`` gives the SQL criteria and ``matches(values, day)`` the
+    same test on a row's attribute values; ``daily`` figures depend on the day.
+    """
+    
+    def __init__(self, name, model, fields, where, matches, amount=None, daily=False):
+        self.name = name
+        self.model = model
+        self.fields = fields
+        self.where = where
+        self.matches = matches
+        self.amount = amount
+        self.daily = daily
+    
+    def metric(self, day):
+        """Aggregate recounting the figure for the day."""
+        criteria = self.where(day)
+        condition = db.and_(*criteria) if criteria else None
+        return stats.total(getattr(self.model, self.amount), condition) if self.amount else stats.count(condition)
+    
+    def contribution(self, values, day):
+        """What a row with these values adds to the figure."""
+        if values is None or not self.matches(values, day):
+            return 0
+        return (values[self.amount] or 0) if self.amount else 1
+
+def _created_on(column, day):
+    start = datetime.combine(day, time())
+    return [column >= start, column < start + timedelta(days=1)]
+
+def _is_on(value, day):
+    return value is not None and (value.date() if isinstance(value, datetime) else value) == day
+
+COUNTERS = [
+    Counter('patients_active', Patient, ['is_active'],
+            lambda day: [Patient.is_active == True],
+            lambda row, day: row['is_active']),
+    Counter('patients_new_today', Patient, ['created_at'],
+            lambda day: _created_on(Patient.created_at, day),
+            lambda row, day: _is_on(row['created_at'], day), daily=True),
+    Counter('staff_active', Staff, ['is_active'],
+            lambda day: [Staff.is_active == True],
+            lambda row, day: row['is_active']),
+    Counter('appointments_today', Appointment, ['appointment_date'],
+            lambda day: [Appointment.appointment_date == day],
+            lambda row, day: row['appointment_date'] == day, daily=True),
+    Counter('appointments_pending', Appointment, ['appointment_date', 'status'],
+            lambda day: [Appointment.appointment_date >= day, Appointment.status == 'scheduled'],
+            lambda row, day: row['status'] == 'scheduled' and row['appointment_date'] is not None and row['appointment_date'] >= day,
+            daily=True),
+    Counter('bills_total', Bill, [],
+            lambda day: [],
+            lambda row, day: True),
+    Counter('bills_pending', Bill, ['status'],
+            lambda day: [Bill.status.in_(OPEN_BILL_STATUSES)],
+            lambda row, day: row['status'] in OPEN_BILL_STATUSES),
+    Counter('bills_overdue', Bill, ['status', 'due_date'],
+            lambda day: [Bill.due_date < day, Bill.status.in_(OPEN_BILL_STATUSES)],
+            lambda row, day: row['status'] in OPEN_BILL_STATUSES and row['due_date'] is not None and row['due_date'] < day,
+            daily=True),
+    Counter('bills_paid_today', Bill, ['created_at', 'paid_amount'],
+            lambda day: _created_on(Bill.created_at, day),
+            lambda row, day: _is_on(row['created_at'], day), amount='paid_amount', daily=True),
+    Counter('payments_today', Payment, ['payment_date', 'amount'],
+            lambda day: [Payment.payment_date == day],
+            lambda row, day: _is_on(row['payment_date'], day), amount='amount', daily=True),
+    Counter('items_active', InventoryItem, ['is_active'],
+            lambda day: [InventoryItem.is_active == True],
+            lambda row, day: row['is_active']),
+    Counter('items_low_stock', InventoryItem, ['is_active', 'current_stock', 'minimum_stock'],
+            lambda day: [InventoryItem.current_stock <= InventoryItem.minimum_stock, InventoryItem.is_active == True],
+            lambda row, day: row['is_active'] and (row['current_stock'] or 0) <= (row['minimum_stock'] or 0)),
+    Counter('items_out_of_stock', InventoryItem, ['is_active', 'current_stock'],
+            lambda day: [InventoryItem.current_stock <= 0, InventoryItem.is_active == True],
+            lambda row, day: row['is_active'] and (row['current_stock'] or 0) <= 0),
+    Counter('reorders_pending', ReorderRequest, ['status'],
+            lambda day: [ReorderRequest.status == 'pending'],
+            lambda row, day: row['status'] == 'pending'),
+]
+
+COUNTERS_BY_NAME = {counter.name: counter for counter in COUNTERS}
+COUNTED_TABLES = tuple(sorted({counter.model.__tablename__ for counter in COUNTERS}))
+
+def _value(counter, value):
+    return (value or Decimal(0)) if counter.amount else int(value or 0)
+
+def recount(names, day=None):
+    """Current values of the named counters, counted in one query."""
+    day = day or date.today()
+    tables = {}
+    for name in names:
+        counter = COUNTERS_BY_NAME[name]
+        tables.setdefault(counter.model, {})[name] = counter.metric(day)
+    return {name: _value(COUNTERS_BY_NAME[name], value) for name, value in stats.aggregate(tables).items()}
+
+def _store(connection, values, day, seen):
+    """Write recounted values on the connection, creating missing rows.
+    
+    ``seen`` maps the names of rows that existed to the ``updated_at`` they
+    had when read. A row is only overwritten if it is unchanged since then:
+    any flush touching it meanwhile (even one whose change it didn't take,
+    see ``_apply_deltas``) may not be in the recount, so that row is left for
+    the next read to recount.
+    """
+    table = DashboardCounter.__table__
+    now = datetime.utcnow()
+    rows = [
+        {'counter': name, 'new_value': value, 'new_as_of': day if COUNTERS_BY_NAME[name].daily else None}
+        for name, value in sorted(values.items())
+    ]
+    updates = [dict(row, seen_at=seen[row['counter']]) for row in rows if row['counter'] in seen]
+    if updates:
+        connection.execute(
+            table.update()
+            .where(table.c.name == bindparam('counter'), table.c.updated_at == bindparam('seen_at'))
+            .values(value=bindparam('new_value'), as_of=bindparam('new_as_of'), updated_at=now),
+            updates
+        )
+    inserts = [
+        {'name': row['counter'], 'value': row['new_value'], 'as_of': row['new_as_of'], 'updated_at': now}
+        for row in rows if row['counter'] not in seen
+    ]
+    if inserts:
+        connection.execute(table.insert(), inserts)
+
+def _save_recount(values, day, seen):
+    """Keep recounted values without committing the caller's transaction.
+    
+    They are committed on a connection of their own, as id blocks are (see
+    ``ids``), unless the caller's transaction has already written: then the
+    recount includes its uncommitted rows and may wait on its locks (SQLite
+    has a single writer), so it goes into that transaction and is kept if
+    the caller commits.
+    """
+    try:
+        if db.session.info.get(_WROTE_KEY):
+            with db.session.begin_nested():
+                _store(db.session.connection(), values, day, seen)
+        else:
+            with db.engine.begin() as connection:
+                _store(connection, values, day, seen)
+    except IntegrityError:
+        # Another request created the rows first; its counts are as current
+        pass
+
+def read(*names):
+    """Counter values by name, recounting any that are missing or from another day."""
+    day = date.today()
+    names = names or tuple(COUNTERS_BY_NAME)
+    rows = db.session.execute(
+        db.select(DashboardCounter.name, DashboardCounter.value, DashboardCounter.as_of, DashboardCounter.updated_at)
+        .where(DashboardCounter.name.in_(names))
+    ).all()
+    values = {}
+    seen = {}
+    for name, value, as_of, updated_at in rows:
+        counter = COUNTERS_BY_NAME.get(name)
+        if counter is not None and (not counter.daily or as_of == day):
+            values[name] = _value(counter, value)
+        seen[name] = updated_at
+    
+    stale = [name for name in names if name not in values]
+    if stale:
+        recounted = recount(stale, day)
+        _save_recount(recounted, day, seen)
+        values.update(recounted)
+    return values
+
+def cached_values():
+    """All counter values through the payload cache, dropped when a counted table changes."""
+    return cache.fetch(f'dashboard_counters:{date.today()}', read, tags=COUNTED_TABLES)
+
+def reconcile():
+    """Recount every counter and fix drifted rows; returns {name: (stored, counted)} of fixes."""
+    day = date.today()
+    stored = {row.name: row for row in DashboardCounter.query}
+    counted = recount(list(COUNTERS_BY_NAME), day)
+    drifted = {}
+    for name, value in counted.items():
+        row = stored.get(name)
+        current = None if row is None else _value(COUNTERS_BY_NAME[name], row.value)
+        as_of = day if COUNTERS_BY_NAME[name].daily else None
+        if row is not None and current == value and row.as_of == as_of:
+            continue
+        drifted[name] = (current, value)
+    seen = {name: row.updated_at for name, row in stored.items()}
+    _store(db.session.connection(), {name: counted[name] for name in drifted}, day, seen)
+    db.session.commit()
+    return drifted
+
+def _values(target, fields, old=False):
+    """Attribute values of a row, before the pending change with ``old``."""
+    if not old:
+        return {field: getattr(target, field) for field in fields}
+    attrs = inspect(target).attrs
+    values = {}
+    for field in fields:
+        history = attrs[field].history
+        values[field] = history.deleted[0] if history.deleted else getattr(target, field)
+    return values
+
+def _stage(target, before, after):
+    session = object_session(target)
+    if session is None:
+        return
+    day = date.today()
+    deltas = session.info.setdefault(_DELTAS_KEY, {})
+    for counter in _COUNTERS_BY_MODEL[type(target)]:
+        delta = counter.contribution(after, day) - counter.contribution(before, day)
+        if delta:
+            deltas[counter.name] = deltas.get(counter.name, 0) + delta
+
+def _after_insert(mapper, connection, target):
+    _stage(target, None, _values(target, _FIELDS_BY_MODEL[type(target)]))
+
+def _after_update(mapper, connection, target):
+    fields = _FIELDS_BY_MODEL[type(target)]
+    attrs = inspect(target).attrs
+    if any(attrs[field].history.has_changes() for field in fields):
+        _stage(target, _values(target, fields, old=True), _values(target, fields))
+
+def _before_delete(mapper, connection, target):
+    _stage(target, _values(target, _FIELDS_BY_MODEL[type(target)], old=True), None)
+
+def _keep_previous_value(target, value, oldvalue, initiator):
+    return value
+
+_COUNTERS_BY_MODEL = {}
+for _counter in COUNTERS:
+    _COUNTERS_BY_MODEL.setdefault(_counter.model, []).append(_counter)
+_FIELDS_BY_MODEL = {
+    model: sorted({field for counter in counters for field in counter.fields})
+    for model, counters in _COUNTERS_BY_MODEL.items()
+}
+for _model, _fields in _FIELDS_BY_MODEL.items():
+    event.listen(_model, 'after_insert', _after_insert)
+    event.listen(_model, 'after_update', _after_update)
+    event.listen(_model, 'before_delete', _before_delete)
+    for _field in _fields:
+        # Load the old value when an expired attribute is set, so its change can be undone
+        event.listen(getattr(_model, _field), 'set', _keep_previous_value, active_history=True, retval=True)
+
+def _apply_deltas(session):
+    deltas = session.info.pop(_DELTAS_KEY, None)
+    if not deltas:
+        return
+    table = DashboardCounter.__table__
+    day = date.today()
+    # Every row is touched, so a recount racing with this flush sees it changed (see ``_store``)
+    session.connection().execute(
+        table.update()
+        .where(table.c.name == bindparam('counter'))
+        .values(
+            # "today" figures counted for another day are recounted on the next read instead
+            value=db.case(
+                (db.or_(table.c.as_of.is_(None), table.c.as_of == day), table.c.value + bindparam('delta')),
+                else_=table.c.value
+            ),
+            updated_at=datetime.utcnow()
+        ),
+        # In name order, so concurrent flushes lock the rows in the same order
+        [{'counter': name, 'delta': delta} for name, delta in sorted(deltas.items())]
+    )
+
+@event.listens_for(Session, 'after_flush')
+def _apply_flush_deltas(session, flush_context):
+    session.info[_WROTE_KEY] = True
+    _apply_deltas(session)
+
+@event.listens_for(Session, 'after_transaction_end')
+def _forget_writes(session, transaction):
+    if transaction.parent is None:
+        session.info.pop(_WROTE_KEY, None)
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_deltas(session, previous_transaction):
+    session.info.pop(_DELTAS_KEY, None)
+
+def init_app(app):
+    """Register the counter reconciliation command."""
+    @app.cli.command('counters-reconcile')
+    def counters_reconcile_command():
+        """Recount dashboard counters and fix any that drifted."""
+        drifted = reconcile()
+        for name, (stored, counted) in sorted(drifted.items()):
+            print(f'{name}: {stored} -> {counted}')
+        print(f'Reconciled {len(COUNTERS)} counters, {len(drifted)} fixed.')
\ No newline at end of file
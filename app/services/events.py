@@ -0,0 +1,212 @@
+"""
+Live dashboard figures and alerts for the ``/events`` stream.
+
+Workstations used to poll ``/notifications`` and ``/quick-stats``, each poll
+re-running the low stock, today's appointments and overdue bill queries. Now
+each worker process runs one feed thread. It rebuilds the role-independent
+snapshot (dashboard figures plus alert lists) when a commit touches a table
+the snapshot reads (``cache.tables_committed``), and otherwise every
+``EVENTS_SYNC_SECONDS``. The periodic rebuild also picks up other workers'
+commits and the change of day. The snapshot goes through the payload cache,
+so an unchanged part costs nothing and a shared cache backend computes it
+once for all workers. The feed hands the latest snapshot to every open
+stream, and each stream diffs it against what it has already sent to its
+user, so only changed figures and added or removed alerts go out. The
+database work therefore depends on how often data changes, not on how many
+workstations are connected.
+"""
+
+import queue
+import threading
+import time
+from datetime import date
+from flask import current_app
+from app import db
+from app.models.appointment import Appointment, WaitlistEntry
+from app.models.billing import Bill
+from app.models.inventory import InventoryItem
+from app.models.patient import Patient
+from app.models.staff import Staff
+from app.services import cache, counters
+
+# Alerts kept per kind (today's appointments: ALERTS_SHOWN per doctor);
+# streams show at most ALERTS_SHOWN of each
+ALERT_LIMIT = 200
+ALERTS_SHOWN = 5
+
+OPEN_BILL_STATUSES = ('pending', 'partially_paid')
+
+# Tables the snapshot reads; commits to anything else don't wake the feed
+WATCHED_TABLES = frozenset(counters.COUNTED_TABLES) | {'users', 'waitlist_entries'}
+
+def available_doctors():
+    """Active, available doctors, through the payload cache."""
+    return cache.fetch('available_doctors', lambda: Staff.query.filter(
+        Staff.is_active == True,
+        Staff.is_available == True,
+        Staff.user.has(role='doctor')
+    ).count(), tags=('staff', 'users'))
+
+def figures():
+    """Dashboard counter values plus the available doctor count."""
+    return dict(counters.cached_values(), available_doctors=available_doctors())
+
+def _low_stock():
+    rows = db.session.query(InventoryItem.id, InventoryItem.name, InventoryItem.current_stock).filter(
+        InventoryItem.current_stock <= InventoryItem.minimum_stock,
+        InventoryItem.is_active == True
+    ).order_by(InventoryItem.current_stock, InventoryItem.id).limit(ALERT_LIMIT)
+    return [{'id': item_id, 'name': name, 'current_stock': stock} for item_id, name, stock in rows]
+
+def _appointments_today(day):
+    """Today's first ALERTS_SHOWN appointments overall and of each doctor.
+    
+    Doctors only see their own, so one shared top-N would leave a doctor
+    whose patients come late in a busy day with none; both rankings are
+    taken in one statement instead.
+    """
+    ranked = db.select(
+        Appointment.id, Appointment.doctor_id, Appointment.appointment_time, Patient.first_name, Patient.last_name,
+        db.func.row_number().over(order_by=(Appointment.appointment_time, Appointment.id)).label('overall_rank'),
+        db.func.row_number().over(
+            partition_by=Appointment.doctor_id, order_by=(Appointment.appointment_time, Appointment.id)
+        ).label('doctor_rank')
+    ).join(Patient, Appointment.patient_id == Patient.id).where(
+        Appointment.appointment_date == day,
+        Appointment.status.in_(['scheduled', 'confirmed'])
+    ).subquery()
+    rows = db.session.execute(
+        db.select(ranked).where(db.or_(ranked.c.overall_rank <= ALERTS_SHOWN, ranked.c.doctor_rank <= ALERTS_SHOWN))
+        .order_by(ranked.c.appointment_time, ranked.c.id)
+    )
+    
+    appointments = {'all': [], 'by_doctor': {}}
+    for row_id, doctor_id, start, first, last, overall_rank, doctor_rank in rows:
+        appointment = {'id': row_id, 'time': start.strftime('%H:%M'), 'patient': f'{first} {last}'}
+        if overall_rank <= ALERTS_SHOWN:
+            appointments['all'].append(appointment)
+        if doctor_rank <= ALERTS_SHOWN:
+            appointments['by_doctor'].setdefault(doctor_id, []).append(appointment)
+    return appointments
+
+def _waitlist_offers():
+    rows = db.session.query(
+        WaitlistEntry.id, WaitlistEntry.offer_expires_at, Patient.first_name, Patient.last_name
+    ).join(Patient, WaitlistEntry.patient_id == Patient.id).filter(
+        WaitlistEntry.status == 'offered'
+    ).order_by(WaitlistEntry.offer_expires_at, WaitlistEntry.id).limit(ALERT_LIMIT)
+    return [
+        {'id': entry_id, 'expires': expires.strftime('%H:%M') if expires else None, 'patient': f'{first} {last}'}
+        for entry_id, expires, first, last in rows
+    ]
+
+def _overdue_bills(day):
+    rows = db.session.query(
+        Bill.id, Bill.bill_number, Patient.first_name, Patient.last_name
+    ).join(Patient, Bill.patient_id == Patient.id).filter(
+        Bill.due_date < day,
+        Bill.status.in_(OPEN_BILL_STATUSES)
+    ).order_by(Bill.due_date, Bill.id).limit(ALERT_LIMIT)
+    return [
+        {'id': bill_id, 'bill_number': number, 'patient': f'{first} {last}'}
+        for bill_id, number, first, last in rows
+    ]
+
+def alerts():
+    """Alert lists (low stock, today's appointments, waitlist offers, overdue bills)."""
+    day = date.today()
+    return {
+        'low_stock': cache.fetch('alerts:low_stock', _low_stock, tags=('inventory_items',)),
+        'appointments_today': cache.fetch(f'alerts:appointments:{day}', lambda: _appointments_today(day),
+                                          tags=('appointments', 'patients')),
+        'waitlist_offers': cache.fetch('alerts:waitlist_offers', _waitlist_offers, tags=('waitlist_entries', 'patients')),
+        'overdue_bills': cache.fetch(f'alerts:overdue_bills:{day}', lambda: _overdue_bills(day), tags=('bills', 'patients'))
+    }
+
+def snapshot():
+    """Everything a stream needs, independent of the user."""
+    return {'figures': figures(), 'alerts': alerts()}
+
+class Subscription:
+    """A stream's slot for the latest snapshot; older undelivered ones are dropped."""
+    
+    def __init__(self):
+        self._queue = queue.Queue(maxsize=1)
+    
+    def put(self, value):
+        try:
+            self._queue.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            self._queue.put_nowait(value)
+        except queue.Full:
+            # Another put won the race; its snapshot is as new
+            pass
+    
+    def get(self, timeout):
+        """Next snapshot, or None after ``timeout`` seconds without one."""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+class Feed:
+    """Rebuilds the snapshot on relevant commits and hands it to subscribers."""
+    
+    def __init__(self, app):
+        self.app = app
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._changed = threading.Event()
+        self._thread = None
+        self._latest = None
+        cache.tables_committed.connect(self._tables_committed, sender=app, weak=False)
+    
+    def _tables_committed(self, sender, tables=(), **kwargs):
+        if self._subscribers and WATCHED_TABLES.intersection(tables):
+            self._changed.set()
+    
+    def subscribe(self):
+        subscription = Subscription()
+        with self._lock:
+            self._subscribers.add(subscription)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='events-feed', daemon=True)
+                self._thread.start()
+        return subscription
+    
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+    
+    def _run(self):
+        config = self.app.config
+        while True:
+            self._changed.wait(config['EVENTS_SYNC_SECONDS'])
+            # Let a burst of commits settle into one rebuild
+            time.sleep(config['EVENTS_DEBOUNCE_SECONDS'])
+            self._changed.clear()
+            with self._lock:
+                subscribers = list(self._subscribers)
+            if not subscribers:
+                continue
+            try:
+                with self.app.app_context():
+                    current = snapshot()
+            except Exception:
+                self.app.logger.exception('Rebuilding the events snapshot failed')
+                continue
+            if current == self._latest:
+                continue
+            self._latest = current
+            for subscription in subscribers:
+                subscription.put(current)
+
+def get_feed():
+    """The current app's feed."""
+    return current_app.extensions['hms_events']
+
+def init_app(app):
+    """Create the app's feed; its thread starts with the first stream."""
+    app.extensions['hms_events'] = Feed(app)
\ No newline at end of file
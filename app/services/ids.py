@@ -0,0 +1,105 @@
+"""
+Readable, collision-free record codes.
+
+Codes keep their familiar shape of a prefix, a date and a number, e.g.
+``APT2026101700000042``, but the number now comes from a counter per prefix
+in the ``id_sequences`` table rather than from the clock, so records created
+in the same second no longer collide. Numbers are zero-padded to a fixed
+width, so codes with the same prefix sort by date and then by allocation
+order, and are two digits longer than the old clock-based codes so the two
+can never clash. The counter is not reset daily: an appointment code carries
+the appointment date, and a series books many dates at once.
+
+To avoid a database round trip per code, each process reserves
+``ID_BLOCK_SIZE`` numbers at a time with one UPDATE committed on its own
+connection and hands them out from memory; a block left unused when a
+process exits only leaves a gap. SQLite has a single writer, so a separate
+connection would wait on the caller's own transaction. There the block is
+reserved inside the caller's transaction instead, kept by that session, and
+dropped on any rollback (even to a savepoint), so a reservation that was
+rolled back is never handed out.
+"""
+
+import os
+import threading
+from datetime import date
+from weakref import WeakKeyDictionary
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app import db
+from app.models.sequence import IdSequence
+
+# Digits in the number part; a prefix of up to 4 letters still fits String(20)
+NUMBER_WIDTH = 8
+
+_BLOCKS_KEY = 'id_blocks'
+
+_lock = threading.Lock()
+# engine -> (pid, {sequence name: [next number, end of block]})
+_blocks = WeakKeyDictionary()
+
+def _reserve(connection, name, size):
+    """Advance a sequence by ``size`` on the connection; returns the first number reserved."""
+    table = IdSequence.__table__
+    updated = connection.execute(
+        table.update().where(table.c.name == name).values(next_value=table.c.next_value + size)
+    )
+    if updated.rowcount:
+        return connection.execute(db.select(table.c.next_value).where(table.c.name == name)).scalar_one() - size
+    connection.execute(table.insert().values(name=name, next_value=size + 1))
+    return 1
+
+def _take(block):
+    number = block[0]
+    block[0] += 1
+    return number
+
+def next_number(name):
+    """Next number of a sequence, reserving a new block when the current one runs out."""
+    from flask import current_app
+    size = max(current_app.config['ID_BLOCK_SIZE'], 1)
+    engine = db.engine
+    
+    if engine.dialect.name == 'sqlite':
+        blocks = db.session().info.setdefault(_BLOCKS_KEY, {})
+        block = blocks.get(name)
+        if block is None or block[0] >= block[1]:
+            first = _reserve(db.session.connection(), name, size)
+            block = blocks[name] = [first, first + size]
+        return _take(block)
+    
+    with _lock:
+        pid, blocks = _blocks.get(engine, (None, None))
+        if pid != os.getpid():
+            # A forked worker must not hand out its parent's numbers
+            blocks = {}
+            _blocks[engine] = (os.getpid(), blocks)
+        block = blocks.get(name)
+        if block is None or block[0] >= block[1]:
+            try:
+                with engine.begin() as connection:
+                    first = _reserve(connection, name, size)
+            except IntegrityError:
+                # Another process created the sequence first
+                with engine.begin() as connection:
+                    first = _reserve(connection, name, size)
+            block = blocks[name] = [first, first + size]
+        return _take(block)
+
+def allocate_id(prefix, day=None):
+    """A new code such as ``BILL2026101700000001`` for the prefix and day (today by default)."""
+    return f"{prefix}{(day or date.today()).strftime('%Y%m%d')}{next_number(prefix):0{NUMBER_WIDTH}d}"
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _drop_session_blocks(session, previous_transaction):
+    # Any rollback, even to a savepoint, may have undone a reservation
+    session.info.pop(_BLOCKS_KEY, None)
+
+def init_app(app):
+    """Register the sequence listing command."""
+    @app.cli.command('id-sequences')
+    def id_sequences_command():
+        """List record code sequences and their next numbers."""
+        for sequence in IdSequence.query.order_by(IdSequence.name):
+            print(f'{sequence.name}: {sequence.next_value}')
\ No newline at end of file
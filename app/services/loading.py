@@ -0,0 +1,85 @@
+"""
+Relationship loading policies for list views and serializers.
+
+Relationships load lazily, so a page of 20 appointments whose rows show the
+patient and doctor ran 41 queries. Each policy below declares what one kind
+of list reads and how to load it: many-to-one relationships (``patient``,
+``doctor``, ``item``, ...) are joined into the list query, collections
+(``Bill.items``) come with one extra ``IN`` query per page. Apply a policy to
+the list query and the page costs the same number of queries for 5 rows or
+500::
+    
+    bills = BILL_DICT.apply(Bill.query.filter(...))
+
+Serializer policies are strict: when ``EAGER_LOADING_STRICT`` is on
+(development and testing), any other relationship of the listed rows raises
+instead of loading, so a relationship added to a ``to_dict`` without its
+policy shows up at once rather than as one query per row in production.
+Options are built on use, as backref attributes only exist once the mappers
+are configured.
+"""
+
+from flask import current_app
+from sqlalchemy.orm import joinedload, raiseload, selectinload
+from app.models.appointment import Appointment, WaitlistEntry
+from app.models.billing import Bill, Payment
+from app.models.inventory import ReorderRequest, UsageRecord
+from app.models.patient import MedicalRecord
+from app.models.staff import Staff
+
+class Policy:
+    """Relationships of ``model`` to join (``joined``) or select-in (``selected``).
+    
+    Paths may be dotted (``'bill.patient'``) to load through a relationship.
+    """
+    
+    def __init__(self, model, joined=(), selected=(), strict=False):
+        self.model = model
+        self.joined = joined
+        self.selected = selected
+        self.strict = strict
+    
+    def _option(self, path, loader):
+        model = self.model
+        option = None
+        for name in path.split('.'):
+            attribute = getattr(model, name)
+            option = loader(attribute) if option is None else getattr(option, loader.__name__)(attribute)
+            model = attribute.property.mapper.class_
+        return option
+    
+    def options(self):
+        """Loader options for a query of ``model``."""
+        options = [self._option(path, joinedload) for path in self.joined]
+        options += [self._option(path, selectinload) for path in self.selected]
+        if self.strict and current_app.config['EAGER_LOADING_STRICT']:
+            # Only raise for loads that would need SQL; identity map hits are free
+            options.append(raiseload('*', sql_only=True))
+        return options
+    
+    def apply(self, query):
+        """The query with the policy's loader options."""
+        return query.options(*self.options())
+    
+    def load(self, objects):
+        """Load the relationships of objects fetched without the policy, in one query."""
+        ids = [obj.id for obj in objects]
+        if ids:
+            self.apply(self.model.query).filter(self.model.id.in_(ids)).all()
+        return objects
+
+# Serializers (``to_dict``)
+APPOINTMENT_DICT = Policy(Appointment, joined=('patient', 'doctor'), strict=True)
+BILL_DICT = Policy(Bill, joined=('patient',), selected=('items',), strict=True)
+WAITLIST_DICT = Policy(WaitlistEntry, joined=('patient', 'hold'), strict=True)
+USAGE_DICT = Policy(UsageRecord, joined=('item', 'user'), strict=True)
+REORDER_DICT = Policy(ReorderRequest, joined=('item',), strict=True)
+
+# Template rows
+APPOINTMENT_ROWS = Policy(Appointment, joined=('patient', 'doctor'))
+BILL_ROWS = Policy(Bill, joined=('patient',))
+PAYMENT_ROWS = Policy(Payment, joined=('bill.patient',))
+RECORD_ROWS = Policy(MedicalRecord, joined=('patient',))
+STAFF_ROWS = Policy(Staff, joined=('user',))
+USAGE_ROWS = Policy(UsageRecord, joined=('item', 'user'))
+REORDER_ROWS = Policy(ReorderRequest, joined=('item',))
\ No newline at end of file
@@ -0,0 +1,263 @@
+"""
+Typo-tolerant patient name matching.
+
+Every first/last name token of a patient is stored in ``patient_name_keys``
+together with its Metaphone key, so "Jon"/"John" and "Smyth"/"Smith" land on
+the same indexed key. A lookup reads the candidates for the query's keys from
+that index and ranks them with a bounded Damerau-Levenshtein distance; the
+patients table itself is never scanned. Keys of the query's one-letter
+deletions and swaps are looked up too, so typos such as "Smiht" or "Jhon"
+that change the key are still found. At most ``CANDIDATE_LIMIT`` index rows
+are read, exact names first, then exact keys, then typo variants.
+"""
+
+import re
+from sqlalchemy import event, inspect
+from app import db
+from app.models.patient import Patient, PatientNameKey
+
+# Upper bound on index rows read per lookup
+CANDIDATE_LIMIT = 2000
+
+_VOWELS = set('AEIOU')
+_FRONT_VOWELS = set('EIY')
+_SILENT_STARTS = ('AE', 'GN', 'KN', 'PN', 'WR')
+
+def phonetic_key(word):
+    """Compute the Metaphone key of a single word."""
+    word = re.sub(r'[^A-Z]', '', (word or '').upper())
+    if not word:
+        return ''
+    
+    if word[:2] in _SILENT_STARTS:
+        word = word[1:]
+    elif word[0] == 'X':
+        word = 'S' + word[1:]
+    elif word[:2] == 'WH':
+        word = 'W' + word[2:]
+    
+    length = len(word)
+    key = []
+    
+    def at(index):
+        return word[index] if 0 <= index < length else ''
+    
+    for i, char in enumerate(word):
+        if char == at(i - 1) and char != 'C':
+            continue
+        
+        prev, nxt, after = at(i - 1), at(i + 1), at(i + 2)
+        
+        if char in _VOWELS:
+            if i == 0:
+                key.append(char)
+        elif char == 'B':
+            if not (prev == 'M' and i == length - 1):
+                key.append('B')
+        elif char == 'C':
+            if nxt == 'I' and after == 'A':
+                key.append('X')
+            elif nxt == 'H':
+                key.append('K' if prev == 'S' else 'X')
+            elif nxt in _FRONT_VOWELS:
+                if prev != 'S':
+                    key.append('S')
+            else:
+                key.append('K')
+        elif char == 'D':
+            key.append('J' if nxt == 'G' and after in _FRONT_VOWELS else 'T')
+        elif char == 'G':
+            if nxt == 'H' and not (i + 2 >= length or after in _VOWELS):
+                continue
+            if nxt == 'N' and (i + 2 == length or word[i + 2:] == 'ED'):
+                continue
+            if prev == 'D' and nxt in _FRONT_VOWELS:
+                continue
+            key.append('J' if nxt in _FRONT_VOWELS and prev != 'G' else 'K')
+        elif char == 'H':
+            if prev in 'CGPST':
+                continue
+            if prev in _VOWELS and nxt not in _VOWELS:
+                continue
+            key.append('H')
+        elif char == 'K':
+            if prev != 'C':
+                key.append('K')
+        elif char == 'P':
+            key.append('F' if nxt == 'H' else 'P')
+        elif char == 'Q':
+            key.append('K')
+        elif char == 'S':
+            if nxt == 'H' or (nxt == 'I' and after in ('O', 'A')):
+                key.append('X')
+            else:
+                key.append('S')
+        elif char == 'T':
+            if nxt == 'I' and after in ('O', 'A'):
+                key.append('X')
+            elif nxt == 'H':
+                key.append('0')
+            elif not (nxt == 'C' and after == 'H'):
+                key.append('T')
+        elif char == 'V':
+            key.append('F')
+        elif char in 'WY':
+            if nxt in _VOWELS:
+                key.append(char)
+        elif char == 'X':
+            key.append('KS')
+        elif char == 'Z':
+            key.append('S')
+        else:
+            key.append(char)
+    
+    return ''.join(key)[:20]
+
+def edit_distance(a, b, max_distance):
+    """Optimal string alignment distance, or max_distance + 1 when exceeded."""
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    
+    previous_previous = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if (previous_previous is not None and i > 1 and j > 1
+                    and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]):
+                current[j] = min(current[j], previous_previous[j - 2] + 1)
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous_previous, previous = previous, current
+    
+    return previous[-1] if previous[-1] <= max_distance else max_distance + 1
+
+def max_distance_for(token):
+    """Allowed number of typos for a token of this length."""
+    return 1 if len(token) <= 4 else 2
+
+def name_tokens(*names):
+    """Split names into lower-cased word tokens."""
+    tokens = []
+    for name in names:
+        tokens.extend(token.lower() for token in re.findall(r'[^\W\d_]+', name or ''))
+    return tokens
+
+def lookup_keys(token):
+    """Phonetic keys of a token and of its single deletions and swaps."""
+    variants = {token}
+    for i in range(len(token)):
+        variants.add(token[:i] + token[i + 1:])
+        if i + 1 < len(token):
+            variants.add(token[:i] + token[i + 1] + token[i] + token[i + 2:])
+    return {phonetic_key(variant) for variant in variants} - {''}
+
+def _key_rows(patient):
+    rows = []
+    for token in set(name_tokens(patient.first_name, patient.last_name)):
+        key = phonetic_key(token)
+        if key:
+            rows.append({'patient_id': patient.id, 'name': token[:50], 'phonetic_key': key})
+    return rows
+
+def _write_keys(connection, patient):
+    table = PatientNameKey.__table__
+    connection.execute(table.delete().where(table.c.patient_id == patient.id))
+    rows = _key_rows(patient)
+    if rows:
+        connection.execute(table.insert(), rows)
+
+@event.listens_for(Patient, 'after_insert')
+def _index_inserted_names(mapper, connection, target):
+    _write_keys(connection, target)
+
+@event.listens_for(Patient, 'after_update')
+def _index_updated_names(mapper, connection, target):
+    state = inspect(target)
+    if state.attrs.first_name.history.has_changes() or state.attrs.last_name.history.has_changes():
+        _write_keys(connection, target)
+
+@event.listens_for(Patient, 'after_delete')
+def _unindex_deleted_names(mapper, connection, target):
+    table = PatientNameKey.__table__
+    connection.execute(table.delete().where(table.c.patient_id == target.id))
+
+def fuzzy_search(term, limit=10, active_only=True, exclude_ids=()):
+    """Find patients whose names sound like or nearly match the search term."""
+    tokens = name_tokens(term)
+    if not tokens:
+        return []
+    
+    keys = set()
+    for token in tokens:
+        keys |= lookup_keys(token)
+    if not keys:
+        return []
+    
+    # When the limit cuts candidates off, exact names and then exact keys
+    # are kept over rows that only match a typo variant
+    rank = db.case(
+        (PatientNameKey.name.in_(tokens), 0),
+        (PatientNameKey.phonetic_key.in_({phonetic_key(token) for token in tokens}), 1),
+        else_=2
+    )
+    candidates = db.session.query(
+        PatientNameKey.patient_id, PatientNameKey.name
+    ).filter(PatientNameKey.phonetic_key.in_(keys)).order_by(rank, PatientNameKey.patient_id).limit(CANDIDATE_LIMIT).all()
+    
+    names_by_patient = {}
+    for patient_id, name in candidates:
+        if patient_id not in exclude_ids:
+            names_by_patient.setdefault(patient_id, []).append(name)
+    
+    # Every query token must match one of the patient's names; a phonetic
+    # match with a larger edit distance still counts, but ranks lower
+    scores = {}
+    for patient_id, names in names_by_patient.items():
+        total = 0
+        for token in tokens:
+            bound = max_distance_for(token)
+            token_key = phonetic_key(token)
+            best = None
+            for name in names:
+                distance = edit_distance(token, name, bound)
+                if distance > bound and phonetic_key(name) == token_key:
+                    distance = bound + 1
+                elif distance > bound:
+                    continue
+                best = distance if best is None else min(best, distance)
+            if best is None:
+                break
+            total += best
+        else:
+            scores[patient_id] = total
+    
+    if not scores:
+        return []
+    
+    ranked_ids = sorted(scores, key=lambda patient_id: (scores[patient_id], patient_id))
+    query = Patient.query.filter(Patient.id.in_(ranked_ids[:limit * 5]))
+    if active_only:
+        query = query.filter(Patient.is_active == True)
+    patients = {patient.id: patient for patient in query.all()}
+    
+    return [patients[patient_id] for patient_id in ranked_ids if patient_id in patients][:limit]
+
+def rebuild_name_keys():
+    """Recompute the phonetic keys of every patient."""
+    connection = db.session.connection()
+    PatientNameKey.__table__.create(bind=connection, checkfirst=True)
+    connection.execute(PatientNameKey.__table__.delete())
+    
+    batch = []
+    for patient in Patient.query.order_by(Patient.id).yield_per(1000):
+        batch.extend(_key_rows(patient))
+        if len(batch) >= 5000:
+            connection.execute(PatientNameKey.__table__.insert(), batch)
+            batch = []
+    if batch:
+        connection.execute(PatientNameKey.__table__.insert(), batch)
+    
+    db.session.commit()
\ No newline at end of file
@@ -0,0 +1,194 @@
+"""
+Keyset (cursor) pagination.
+
+Instead of ``OFFSET n`` the next page is fetched with a ``WHERE`` on the last
+row's sort key, e.g. ``(created_at, id) < (:last_created_at, :last_id)``, so a
+page deep in a multi-year table costs the same as the first one when the
+sort columns are indexed. The row id is always appended as a tie-breaker.
+
+Cursors are opaque URL-safe strings. Totals are optional: ``'exact'`` runs a
+COUNT on every request, ``'cached'`` reuses a count of the same query for
+``PAGINATION_COUNT_TTL`` seconds, and ``None`` skips counting altogether.
+JSON collections can be written out item by item with ``stream_page``.
+"""
+
+import base64
+import json
+import threading
+import time
+from datetime import date, datetime, time as dt_time
+from decimal import Decimal
+from flask import Response, current_app, stream_with_context
+from sqlalchemy import inspect
+from app import db
+
+DEFAULT_PER_PAGE = 20
+MAX_PER_PAGE = 100
+
+# Upper bound on cached COUNT results kept per process
+_COUNT_CACHE_SIZE = 1024
+
+_count_cache = {}
+_count_lock = threading.Lock()
+
+class KeysetPage:
+    """One page of results with cursors to its neighbours."""
+    
+    def __init__(self, items, per_page, next_cursor=None, prev_cursor=None, total=None):
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.total = total
+    
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+    
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+    
+    def __iter__(self):
+        return iter(self.items)
+    
+    def __len__(self):
+        return len(self.items)
+    
+    def to_dict(self):
+        """Pagination metadata for JSON responses."""
+        return {
+            'per_page': self.per_page,
+            'next_cursor': self.next_cursor,
+            'prev_cursor': self.prev_cursor,
+            'total': self.total
+        }
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    if isinstance(value, date):
+        return {'d': value.isoformat()}
+    if isinstance(value, dt_time):
+        return {'t': value.isoformat()}
+    if isinstance(value, Decimal):
+        return {'n': str(value)}
+    return value
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        if 'dt' in value:
+            return datetime.fromisoformat(value['dt'])
+        if 'd' in value:
+            return date.fromisoformat(value['d'])
+        if 't' in value:
+            return dt_time.fromisoformat(value['t'])
+        if 'n' in value:
+            return Decimal(value['n'])
+        raise ValueError('Unknown cursor value')
+    return value
+
+def encode_cursor(values, backwards=False):
+    """Pack a row's sort key into an opaque cursor string."""
+    payload = {'k': [_encode_value(value) for value in values]}
+    if backwards:
+        payload['b'] = 1
+    raw = json.dumps(payload, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """Unpack a cursor into (values, backwards); raises ValueError if malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        values = [_decode_value(value) for value in payload['k']]
+    except (TypeError, KeyError, ValueError) as e:
+        raise ValueError('Invalid cursor') from e
+    return values, bool(payload.get('b'))
+
+def _after(columns, values, descending):
+    """Rows strictly after ``values`` in (columns...) order."""
+    condition = None
+    for column, value in reversed(list(zip(columns, values))):
+        beyond = column < value if descending else column > value
+        condition = beyond if condition is None else db.or_(beyond, db.and_(column == value, condition))
+    return condition
+
+def _row_key(item, columns):
+    return [getattr(item, column.key) for column in columns]
+
+def cached_count(query, ttl=None):
+    """COUNT the query, reusing a recent result for an identical query."""
+    if ttl is None:
+        ttl = current_app.config['PAGINATION_COUNT_TTL']
+    compiled = query.statement.compile(dialect=db.engine.dialect)
+    key = (str(db.engine.url), str(compiled), tuple(sorted((k, repr(v)) for k, v in compiled.params.items())))
+    
+    now = time.monotonic()
+    with _count_lock:
+        cached = _count_cache.get(key)
+    if cached and cached[0] > now:
+        return cached[1]
+    
+    total = query.order_by(None).count()
+    with _count_lock:
+        if len(_count_cache) >= _COUNT_CACHE_SIZE:
+            _count_cache.clear()
+        _count_cache[key] = (now + ttl, total)
+    return total
+
+def keyset_paginate(query, *sort_columns, descending=True, cursor=None, per_page=DEFAULT_PER_PAGE, total='cached'):
+    """Return a KeysetPage of ``query`` ordered by the sort columns and id.
+    
+    An invalid cursor yields the first page, like ``paginate(error_out=False)``.
+    """
+    per_page = max(1, min(per_page or DEFAULT_PER_PAGE, MAX_PER_PAGE))
+    model = sort_columns[0].class_
+    id_column = getattr(model, inspect(model).primary_key[0].key)
+    columns = list(sort_columns) + [id_column]
+    
+    values, backwards = None, False
+    if cursor:
+        try:
+            values, backwards = decode_cursor(cursor)
+        except ValueError:
+            values = None
+        if values is not None and len(values) != len(columns):
+            values, backwards = None, False
+    
+    count = None
+    if total == 'exact':
+        count = query.order_by(None).count()
+    elif total == 'cached':
+        count = cached_count(query)
+    
+    # Walking backwards reverses the order and flips the result afterwards
+    reverse = descending != backwards
+    page_query = query
+    if values is not None:
+        page_query = page_query.filter(_after(columns, values, descending=reverse))
+    ordering = [column.desc() if reverse else column.asc() for column in columns]
+    rows = page_query.order_by(None).order_by(*ordering).limit(per_page + 1).all()
+    
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+    
+    next_cursor = prev_cursor = None
+    if rows:
+        if has_more or backwards:
+            next_cursor = encode_cursor(_row_key(rows[-1], columns))
+        if values is not None and (has_more or not backwards):
+            prev_cursor = encode_cursor(_row_key(rows[0], columns), backwards=True)
+    
+    return KeysetPage(rows, per_page, next_cursor, prev_cursor, count)
+
+def stream_page(page, key, serialize):
+    """Stream a KeysetPage as a JSON response, serializing one item at a time."""
+    def generate():
+        yield '{' + json.dumps(key) + ':['
+        for i, item in enumerate(page.items):
+            yield (',' if i else '') + json.dumps(serialize(item))
+        yield '],"pagination":' + json.dumps(page.to_dict()) + '}'
+    return Response(stream_with_context(generate()), mimetype='application/json')
\ No newline at end of file
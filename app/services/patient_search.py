@@ -0,0 +1,258 @@
+"""
+Patient search service.
+
+All patient lookups (API typeahead, global search and the patient list views)
+go through this module so that they share one index and one ranking.
+
+- SQLite: an FTS5 table ``patient_search`` whose rowid is ``patients.id``.
+  Rows are kept in sync from the ``Patient`` mapper events below.
+- PostgreSQL: trigram (pg_trgm) GIN indexes on the searched columns, so the
+  ``ILIKE '%term%'`` predicates are answered from the index and ranked by
+  ``similarity()``.
+- Any other backend falls back to plain ``ILIKE`` filtering.
+
+Terms that look like phone numbers also match by prefix on the indexed
+``phone_digits`` column, and those matches rank first. Misspelled names are handled by
+the phonetic index in ``name_matching``.
+"""
+
+import re
+import weakref
+from sqlalchemy import DDL, event, inspect, literal_column, table, column, text
+from app import db
+from app.models.patient import Patient
+from app.services.name_matching import fuzzy_search, rebuild_name_keys
+from app.services.phone_numbers import phone_prefix_filter, phone_query_digits
+
+SEARCH_TABLE = 'patient_search'
+
+# Column weights for bm25(): names matter more than ids, ids more than contacts
+BM25_WEIGHTS = (10.0, 10.0, 5.0, 2.0, 1.0)
+
+# Maximum number of FTS hits ranked per query
+CANDIDATE_WINDOW = 500
+
+fts_table = table(SEARCH_TABLE, column('rowid'))
+
+_create_fts = DDL(
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5("
+    "first_name, last_name, patient_id, phone, email, "
+    "tokenize='unicode61 remove_diacritics 2', prefix='2 3 4')"
+)
+_drop_fts = DDL(f'DROP TABLE IF EXISTS {SEARCH_TABLE}')
+
+_trigram_ddl = [
+    DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm'),
+    DDL('CREATE INDEX IF NOT EXISTS ix_patients_first_name_trgm ON patients USING gin (first_name gin_trgm_ops)'),
+    DDL('CREATE INDEX IF NOT EXISTS ix_patients_last_name_trgm ON patients USING gin (last_name gin_trgm_ops)'),
+    DDL('CREATE INDEX IF NOT EXISTS ix_patients_patient_id_trgm ON patients USING gin (patient_id gin_trgm_ops)'),
+    DDL('CREATE INDEX IF NOT EXISTS ix_patients_phone_trgm ON patients USING gin (phone gin_trgm_ops)'),
+    # Every ORed column needs one, or the whole predicate falls back to a scan
+    DDL('CREATE INDEX IF NOT EXISTS ix_patients_email_trgm ON patients USING gin (email gin_trgm_ops)'),
+]
+
+event.listen(Patient.__table__, 'after_create', _create_fts.execute_if(dialect='sqlite'))
+event.listen(Patient.__table__, 'before_drop', _drop_fts.execute_if(dialect='sqlite'))
+for _ddl in _trigram_ddl:
+    event.listen(Patient.__table__, 'after_create', _ddl.execute_if(dialect='postgresql'))
+
+# Whether the FTS table exists, per engine
+_fts_ready = weakref.WeakKeyDictionary()
+
+@event.listens_for(Patient.__table__, 'after_create')
+def _mark_index_created(target, connection, **kw):
+    if connection.dialect.name == 'sqlite':
+        _fts_ready[connection.engine] = True
+
+@event.listens_for(Patient.__table__, 'after_drop')
+def _mark_index_dropped(target, connection, **kw):
+    _fts_ready.pop(connection.engine, None)
+
+def _uses_fts(connection):
+    """Check whether the FTS index is available on this connection."""
+    if connection.dialect.name != 'sqlite':
+        return False
+    engine = connection.engine
+    if engine not in _fts_ready:
+        _fts_ready[engine] = inspect(connection).has_table(SEARCH_TABLE)
+    return _fts_ready[engine]
+
+def _document(patient):
+    """Build the indexed column values for a patient."""
+    phone = patient.phone or ''
+    digits = re.sub(r'\D', '', phone)
+    # Index the number part of ids too, so "000123" finds "PT000123"
+    patient_id = patient.patient_id or ''
+    id_number = re.sub(r'^\D+', '', patient_id)
+    return {
+        'id': patient.id,
+        'first_name': patient.first_name or '',
+        'last_name': patient.last_name or '',
+        'patient_id': f'{patient_id} {id_number}' if id_number and id_number != patient_id else patient_id,
+        'phone': f'{phone} {digits}' if digits != phone else phone,
+        'email': patient.email or ''
+    }
+
+_insert_sql = text(
+    f'INSERT INTO {SEARCH_TABLE} (rowid, first_name, last_name, patient_id, phone, email) '
+    'VALUES (:id, :first_name, :last_name, :patient_id, :phone, :email)'
+)
+_delete_sql = text(f'DELETE FROM {SEARCH_TABLE} WHERE rowid = :id')
+
+@event.listens_for(Patient, 'after_insert')
+def _index_inserted_patient(mapper, connection, target):
+    if _uses_fts(connection):
+        connection.execute(_insert_sql, _document(target))
+
+@event.listens_for(Patient, 'after_update')
+def _index_updated_patient(mapper, connection, target):
+    if _uses_fts(connection):
+        connection.execute(_delete_sql, {'id': target.id})
+        connection.execute(_insert_sql, _document(target))
+
+@event.listens_for(Patient, 'after_delete')
+def _unindex_deleted_patient(mapper, connection, target):
+    if _uses_fts(connection):
+        connection.execute(_delete_sql, {'id': target.id})
+
+def match_expression(term):
+    """Turn free text into an FTS5 query: every token must prefix-match."""
+    tokens = re.findall(r'\w+', term or '')
+    return ' '.join('"{}"*'.format(token.replace('"', '""')) for token in tokens)
+
+def _match_clause(expression):
+    return text(f'{SEARCH_TABLE} MATCH :match_expr').bindparams(match_expr=expression)
+
+def _like_filter(term):
+    pattern = f'%{term}%'
+    return db.or_(
+        Patient.first_name.ilike(pattern),
+        Patient.last_name.ilike(pattern),
+        Patient.patient_id.ilike(pattern),
+        Patient.phone.ilike(pattern),
+        Patient.email.ilike(pattern)
+    )
+
+def _text_filter(term):
+    """Text match criterion on the current backend's index."""
+    connection = db.session.connection()
+    if _uses_fts(connection):
+        expression = match_expression(term)
+        if not expression:
+            return db.false()
+        return Patient.id.in_(db.select(fts_table.c.rowid).where(_match_clause(expression)))
+    return _like_filter(term)
+
+def filter_patients(query, term):
+    """Restrict a Patient query to rows matching the search term.
+    
+    Ordering is left to the caller, which makes this suitable for the
+    paginated list views.
+    """
+    term = (term or '').strip()
+    if not term:
+        return query
+    
+    criteria = _text_filter(term)
+    digits = phone_query_digits(term)
+    if digits:
+        # Text matches still count: trailing digits of a number, an id without its letters
+        criteria = db.or_(phone_prefix_filter(Patient.phone_digits, digits), criteria)
+    return query.filter(criteria)
+
+def search_patients(term, limit=10, active_only=True, fuzzy=False):
+    """Return the best matching patients for a search term, best first.
+    
+    With ``fuzzy`` set, remaining places are filled with sound-alike and
+    near-miss name matches.
+    """
+    term = (term or '').strip()
+    if not term:
+        return []
+    
+    query = Patient.query
+    if active_only:
+        query = query.filter(Patient.is_active == True)
+    
+    # Phone numbers starting with the digits first, then the text matches
+    # (trailing digits of a number, an id without its letters)
+    patients = []
+    digits = phone_query_digits(term)
+    if digits:
+        patients = query.filter(phone_prefix_filter(Patient.phone_digits, digits)).order_by(
+            Patient.phone_digits
+        ).limit(limit).all()
+        if len(patients) == limit:
+            return patients
+        if patients:
+            query = query.filter(Patient.id.notin_([patient.id for patient in patients]))
+    
+    connection = db.session.connection()
+    if _uses_fts(connection):
+        expression = match_expression(term)
+        if not expression:
+            return patients
+        weights = ', '.join(str(weight) for weight in BM25_WEIGHTS)
+        score = literal_column(f'bm25({SEARCH_TABLE}, {weights})')
+        # Rank within a bounded candidate window so that very broad prefixes
+        # ("jo") don't load every matching row; the window keeps the best
+        # ranked matches, and inactive patients don't take places in it
+        candidates = db.select(
+            fts_table.c.rowid.label('rowid'), score.label('score')
+        ).where(_match_clause(expression))
+        if active_only:
+            candidates = candidates.join(Patient, Patient.id == fts_table.c.rowid).where(Patient.is_active == True)
+        candidates = candidates.order_by(score).limit(CANDIDATE_WINDOW).subquery()
+        query = query.join(candidates, candidates.c.rowid == Patient.id).order_by(
+            candidates.c.score
+        )
+    elif connection.dialect.name == 'postgresql':
+        score = db.func.greatest(
+            db.func.similarity(Patient.first_name, term),
+            db.func.similarity(Patient.last_name, term),
+            db.func.similarity(Patient.patient_id, term),
+            db.func.similarity(Patient.phone, term)
+        )
+        query = query.filter(_like_filter(term)).order_by(score.desc())
+    else:
+        query = query.filter(_like_filter(term)).order_by(Patient.last_name, Patient.first_name)
+    
+    patients.extend(query.limit(limit - len(patients)).all())
+    if fuzzy and len(patients) < limit:
+        seen = {patient.id for patient in patients}
+        patients.extend(fuzzy_search(term, limit - len(patients), active_only, exclude_ids=seen))
+    return patients
+
+def rebuild_index():
+    """Create the search indexes if needed and repopulate them from patients."""
+    rebuild_name_keys()
+    
+    connection = db.session.connection()
+    if connection.dialect.name == 'postgresql':
+        for ddl in _trigram_ddl:
+            connection.execute(text(ddl.statement))
+        db.session.commit()
+        return db.session.query(db.func.count(Patient.id)).scalar()
+    
+    if connection.dialect.name != 'sqlite':
+        return 0
+    
+    connection.execute(text(_create_fts.statement))
+    connection.execute(text(f'DELETE FROM {SEARCH_TABLE}'))
+    _fts_ready[connection.engine] = True
+    
+    indexed = 0
+    for patient in Patient.query.order_by(Patient.id).yield_per(1000):
+        connection.execute(_insert_sql, _document(patient))
+        indexed += 1
+    connection.execute(text(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('optimize')"))
+    db.session.commit()
+    return indexed
+
+def init_app(app):
+    """Register the search maintenance command."""
+    @app.cli.command('search-reindex')
+    def search_reindex_command():
+        """Rebuild the patient search index."""
+        count = rebuild_index()
+        print(f'Indexed {count} patients.')
\ No newline at end of file
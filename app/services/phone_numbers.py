@@ -0,0 +1,123 @@
+"""
+Normalized phone numbers.
+
+Phone numbers are stored as typed ("(555) 123-4567", "555.123.4567", ...), so
+equality checks and indexes on the raw column miss duplicates. Every phone
+column has a digits-only twin (``phone_digits`` and friends) that is set
+whenever the raw value is assigned and carries a B-tree index; duplicate
+checks are exact lookups on it and phone searches are index prefix scans.
+"""
+
+import re
+from sqlalchemy import event, inspect, text
+from app import db
+from app.models.patient import Patient
+from app.models.staff import Staff
+
+# Raw column -> digits column, per model
+PHONE_COLUMNS = {
+    Patient: (('phone', 'phone_digits'), ('emergency_contact_phone', 'emergency_contact_phone_digits')),
+    Staff: (('phone', 'phone_digits'),),
+}
+
+# Shortest digit string treated as a phone search
+MIN_SEARCH_DIGITS = 3
+
+_PHONE_QUERY = re.compile(r'[\d\s()+\-.]+')
+
+def normalize_phone(value):
+    """Strip everything but digits from a phone number."""
+    return re.sub(r'\D', '', value or '') or None
+
+def phone_query_digits(term):
+    """Return the digits of a search term that looks like a phone number."""
+    term = (term or '').strip()
+    if not _PHONE_QUERY.fullmatch(term):
+        return None
+    digits = normalize_phone(term)
+    if not digits or len(digits) < MIN_SEARCH_DIGITS:
+        return None
+    return digits
+
+def phone_prefix_filter(column, digits):
+    """Index-friendly ``column LIKE 'digits%'`` on a digits column.
+    
+    PostgreSQL serves ``LIKE`` prefixes from a ``varchar_pattern_ops``
+    index whatever the database collation. SQLite's ``LIKE`` ignores case
+    and can't use a plain index, but the equivalent ``GLOB`` can.
+    """
+    if db.session.get_bind().dialect.name == 'sqlite':
+        return column.op('GLOB')(digits + '*')
+    return column.like(digits + '%')
+
+def find_patient_by_phone(phone, exclude_id=None):
+    """Return an existing patient with the same phone number, if any."""
+    digits = normalize_phone(phone)
+    if not digits:
+        return None
+    query = Patient.query.filter(Patient.phone_digits == digits)
+    if exclude_id is not None:
+        query = query.filter(Patient.id != exclude_id)
+    return query.first()
+
+def _sync_digits(digits_column):
+    def set_digits(target, value, oldvalue, initiator):
+        setattr(target, digits_column, normalize_phone(value))
+    return set_digits
+
+for _model, _columns in PHONE_COLUMNS.items():
+    for _raw, _digits in _columns:
+        event.listen(getattr(_model, _raw), 'set', _sync_digits(_digits))
+
+def backfill_phone_digits(batch_size=1000):
+    """Add missing digits columns and indexes, then fill them from the raw numbers."""
+    connection = db.session.connection()
+    updated = 0
+    for model, columns in PHONE_COLUMNS.items():
+        table = model.__table__
+        digits_columns = [digits for _, digits in columns]
+        existing = {column['name'] for column in inspect(connection).get_columns(table.name)}
+        for name in digits_columns:
+            if name not in existing:
+                column_type = table.c[name].type.compile(dialect=connection.dialect)
+                connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {name} {column_type}'))
+        for index in table.indexes:
+            if any(column.name in digits_columns for column in index.columns):
+                index.create(bind=connection, checkfirst=True)
+        
+        raw_columns = [table.c[raw] for raw, _ in columns]
+        last_id = 0
+        while True:
+            rows = connection.execute(
+                db.select(table.c.id, *raw_columns)
+                .where(table.c.id > last_id)
+                .order_by(table.c.id)
+                .limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            values = []
+            for row in rows:
+                value = {'row_id': row[0]}
+                for i, name in enumerate(digits_columns):
+                    value[f'new_{name}'] = normalize_phone(row[i + 1])
+                values.append(value)
+            connection.execute(
+                table.update()
+                .where(table.c.id == db.bindparam('row_id'))
+                .values({name: db.bindparam(f'new_{name}') for name in digits_columns}),
+                values
+            )
+            updated += len(rows)
+            last_id = rows[-1][0]
+    
+    db.session.commit()
+    return updated
+
+def init_app(app):
+    """Register the phone backfill command."""
+    @app.cli.command('phone-backfill')
+    def phone_backfill_command():
+        """Fill the normalized phone number columns."""
+        count = backfill_phone_digits()
+        print(f'Normalized phone numbers on {count} records.')
\ No newline at end of file
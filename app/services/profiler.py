@@ -0,0 +1,167 @@
+"""
+Request profiler and slow query log.
+
+An administrator can profile their own requests on any server, production
+included, by sending an ``X-Profile: 1`` header or setting the
+``hms_profile`` cookie (``POST /admin/profiler``). A profiled response
+carries a ``Server-Timing`` header (shown by the browser's developer tools)
+with the database, template and total time; HTML pages also get a panel with
+the statement count, the slowest statements with their parameters, the most
+repeated statements and each template rendered, and other responses get the
+same summary as JSON in ``X-Profile-Summary``.
+
+Independently of profiling, every statement slower than ``SLOW_QUERY_MS``
+is saved to ``slow_queries`` when its request ends, together with the
+request's endpoint and totals, and can be browsed on the admin logs page.
+Only the statement text is kept there; bound values can carry patient
+details. ``flask slow-queries-prune`` drops entries older than
+``SLOW_QUERY_KEEP_DAYS``.
+"""
+
+import json
+import time
+from datetime import datetime, timedelta
+from flask import before_render_template, current_app, g, render_template, request, template_rendered
+from flask_login import current_user
+from app import db
+from app.models.monitoring import SlowQuery
+from app.services.query_budget import current_log, start_log, stop_log
+
+PROFILE_HEADER = 'X-Profile'
+PROFILE_COOKIE = 'hms_profile'
+
+# Statements listed in a profile summary
+SLOWEST_SHOWN = 10
+REPEATED_SHOWN = 5
+
+# Longest statement and parameter text kept
+STATEMENT_CHARS = 2000
+PARAMETER_CHARS = 500
+
+def profiling_requested():
+    """Whether the request asks to be profiled, by header or cookie."""
+    return request.headers.get(PROFILE_HEADER) == '1' or request.cookies.get(PROFILE_COOKIE) == '1'
+
+def _truncate(text, limit):
+    return text if len(text) <= limit else text[:limit] + '...'
+
+def _start_request():
+    if profiling_requested() and current_user.is_authenticated and current_user.can_access_admin():
+        g.profile = {'started': time.perf_counter(), 'templates': []}
+    if g.get('profile') is not None or current_app.config['SLOW_QUERY_MS']:
+        start_log()
+
+def _template_starting(sender, template, context, **extra):
+    profile = g.get('profile')
+    if profile is not None:
+        profile.setdefault('rendering', []).append(time.perf_counter())
+
+def _template_rendered(sender, template, context, **extra):
+    profile = g.get('profile')
+    if profile is not None and profile.get('rendering'):
+        profile['templates'].append((template.name, time.perf_counter() - profile['rendering'].pop()))
+
+def summary():
+    """The current request's profile so far, or None if it isn't profiled."""
+    profile = g.get('profile')
+    log = current_log()
+    if profile is None or log is None:
+        return None
+    return {
+        'endpoint': request.endpoint,
+        'total_ms': (time.perf_counter() - profile['started']) * 1000,
+        'db_ms': log.total_time * 1000,
+        'statements': len(log),
+        'render_ms': sum(duration for _, duration in profile['templates']) * 1000,
+        'templates': [{'name': name, 'ms': duration * 1000} for name, duration in profile['templates']],
+        'slowest': [
+            {
+                'ms': duration * 1000,
+                'statement': _truncate(statement, STATEMENT_CHARS),
+                'parameters': _truncate(repr(parameters), PARAMETER_CHARS)
+            }
+            for statement, parameters, duration in log.slowest(SLOWEST_SHOWN)
+        ],
+        'repeated': [
+            {'count': count, 'statement': _truncate(shape, STATEMENT_CHARS)}
+            for shape, count in log.shapes().most_common(REPEATED_SHOWN) if count > 1
+        ]
+    }
+
+def _attach_profile(response):
+    profile = summary()
+    if profile is None:
+        return response
+    
+    response.headers['Server-Timing'] = ', '.join([
+        f"db;dur={profile['db_ms']:.1f};desc=\"{profile['statements']} statements\"",
+        f"render;dur={profile['render_ms']:.1f}",
+        f"total;dur={profile['total_ms']:.1f}"
+    ])
+    if response.mimetype == 'text/html' and not response.is_streamed:
+        page = response.get_data(as_text=True)
+        position = page.rfind('</body>')
+        if position != -1:
+            panel = render_template('admin/profiler.html', profile=profile)
+            response.set_data(page[:position] + panel + page[position:])
+    elif not response.is_streamed:
+        brief = dict(profile, slowest=profile['slowest'][:3], repeated=profile['repeated'][:3])
+        response.headers['X-Profile-Summary'] = json.dumps(brief, default=str)
+    # Profiles differ per user and request
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+def _save_slow_queries(exception=None):
+    log = current_log()
+    # Keep the log's totals as they were, without the inserts below
+    stop_log()
+    threshold = current_app.config['SLOW_QUERY_MS']
+    if log is None or not threshold:
+        return
+    slow = [(statement, duration * 1000) for statement, _, duration in log.statements if duration * 1000 >= threshold]
+    if not slow:
+        return
+    
+    user_id = current_user.get_id() if current_user else None
+    rows = [
+        {
+            'recorded_at': datetime.utcnow(),
+            'endpoint': request.endpoint,
+            'method': request.method,
+            'path': _truncate(request.path, 250),
+            'statement': _truncate(statement, STATEMENT_CHARS),
+            'duration_ms': duration_ms,
+            'request_statements': len(log),
+            'request_db_ms': log.total_time * 1000,
+            'user_id': int(user_id) if user_id else None
+        }
+        for statement, duration_ms in slow
+    ]
+    try:
+        # The request is over; drop whatever it left uncommitted so the insert can't block on it
+        db.session.rollback()
+        db.session.execute(SlowQuery.__table__.insert(), rows)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        current_app.logger.exception('Saving %d slow queries failed', len(rows))
+
+def prune(days=None):
+    """Delete slow query entries older than ``days`` (default ``SLOW_QUERY_KEEP_DAYS``)."""
+    days = current_app.config['SLOW_QUERY_KEEP_DAYS'] if days is None else days
+    deleted = SlowQuery.query.filter(SlowQuery.recorded_at < datetime.utcnow() - timedelta(days=days)).delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
+
+def init_app(app):
+    """Record request statements, profile opted-in requests and save slow queries."""
+    app.before_request(_start_request)
+    app.after_request(_attach_profile)
+    app.teardown_request(_save_slow_queries)
+    before_render_template.connect(_template_starting, app)
+    template_rendered.connect(_template_rendered, app)
+    
+    @app.cli.command('slow-queries-prune')
+    def slow_queries_prune_command():
+        """Delete slow query log entries older than SLOW_QUERY_KEEP_DAYS."""
+        print(f'Deleted {prune()} slow query entries.')
\ No newline at end of file
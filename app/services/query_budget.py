@@ -0,0 +1,150 @@
+"""
+Per-request SQL query budgets.
+
+With ``SQLALCHEMY_RECORD_QUERIES`` on (development, testing and staging),
+engine events record every statement a request runs with its duration. When
+the request ends its log is checked against the endpoint's budget, declared
+next to the route::
+    
+    @api_bp.route('/bills/patient/<int:patient_id>')
+    @login_required
+    @query_budget(6)
+    def patient_bills(patient_id):
+
+and against ``QUERY_REPEAT_LIMIT``: the same statement shape (the SQL with
+bound values and ``IN`` lists collapsed) running more times than that is the
+mark of a query per row. A breach is logged with the repeated statements,
+or raises ``QueryBudgetExceeded`` when ``QUERY_BUDGET_RAISE`` is on (tests),
+so an N+1 loop fails the test that exercises the page instead of reaching
+production.
+"""
+
+import re
+import time
+from collections import Counter
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+_STARTED_KEY = 'query_started'
+
+# Statements shown per breach in the log
+REPORTED_SHAPES = 5
+
+_PLACEHOLDER = re.compile(r"\?|%\(\w+\)s|%s|:\w+|\$\d+|\b\d+\b|'(?:[^']|'')*'")
+_LIST = re.compile(r"\?(?:\s*,\s*\?)+")
+_SPACE = re.compile(r"\s+")
+
+class QueryBudgetExceeded(AssertionError):
+    """A request ran more statements than its budget allows."""
+
+def statement_shape(statement):
+    """The statement with values and value lists collapsed to ``?``."""
+    shape = _PLACEHOLDER.sub('?', statement)
+    shape = _LIST.sub('?', shape)
+    return _SPACE.sub(' ', shape).strip()
+
+class QueryLog:
+    """Statements run during one request, with parameters and durations in seconds."""
+    
+    def __init__(self):
+        self.statements = []
+    
+    def add(self, statement, parameters, duration):
+        self.statements.append((statement, parameters, duration))
+    
+    def __len__(self):
+        return len(self.statements)
+    
+    @property
+    def total_time(self):
+        return sum(duration for _, _, duration in self.statements)
+    
+    def shapes(self):
+        """Counter of statement shapes."""
+        return Counter(statement_shape(statement) for statement, _, _ in self.statements)
+    
+    def slowest(self, count):
+        """The ``count`` slowest statements, slowest first."""
+        return sorted(self.statements, key=lambda entry: entry[2], reverse=True)[:count]
+
+def query_budget(statements=None, repeats=None):
+    """Declare a view's statement budget and, optionally, its own repeat limit.
+    
+    Goes above decorators that don't copy function attributes (``admin_required``).
+    """
+    def decorator(view):
+        view.query_budget = (statements, repeats)
+        return view
+    return decorator
+
+def current_log():
+    """The current request's query log, if queries are being recorded."""
+    return g.get('query_log') if has_request_context() else None
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _start_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault(_STARTED_KEY, []).append(time.perf_counter())
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _record_statement(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get(_STARTED_KEY)
+    if not started:
+        return
+    duration = time.perf_counter() - started.pop()
+    log = current_log()
+    if log is not None:
+        log.add(statement, parameters, duration)
+
+@event.listens_for(Engine, 'handle_error')
+def _drop_timer(exception_context):
+    connection = exception_context.connection
+    if connection is not None and connection.info.get(_STARTED_KEY):
+        connection.info[_STARTED_KEY].pop()
+
+def start_log():
+    """Start recording the current request's statements, if not already."""
+    if g.get('query_log') is None:
+        g.query_log = QueryLog()
+
+def stop_log(exception=None):
+    """Stop recording; the next request starts a fresh log."""
+    g.pop('query_log', None)
+
+def breaches(log, budget=None, repeat_limit=None):
+    """Messages for each way the log exceeds the budget or the repeat limit."""
+    messages = []
+    if budget is not None and len(log) > budget:
+        messages.append(f'{len(log)} statements, budget {budget}')
+    if repeat_limit:
+        for shape, count in log.shapes().most_common(REPORTED_SHAPES):
+            if count <= repeat_limit:
+                break
+            messages.append(f'{count}x (limit {repeat_limit}): {shape}')
+    return messages
+
+def _check_budget(response):
+    log = current_log()
+    view = current_app.view_functions.get(request.endpoint)
+    if log is None or view is None:
+        return response
+    budget, repeat_limit = getattr(view, 'query_budget', (None, None))
+    if repeat_limit is None:
+        repeat_limit = current_app.config['QUERY_REPEAT_LIMIT']
+    messages = breaches(log, budget, repeat_limit)
+    if not messages:
+        return response
+    
+    summary = f'Query budget exceeded by {request.endpoint} ({len(log)} statements, {log.total_time * 1000:.1f} ms): ' + '; '.join(messages)
+    if current_app.config['QUERY_BUDGET_RAISE']:
+        raise QueryBudgetExceeded(summary)
+    current_app.logger.warning(summary)
+    return response
+
+def init_app(app):
+    """Record each request's statements and check them against its budget."""
+    if not app.config.get('SQLALCHEMY_RECORD_QUERIES'):
+        return
+    app.before_request(start_log)
+    app.after_request(_check_budget)
+    app.teardown_request(stop_log)
\ No newline at end of file
@@ -0,0 +1,132 @@
+"""
+Recurring appointment series.
+
+A series is a simple rule (daily, weekly or biweekly from a start date, for
+a number of occurrences or until an end date) at a fixed time of day. The
+rule is expanded up front and every occurrence is checked against the
+doctor's busy intervals from one ``load_busy`` call over the whole span, so
+a year of weekly sessions costs one query rather than one per week.
+Occurrences that clash come back with the nearest free slots of that day as
+alternatives; the rest are inserted together in the same transaction as the
+series row.
+"""
+
+from datetime import timedelta
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models.appointment import Appointment, AppointmentSeries
+from app.services.booking import EXCLUSION_CONSTRAINT, BookingConflict, claim_doctor
+from app.services.scheduling import MINUTES_PER_DAY, format_minutes, is_free, load_busy, slots_for_doctors, to_minutes
+
+FREQUENCIES = {'daily': 1, 'weekly': 7, 'biweekly': 14}
+
+# Longest series that can be booked at once
+MAX_OCCURRENCES = 104
+
+# Alternatives suggested per clashing occurrence
+ALTERNATIVES = 3
+
+def expand_dates(start_date, frequency, count=None, until=None):
+    """Occurrence dates of a rule; raises ValueError for an invalid rule."""
+    if frequency not in FREQUENCIES:
+        raise ValueError(f"Frequency must be one of {', '.join(FREQUENCIES)}")
+    if not count and not until:
+        raise ValueError('Either an occurrence count or an end date is required')
+    if until and until < start_date:
+        raise ValueError('End date must not be before the start date')
+    
+    step = timedelta(days=FREQUENCIES[frequency])
+    dates = []
+    day = start_date
+    while (not count or len(dates) < count) and (not until or day <= until):
+        if len(dates) == MAX_OCCURRENCES:
+            raise ValueError(f'A series can have at most {MAX_OCCURRENCES} occurrences')
+        dates.append(day)
+        day += step
+    return dates
+
+def plan_series(doctor_id, dates, appointment_time, duration=30):
+    """Split occurrence dates into bookable ones and clashes with alternatives.
+    
+    Returns ``(free_dates, clashes)`` where each clash is a dict with the
+    date and up to ``ALTERNATIVES`` nearby free times that day.
+    """
+    if not dates:
+        return [], []
+    start = to_minutes(appointment_time)
+    end = start + (duration or 30)
+    busy = load_busy([doctor_id], dates[0], dates[-1] + timedelta(days=1))
+    
+    free_dates = []
+    clashing = []
+    for day in dates:
+        today = busy.get((doctor_id, day), [])
+        # Time past midnight runs into the next day's intervals
+        tomorrow = busy.get((doctor_id, day + timedelta(days=1)), [])
+        if is_free(today, start, end) and (end <= MINUTES_PER_DAY or is_free(tomorrow, 0, end - MINUTES_PER_DAY)):
+            free_dates.append(day)
+        else:
+            clashing.append(day)
+    
+    clashes = []
+    if clashing:
+        slots = slots_for_doctors([doctor_id], clashing[0], clashing[-1], duration)[doctor_id]
+        for day in clashing:
+            nearest = sorted(slots[day], key=lambda slot: (abs(slot - start), slot))[:ALTERNATIVES]
+            clashes.append({
+                'date': day.isoformat(),
+                'alternatives': [format_minutes(slot) for slot in sorted(nearest)]
+            })
+    return free_dates, clashes
+
+def book_series(patient_id, doctor_id, start_date, appointment_time, appointment_type, frequency,
+                count=None, until=None, duration=30, atomic=False, **kwargs):
+    """Expand, check and book a series; the caller commits.
+    
+    Returns ``(series, appointments, clashes)``. Clashing occurrences are
+    skipped, or with ``atomic`` nothing is booked if there are any; in that
+    case ``series`` is None and nothing is added.
+    If the database rejects an occurrence as overlapping, BookingConflict is
+    raised and nothing of the series is left in the session.
+    """
+    dates = expand_dates(start_date, frequency, count, until)
+    claim_doctor(doctor_id)
+    free_dates, clashes = plan_series(doctor_id, dates, appointment_time, duration)
+    if not free_dates or (atomic and clashes):
+        return None, [], clashes
+    
+    series = AppointmentSeries(
+        patient_id=patient_id,
+        doctor_id=doctor_id,
+        frequency=frequency,
+        start_date=dates[0],
+        end_date=dates[-1],
+        occurrences=len(dates),
+        appointment_time=appointment_time,
+        duration=duration,
+        appointment_type=appointment_type,
+        reason_for_visit=kwargs.get('reason_for_visit'),
+        created_by=kwargs.get('created_by')
+    )
+    appointments = [
+        Appointment(
+            patient_id=patient_id,
+            doctor_id=doctor_id,
+            appointment_date=day,
+            appointment_time=appointment_time,
+            appointment_type=appointment_type,
+            duration=duration,
+            series=series,
+            **kwargs
+        )
+        for day in free_dates
+    ]
+    try:
+        # Rows of one table flush as a batched INSERT (insertmanyvalues where supported)
+        with db.session.begin_nested():
+            db.session.add_all([series] + appointments)
+    except IntegrityError as e:
+        if EXCLUSION_CONSTRAINT in str(e.orig):
+            raise BookingConflict('Doctor is not available for every occurrence.') from e
+        raise
+    return series, appointments, clashes
\ No newline at end of file
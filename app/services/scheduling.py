@@ -0,0 +1,354 @@
+"""
+Appointment slot engine.
+
+A doctor's day is a sorted list of half-open ``(start, end)`` intervals in
+minutes since midnight. Working hours minus merged busy intervals give the
+free intervals, and slots are laid on a fixed grid inside each of them, so a
+day costs O(n log n) in its number of appointments however long it is.
+
+Busy intervals (appointments and active slot holds) for any number of doctors
+and days come from one query (``load_busy``), which is what makes month-long, department-wide views cheap.
+The grid defaults to ``APPOINTMENT_SLOT_GRANULARITY`` (or the slot duration
+when unset).
+
+Working hours come from the doctor's ``StaffSchedule`` shifts; a shift whose
+end is not after its start runs past midnight into the next day. A week in
+which the doctor has no shifts at all falls back to
+``APPOINTMENT_DAY_START``-``APPOINTMENT_DAY_END``. Shifts are cached per
+doctor and week, for at most ``SCHEDULE_CACHE_SECONDS``, and dropped as soon
+as a schedule change for that doctor commits.
+
+``first_available`` answers "earliest slot with any of these doctors" by
+walking forward a day at a time and heap-merging the doctors' slot lists,
+stopping as soon as enough slots are found.
+"""
+
+import heapq
+import threading
+import time as clock
+import weakref
+from bisect import bisect_right
+from itertools import islice
+from datetime import datetime, time, timedelta
+from flask import current_app
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, object_session
+from app import db
+from app.models.appointment import Appointment, SlotHold
+from app.models.staff import StaffSchedule
+
+MINUTES_PER_DAY = 24 * 60
+
+# Statuses that don't occupy the doctor's time
+FREE_STATUSES = ('cancelled',)
+
+_SCHEDULE_CHANGES_KEY = 'schedule_changes'
+
+def to_minutes(value):
+    """Minutes since midnight of a time (or 'HH:MM' string)."""
+    if isinstance(value, str):
+        value = datetime.strptime(value, '%H:%M').time()
+    return value.hour * 60 + value.minute
+
+def from_minutes(minutes):
+    """Time of day for a minute offset."""
+    return time(minutes // 60, minutes % 60)
+
+def format_minutes(minutes):
+    """'HH:MM' label for a minute offset."""
+    return f'{minutes // 60:02d}:{minutes % 60:02d}'
+
+def merge_intervals(intervals):
+    """Sort and merge overlapping or touching intervals."""
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    return [(start, end) for start, end in merged]
+
+def subtract_intervals(windows, busy):
+    """Parts of the windows not covered by busy; both lists sorted and merged."""
+    free = []
+    i = 0
+    for start, end in windows:
+        cursor = start
+        while i < len(busy) and busy[i][1] <= cursor:
+            i += 1
+        j = i
+        while j < len(busy) and busy[j][0] < end:
+            if busy[j][0] > cursor:
+                free.append((cursor, busy[j][0]))
+            cursor = max(cursor, busy[j][1])
+            j += 1
+        if cursor < end:
+            free.append((cursor, end))
+    return free
+
+def is_free(busy, start, end):
+    """Whether [start, end) avoids every merged busy interval."""
+    # First busy interval that ends after start is the only one that can overlap
+    i = bisect_right(busy, (start, float('inf'))) - 1
+    if i >= 0 and busy[i][1] > start:
+        return False
+    return i + 1 >= len(busy) or busy[i + 1][0] >= end
+
+def slot_starts(free, duration, granularity, origin=0):
+    """Start minutes of slots fitting the free intervals, aligned to origin + k * granularity."""
+    starts = []
+    for start, end in free:
+        offset = (start - origin) % granularity
+        slot = start if offset == 0 else start + granularity - offset
+        while slot + duration <= end:
+            starts.append(slot)
+            slot += granularity
+    return starts
+
+def working_hours():
+    """Default working window of a day, as a list of intervals."""
+    config = current_app.config
+    return [(to_minutes(config['APPOINTMENT_DAY_START']), to_minutes(config['APPOINTMENT_DAY_END']))]
+
+def default_granularity(duration):
+    return current_app.config.get('APPOINTMENT_SLOT_GRANULARITY') or duration
+
+def _days(start_date, end_date):
+    days = []
+    day = start_date
+    while day <= end_date:
+        days.append(day)
+        day += timedelta(days=1)
+    return days
+
+def _week_start(day):
+    return day - timedelta(days=day.weekday())
+
+# Shift windows per engine: {doctor_id: {week_start: (loaded_at, windows)}},
+# where windows is (scheduled, {date: intervals}) and scheduled tells whether
+# the doctor has any shift starting in that week
+_hours_cache = weakref.WeakKeyDictionary()
+_hours_lock = threading.Lock()
+
+def _load_weeks(doctor_ids, weeks):
+    """Shift windows for every (doctor, week) pair, from a single query."""
+    rows = db.session.query(
+        StaffSchedule.staff_id,
+        StaffSchedule.work_date,
+        StaffSchedule.start_time,
+        StaffSchedule.end_time
+    ).filter(
+        StaffSchedule.staff_id.in_(doctor_ids),
+        # The day before a week may hold a night shift running into it
+        StaffSchedule.work_date >= min(weeks) - timedelta(days=1),
+        StaffSchedule.work_date <= max(weeks) + timedelta(days=6),
+        StaffSchedule.is_active == True
+    ).all()
+    
+    windows = {(doctor_id, week): {} for doctor_id in doctor_ids for week in weeks}
+    scheduled = set()
+    for staff_id, work_date, start_time, end_time in rows:
+        scheduled.add((staff_id, _week_start(work_date)))
+        start, end = to_minutes(start_time), to_minutes(end_time)
+        if end > start:
+            pieces = [(work_date, start, end)]
+        else:
+            pieces = [(work_date, start, MINUTES_PER_DAY), (work_date + timedelta(days=1), 0, end)]
+        for day, piece_start, piece_end in pieces:
+            key = (staff_id, _week_start(day))
+            if piece_end > piece_start and key in windows:
+                windows[key].setdefault(day, []).append((piece_start, piece_end))
+    
+    return {key: (key in scheduled, days) for key, days in windows.items()}
+
+def working_windows(doctor_ids, start_date, end_date):
+    """Working intervals keyed by (doctor_id, date), from cached weekly shifts."""
+    doctor_ids = list(doctor_ids)
+    weeks = sorted({_week_start(day) for day in _days(start_date, end_date)})
+    ttl = current_app.config['SCHEDULE_CACHE_SECONDS']
+    now = clock.monotonic()
+    
+    with _hours_lock:
+        cache = _hours_cache.setdefault(db.engine, {})
+        cached = {}
+        missing = set()
+        for doctor_id in doctor_ids:
+            for week in weeks:
+                entry = cache.get(doctor_id, {}).get(week)
+                if entry and now - entry[0] < ttl:
+                    cached[(doctor_id, week)] = entry[1]
+                else:
+                    missing.add((doctor_id, week))
+    
+    if missing:
+        loaded = _load_weeks(sorted({key[0] for key in missing}), sorted({key[1] for key in missing}))
+        with _hours_lock:
+            cache = _hours_cache.setdefault(db.engine, {})
+            for key, windows in loaded.items():
+                cache.setdefault(key[0], {})[key[1]] = (now, windows)
+                cached[key] = windows
+    
+    default = working_hours()
+    result = {}
+    for doctor_id in doctor_ids:
+        for day in _days(start_date, end_date):
+            scheduled, windows = cached[(doctor_id, _week_start(day))]
+            intervals = windows.get(day, [])
+            result[(doctor_id, day)] = merge_intervals(intervals if scheduled else default + intervals)
+    return result
+
+def _stage_schedule_change(mapper, connection, target):
+    session = object_session(target)
+    if session is None:
+        return
+    staff_ids = set(inspect(target).attrs.staff_id.history.deleted or ()) | {target.staff_id}
+    changes = session.info.setdefault(_SCHEDULE_CHANGES_KEY, set())
+    changes.update((connection.engine, staff_id) for staff_id in staff_ids)
+
+for _event in ('after_insert', 'after_update', 'after_delete'):
+    event.listen(StaffSchedule, _event, _stage_schedule_change)
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_working_hours(session):
+    changes = session.info.pop(_SCHEDULE_CHANGES_KEY, None)
+    if not changes:
+        return
+    with _hours_lock:
+        for engine, staff_id in changes:
+            cache = _hours_cache.get(engine)
+            if cache is not None:
+                cache.pop(staff_id, None)
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_schedule_changes(session):
+    session.info.pop(_SCHEDULE_CHANGES_KEY, None)
+
+def load_busy(doctor_ids, start_date, end_date):
+    """Merged busy intervals keyed by (doctor_id, date), from a single query.
+    
+    Active slot holds count as busy. Appointments running past midnight also
+    block the start of the next day.
+    """
+    doctor_ids = list(doctor_ids)
+    appointments = db.select(
+        Appointment.doctor_id,
+        Appointment.appointment_date,
+        Appointment.appointment_time,
+        Appointment.duration
+    ).where(
+        Appointment.doctor_id.in_(doctor_ids),
+        Appointment.appointment_date >= start_date - timedelta(days=1),
+        Appointment.appointment_date <= end_date,
+        Appointment.status.notin_(FREE_STATUSES)
+    )
+    holds = db.select(
+        SlotHold.doctor_id,
+        SlotHold.appointment_date,
+        SlotHold.appointment_time,
+        SlotHold.duration
+    ).where(
+        SlotHold.doctor_id.in_(doctor_ids),
+        SlotHold.appointment_date >= start_date - timedelta(days=1),
+        SlotHold.appointment_date <= end_date,
+        SlotHold.expires_at > datetime.utcnow()
+    )
+    rows = db.session.execute(db.union_all(appointments, holds)).all()
+    
+    busy = {}
+    for doctor_id, day, start_time, duration in rows:
+        start = to_minutes(start_time)
+        end = start + (duration or 30)
+        if day >= start_date:
+            busy.setdefault((doctor_id, day), []).append((start, end))
+        if end > MINUTES_PER_DAY and day < end_date:
+            busy.setdefault((doctor_id, day + timedelta(days=1)), []).append((0, end - MINUTES_PER_DAY))
+    return {key: merge_intervals(intervals) for key, intervals in busy.items()}
+
+def free_slots(busy, duration=30, granularity=None, hours=None):
+    """Slot start minutes for one day given its merged busy intervals."""
+    hours = merge_intervals(hours if hours is not None else working_hours())
+    if not hours:
+        return []
+    granularity = granularity or default_granularity(duration)
+    return slot_starts(subtract_intervals(hours, busy), duration, granularity, origin=hours[0][0])
+
+def slots_for_doctors(doctor_ids, start_date, end_date, duration=30, granularity=None, hours=None):
+    """Free slots per doctor per day over a date range: {doctor_id: {date: [minutes]}}.
+    
+    ``hours`` overrides the doctors' scheduled shifts with fixed daily windows.
+    """
+    doctor_ids = list(doctor_ids)
+    days = _days(start_date, end_date)
+    busy = load_busy(doctor_ids, start_date, end_date)
+    windows = working_windows(doctor_ids, start_date, end_date) if hours is None else {}
+    granularity = granularity or default_granularity(duration)
+    
+    return {
+        doctor_id: {
+            day: free_slots(
+                busy.get((doctor_id, day), []), duration, granularity,
+                hours if hours is not None else windows[(doctor_id, day)]
+            )
+            for day in days
+        }
+        for doctor_id in doctor_ids
+    }
+
+def available_slots(doctor_id, day, duration=30, granularity=None, hours=None):
+    """Free slot times ('HH:MM') for a doctor on one day."""
+    slots = slots_for_doctors([doctor_id], day, day, duration, granularity, hours)[doctor_id][day]
+    return [format_minutes(start) for start in slots]
+
+def availability_matrix(doctor_ids, day, starts, duration=30):
+    """Doctor x slot grid: {doctor_id: [free?, ...]} for slot start minutes on one day.
+    
+    A slot is free when it lies within the doctor's working hours and
+    overlaps none of their appointments.
+    """
+    doctor_ids = list(doctor_ids)
+    busy = load_busy(doctor_ids, day, day)
+    windows = working_windows(doctor_ids, day, day)
+    
+    matrix = {}
+    for doctor_id in doctor_ids:
+        doctor_busy = busy.get((doctor_id, day), [])
+        # Time outside the working windows counts as busy
+        off_hours = subtract_intervals([(0, 2 * MINUTES_PER_DAY)], merge_intervals(windows[(doctor_id, day)]))
+        matrix[doctor_id] = [
+            is_free(doctor_busy, start, start + duration) and is_free(off_hours, start, start + duration)
+            for start in starts
+        ]
+    return matrix
+
+def _doctor_slots(doctor_id, starts):
+    for start in starts:
+        yield start, doctor_id
+
+def iter_free_slots(doctor_ids, start_date, duration=30, granularity=None, max_days=14, not_before=0):
+    """Yield (date, start minute, doctor_id) across doctors in time order.
+    
+    Days are scanned lazily, one bulk load for all doctors per day, and each
+    day's per-doctor slot lists are k-way merged with a heap. Slots on the
+    first day starting before ``not_before`` minutes are skipped.
+    """
+    doctor_ids = list(doctor_ids)
+    if not doctor_ids:
+        return
+    granularity = granularity or default_granularity(duration)
+    for offset in range(max_days):
+        day = start_date + timedelta(days=offset)
+        slots = slots_for_doctors(doctor_ids, day, day, duration, granularity)
+        streams = [
+            _doctor_slots(doctor_id, [start for start in slots[doctor_id][day] if offset or start >= not_before])
+            for doctor_id in doctor_ids
+        ]
+        for start, doctor_id in heapq.merge(*streams):
+            yield day, start, doctor_id
+
+def first_available(doctor_ids, start_date, duration=30, limit=5, granularity=None, max_days=14, not_before=0):
+    """The ``limit`` earliest free slots among the doctors, as (date, minute, doctor_id).
+    
+    Stops loading days as soon as enough slots are found.
+    """
+    return list(islice(iter_free_slots(doctor_ids, start_date, duration, granularity, max_days, not_before), limit))
\ No newline at end of file
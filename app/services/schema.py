@@ -0,0 +1,67 @@
+"""
+Schema maintenance for existing databases.
+
+``db.create_all()`` only creates missing tables, so columns and indexes
+declared on models after a database was created never reach it.
+``flask create-indexes`` adds every declared index that is missing, and
+``flask upgrade-schema`` also creates missing tables and adds missing
+columns (with their server defaults) before doing so.
+"""
+
+from sqlalchemy import inspect, text
+from app import db
+
+def add_missing_columns():
+    """Add declared columns missing from existing tables; return 'table.column' names."""
+    connection = db.session.connection()
+    inspector = inspect(connection)
+    added = []
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            ddl = f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=connection.dialect)}'
+            if column.server_default is not None:
+                ddl += f' DEFAULT {column.server_default.arg}'
+                if not column.nullable:
+                    ddl += ' NOT NULL'
+            connection.execute(text(ddl))
+            added.append(f'{table.name}.{column.name}')
+    db.session.commit()
+    return added
+
+def create_missing_indexes():
+    """Create declared indexes missing from existing tables; return their names."""
+    connection = db.session.connection()
+    inspector = inspect(connection)
+    created = []
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(bind=connection)
+                created.append(index.name)
+    db.session.commit()
+    return created
+
+def init_app(app):
+    """Register the schema maintenance commands."""
+    @app.cli.command('create-indexes')
+    def create_indexes_command():
+        """Create indexes declared on the models but missing from the database."""
+        for name in create_missing_indexes():
+            print(f'Created index {name}')
+    
+    @app.cli.command('upgrade-schema')
+    def upgrade_schema_command():
+        """Create missing tables, columns and indexes."""
+        db.create_all()
+        for name in add_missing_columns():
+            print(f'Added column {name}')
+        for name in create_missing_indexes():
+            print(f'Created index {name}')
\ No newline at end of file
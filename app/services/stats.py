@@ -0,0 +1,99 @@
+"""
+Conditional aggregation for dashboard and report figures.
+
+Figures over one table (active patients, appointments by status, open and
+overdue bills, ...) are compiled into a single ``SELECT`` that scans the
+table once: each figure becomes ``COUNT(*) FILTER (WHERE ...)`` or
+``SUM(x) FILTER (WHERE ...)`` on databases with aggregate filters
+(PostgreSQL, SQLite) and ``SUM(CASE WHEN ... END)`` elsewhere. Aggregates of
+several tables are cross-joined into one statement, so a whole dashboard is
+one round trip::
+    
+    figures = aggregate({
+        Patient: {'active': count(Patient.is_active == True)},
+        Appointment: {'today': count(Appointment.appointment_date == today)},
+    })
+"""
+
+from app import db
+
+# Dialects that understand aggregate FILTER clauses
+FILTER_DIALECTS = ('postgresql', 'sqlite')
+
+class Metric:
+    """A count of rows, or a sum of ``column``, optionally only where ``condition`` holds."""
+    
+    def __init__(self, column=None, condition=None):
+        self.column = column
+        self.condition = condition
+    
+    def compile(self, use_filter):
+        """The aggregate expression, never NULL."""
+        if self.condition is None:
+            aggregate = db.func.sum(self.column) if self.column is not None else db.func.count()
+        elif use_filter:
+            aggregate = (db.func.sum(self.column) if self.column is not None else db.func.count()).filter(self.condition)
+        else:
+            aggregate = db.func.sum(db.case((self.condition, self.column if self.column is not None else 1), else_=0))
+        return db.func.coalesce(aggregate, 0)
+
+def count(condition=None):
+    """Number of rows matching the condition."""
+    return Metric(condition=condition)
+
+def total(column, condition=None):
+    """Sum of a column over rows matching the condition."""
+    return Metric(column, condition)
+
+def count_by(column, condition=None):
+    """One count per value of an Enum column, keyed by value."""
+    if condition is None:
+        return {value: count(column == value) for value in column.type.enums}
+    return {value: count(db.and_(column == value, condition)) for value in column.type.enums}
+
+def _use_filter():
+    return db.session.get_bind().dialect.name in FILTER_DIALECTS
+
+def _flatten(metrics, prefix=()):
+    for name, metric in metrics.items():
+        if isinstance(metric, dict):
+            yield from _flatten(metric, prefix + (name,))
+        else:
+            yield prefix + (name,), metric
+
+def aggregate(tables, where=None):
+    """Evaluate figures over several tables in one statement.
+    
+    ``tables`` maps a model to ``{name: metric}``, where metrics may be nested
+    in dicts (as ``count_by`` returns); ``where`` optionally maps a model to
+    criteria applied to all its figures. Returns the same nesting of names
+    with values, merged across tables.
+    """
+    use_filter = _use_filter()
+    where = where or {}
+    subqueries = []
+    names = []
+    for model, metrics in tables.items():
+        flat = list(_flatten(metrics))
+        columns = [metric.compile(use_filter).label(f'm{len(names) + index}') for index, (_, metric) in enumerate(flat)]
+        query = db.select(*columns).select_from(model)
+        if model in where:
+            query = query.where(*where[model])
+        subqueries.append(query.subquery())
+        names.extend(name for name, _ in flat)
+    if not subqueries:
+        return {}
+    
+    # Each subquery yields exactly one row, so cross-joining them yields one row
+    query = db.select(*[column for subquery in subqueries for column in subquery.c]).select_from(subqueries[0])
+    for subquery in subqueries[1:]:
+        query = query.join(subquery, db.true())
+    row = db.session.execute(query).one()
+    
+    result = {}
+    for name, value in zip(names, row):
+        target = result
+        for part in name[:-1]:
+            target = target.setdefault(part, {})
+        target[name[-1]] = value
+    return result
\ No newline at end of file
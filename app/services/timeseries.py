@@ -0,0 +1,88 @@
+"""
+Gap-filled time series for charts.
+
+A series sums a column per day, week or month over a date range with one
+grouped statement, instead of one ``SUM`` per day. The statement groups by
+calendar day, which every database can express the same way (``date(x)``),
+and returns at most one row per day that has data; days are folded into
+week or month buckets and missing buckets filled with zero in Python::
+    
+    revenue = series(Payment.payment_date, Payment.amount, start, end, bucket='week')
+    # [{'date': '2024-01-01', 'value': 120.0}, {'date': '2024-01-08', 'value': 0.0}, ...]
+
+Weeks start on Monday and months on the first; each point is labelled with
+its bucket's first day, so the first and last buckets may be partial.
+"""
+
+from datetime import date, datetime, time, timedelta
+from app import db
+from app.models.billing import Payment
+from app.services import cache
+
+BUCKETS = ('day', 'week', 'month')
+
+# Longest range a caller-supplied number of days may ask for
+MAX_DAYS = 366 * 5
+
+def bucket_start(day, bucket='day'):
+    """The first day of the bucket holding ``day``."""
+    if bucket == 'week':
+        return day - timedelta(days=day.weekday())
+    if bucket == 'month':
+        return day.replace(day=1)
+    return day
+
+def _next_bucket(start, bucket):
+    if bucket == 'week':
+        return start + timedelta(days=7)
+    if bucket == 'month':
+        return date(start.year + start.month // 12, start.month % 12 + 1, 1)
+    return start + timedelta(days=1)
+
+def buckets(start, end, bucket='day'):
+    """The first day of every bucket between ``start`` and ``end`` inclusive."""
+    current = bucket_start(start, bucket)
+    result = []
+    while current <= end:
+        result.append(current)
+        current = _next_bucket(current, bucket)
+    return result
+
+def _as_date(value):
+    # SQLite returns date() as text, other databases as dates
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, str):
+        return date.fromisoformat(value[:10])
+    return value
+
+def series(date_column, value, start, end, bucket='day', where=(), name='value'):
+    """Sum ``value`` per bucket of ``date_column`` from ``start`` to ``end`` inclusive.
+    
+    ``date_column`` may be a Date or DateTime column; ``where`` adds criteria.
+    Returns ``[{'date': 'YYYY-MM-DD', name: total}]`` oldest first, with a
+    zero for each bucket without rows.
+    """
+    if bucket not in BUCKETS:
+        raise ValueError(f'Unknown bucket {bucket!r}; expected one of {", ".join(BUCKETS)}')
+    
+    is_datetime = isinstance(date_column.type, db.DateTime)
+    day = db.func.date(date_column) if is_datetime else date_column
+    if is_datetime:
+        # Compare the raw column so an index on it can serve the range
+        in_range = [date_column >= datetime.combine(start, time.min), date_column < datetime.combine(end + timedelta(days=1), time.min)]
+    else:
+        in_range = [date_column.between(start, end)]
+    query = db.select(day.label('day'), db.func.sum(value)).where(*in_range, *where).group_by(day)
+    
+    totals = dict.fromkeys(buckets(start, end, bucket), 0.0)
+    for row_day, total in db.session.execute(query):
+        if row_day is not None:
+            totals[bucket_start(_as_date(row_day), bucket)] += float(total or 0)
+    return [{'date': key.strftime('%Y-%m-%d'), name: total} for key, total in totals.items()]
+
+def payment_revenue(start, end, bucket='day'):
+    """Payments received per bucket, as ``[{'date': ..., 'revenue': ...}]``, cached until payments change."""
+    return cache.fetch(f'revenue:{bucket}:{start}:{end}', lambda: series(
+        Payment.payment_date, Payment.amount, start, end, bucket, name='revenue'
+    ), tags=('payments',))
\ No newline at end of file
@@ -0,0 +1,210 @@
+"""
+Cancellation backfill from the waitlist.
+
+Patients wait for a specific doctor, or for any doctor of a department,
+between two dates and optionally within a daily time window. When an
+appointment is cancelled (or deleted), the freed time is noted at flush and
+filled once the transaction has committed: waiting entries that fit are
+looked up through the ``(doctor_id | department, status, dates)`` indexes,
+best priority first and oldest first within a priority, so only entries that
+could take the slot are read. A 60-minute gap can be filled by several
+shorter entries.
+
+Entries marked ``auto_book`` are booked straight away. The others get an
+offer: the slot is held for them for ``WAITLIST_OFFER_SECONDS`` until staff
+accept or decline it, and a declined or expired offer moves on to the next
+candidate. Each freed slot is filled in a transaction of its own, and the
+doctor is only claimed once a candidate is found, so commits that cancel
+nothing do no extra work and a failed backfill never reaches the
+cancellation itself.
+"""
+
+from datetime import datetime, timezone
+from flask import current_app, has_app_context
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from app import db
+from app.models.appointment import Appointment, SlotHold, WaitlistEntry
+from app.models.staff import Staff
+from app.services.booking import BookingConflict, HoldExpired, confirm_hold, create_appointment, place_hold
+from app.services.scheduling import FREE_STATUSES, MINUTES_PER_DAY, from_minutes, to_minutes
+
+_FREED_KEY = 'waitlist_freed_slots'
+
+# Lower ranks are served first
+PRIORITY_RANK = {'urgent': 0, 'high': 1, 'medium': 2, 'low': 3}
+
+# Best matches read per lookup before the time window check
+CANDIDATE_LIMIT = 50
+
+def release_slot(doctor_id, day, start, duration, exclude=()):
+    """Note freed time to be offered to the waitlist when the session commits."""
+    slot = (doctor_id, day, start, duration, tuple(exclude))
+    db.session().info.setdefault(_FREED_KEY, []).append(slot)
+
+def candidates(doctor, day, start, end, exclude=()):
+    """Waiting entries that could take [start, end) with the doctor, best first."""
+    # Entries have to finish by midnight and within their own window
+    end = min(end, MINUTES_PER_DAY)
+    query = WaitlistEntry.query.filter(
+        db.or_(
+            WaitlistEntry.doctor_id == doctor.id,
+            db.and_(WaitlistEntry.doctor_id.is_(None), WaitlistEntry.department == doctor.department)
+        ),
+        WaitlistEntry.status == 'waiting',
+        WaitlistEntry.earliest_date <= day,
+        WaitlistEntry.latest_date >= day,
+        WaitlistEntry.duration <= end - start,
+        db.or_(WaitlistEntry.window_start.is_(None), WaitlistEntry.window_start <= from_minutes(start))
+    )
+    if exclude:
+        query = query.filter(WaitlistEntry.id.notin_(exclude))
+    query = query.order_by(
+        db.case(PRIORITY_RANK, value=WaitlistEntry.priority, else_=PRIORITY_RANK['medium']),
+        WaitlistEntry.created_at,
+        WaitlistEntry.id
+    )
+    return [
+        entry for entry in query.limit(CANDIDATE_LIMIT)
+        if entry.window_end is None or start + (entry.duration or 30) <= to_minutes(entry.window_end)
+    ]
+
+def _fill(entry, doctor_id, day, start):
+    slot_time = from_minutes(start)
+    duration = entry.duration or 30
+    if entry.auto_book:
+        appointment = create_appointment(
+            entry.patient_id, doctor_id, day, slot_time, entry.appointment_type, duration,
+            reason_for_visit=entry.reason_for_visit,
+            created_by=entry.created_by
+        )
+        entry.status = 'booked'
+        entry.appointment_id = appointment.id
+    else:
+        hold = place_hold(doctor_id, day, slot_time, duration, patient_id=entry.patient_id,
+                          user_id=entry.created_by, seconds=current_app.config['WAITLIST_OFFER_SECONDS'])
+        entry.status = 'offered'
+        entry.hold_token = hold.hold_token
+        entry.offer_expires_at = hold.expires_at
+
+def _has_started(day, start):
+    # Slots are in local time; hold and offer expiry times are UTC
+    slot = datetime.combine(day, from_minutes(start)).astimezone(timezone.utc).replace(tzinfo=None)
+    return slot <= datetime.utcnow()
+
+def fill_slot(doctor_id, day, start, duration, exclude=()):
+    """Book or offer freed time to the best waiting entries; returns those filled."""
+    doctor = db.session.get(Staff, doctor_id)
+    if doctor is None or _has_started(day, start):
+        return []
+    
+    filled = []
+    end = start + duration
+    while start < end:
+        matches = candidates(doctor, day, start, end, exclude)
+        if not matches:
+            break
+        entry = matches[0]
+        try:
+            _fill(entry, doctor_id, day, start)
+        except BookingConflict:
+            # Someone else took the time already
+            break
+        filled.append(entry)
+        start += entry.duration or 30
+    return filled
+
+def accept_offer(entry, user_id=None):
+    """Book an offered slot for the entry; the caller commits."""
+    if entry.status != 'offered':
+        raise HoldExpired('There is no open offer for this waitlist entry.')
+    appointment = confirm_hold(
+        entry.hold_token,
+        entry.appointment_type,
+        patient_id=entry.patient_id,
+        reason_for_visit=entry.reason_for_visit,
+        created_by=user_id or entry.created_by
+    )
+    entry.status = 'booked'
+    entry.appointment_id = appointment.id
+    entry.hold_token = None
+    entry.offer_expires_at = None
+    return appointment
+
+def _withdraw_offer(entry, status):
+    """Drop the entry's offer, passing the slot to the next candidate."""
+    hold = SlotHold.query.filter_by(hold_token=entry.hold_token).first() if entry.hold_token else None
+    if hold is not None:
+        db.session.delete(hold)
+        release_slot(hold.doctor_id, hold.appointment_date, to_minutes(hold.appointment_time),
+                     hold.duration or 30, exclude=[entry.id])
+    entry.status = status
+    entry.hold_token = None
+    entry.offer_expires_at = None
+
+def decline_offer(entry):
+    """Turn down an offer and keep waiting; the caller commits."""
+    if entry.status != 'offered':
+        raise HoldExpired('There is no open offer for this waitlist entry.')
+    _withdraw_offer(entry, 'waiting')
+
+def cancel_entry(entry):
+    """Take an entry off the waitlist; the caller commits."""
+    if entry.status in ('booked', 'cancelled'):
+        raise ValueError(f'Waitlist entry is already {entry.status}.')
+    _withdraw_offer(entry, 'cancelled')
+
+def expire_offers():
+    """Put entries with lapsed offers back to waiting and re-offer their slots."""
+    entries = WaitlistEntry.query.filter(
+        WaitlistEntry.offer_expires_at <= datetime.utcnow(),
+        WaitlistEntry.status == 'offered'
+    ).all()
+    for entry in entries:
+        _withdraw_offer(entry, 'waiting')
+    db.session.commit()
+    return len(entries)
+
+@event.listens_for(Session, 'after_flush')
+def _note_freed_slots(session, flush_context):
+    for target in list(session.dirty) + list(session.deleted):
+        if not isinstance(target, Appointment):
+            continue
+        history = inspect(target).attrs.status.history
+        if target in session.deleted:
+            previous = history.deleted[0] if history.deleted else target.status
+            freed = previous not in FREE_STATUSES
+        else:
+            # An unloaded previous status is assumed busy; filling re-checks availability anyway
+            previous = history.deleted or ()
+            freed = 'cancelled' in (history.added or ()) and not (previous and all(status in FREE_STATUSES for status in previous))
+        if freed:
+            slot = (target.doctor_id, target.appointment_date, to_minutes(target.appointment_time), target.duration or 30, ())
+            session.info.setdefault(_FREED_KEY, []).append(slot)
+
+@event.listens_for(Session, 'after_commit')
+def _fill_freed_slots(session):
+    freed = session.info.pop(_FREED_KEY, None)
+    if not freed or not has_app_context() or session is not db.session():
+        return
+    
+    # The committed session can't run SQL any more; a new app context has a session of its own
+    with current_app.app_context():
+        for slot in freed:
+            try:
+                fill_slot(*slot)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                current_app.logger.exception('Waitlist backfill failed for slot %s', slot)
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_freed_slots(session):
+    session.info.pop(_FREED_KEY, None)
+
+def init_app(app):
+    """Register the waitlist offer expiry command."""
+    @app.cli.command('waitlist-expire')
+    def waitlist_expire_command():
+        """Re-offer slots whose waitlist offers have lapsed."""
+        print(f'Expired {expire_offers()} waitlist offers.')
\ No newline at end of file
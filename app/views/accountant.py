@@ -3,6 +3,10 @@ from flask_login import login_required, current_user
 from app import db
 from app.models.billing import Bill, Payment, BillItem
 from app.models.patient import Patient
+from app.services.loading import BILL_ROWS, PAYMENT_ROWS
+from app.services.pagination import keyset_paginate
+from app.services import counters, timeseries
+from app.services.query_budget import query_budget
 from datetime import date, datetime, timedelta
 from sqlalchemy import func
 
@@ -10,6 +14,7 @@ accountant_bp = Blueprint('accountant', __name__)
 
 @accountant_bp.route('/dashboard')
 @login_required
+@query_budget(15)
 def dashboard():
     """Accountant dashboard."""
     if not current_user.can_manage_billing():
@@ -19,44 +24,28 @@ def dashboard():
     today = date.today()
     
     # Financial statistics
+    counts = counters.cached_values()
     stats = {
-        'total_bills': Bill.query.count(),
-        'pending_bills': Bill.query.filter(
-            Bill.status.in_(['pending', 'partially_paid'])
-        ).count(),
-        'overdue_bills': Bill.query.filter(
-            Bill.due_date < today,
-            Bill.status.in_(['pending', 'partially_paid'])
-        ).count(),
-        'today_revenue': db.session.query(func.sum(Payment.amount)).filter(
-            Payment.payment_date == today
-        ).scalar() or 0
+        'total_bills': counts['bills_total'],
+        'pending_bills': counts['bills_pending'],
+        'overdue_bills': counts['bills_overdue'],
+        'today_revenue': counts['payments_today']
     }
     
     # Recent bills
-    recent_bills = Bill.query.order_by(Bill.created_at.desc()).limit(10).all()
+    recent_bills = BILL_ROWS.apply(Bill.query).order_by(Bill.created_at.desc()).limit(10).all()
     
     # Recent payments
-    recent_payments = Payment.query.order_by(Payment.created_at.desc()).limit(10).all()
+    recent_payments = PAYMENT_ROWS.apply(Payment.query).order_by(Payment.created_at.desc()).limit(10).all()
     
     # Overdue bills
-    overdue_bills = Bill.query.filter(
+    overdue_bills = BILL_ROWS.apply(Bill.query).filter(
         Bill.due_date < today,
         Bill.status.in_(['pending', 'partially_paid'])
     ).order_by(Bill.due_date).limit(5).all()
     
     # Revenue chart data (last 7 days)
-    revenue_data = []
-    for i in range(7):
-        check_date = today - timedelta(days=i)
-        daily_revenue = db.session.query(func.sum(Payment.amount)).filter(
-            Payment.payment_date == check_date
-        ).scalar() or 0
-        revenue_data.append({
-            'date': check_date.strftime('%Y-%m-%d'),
-            'revenue': float(daily_revenue)
-        })
-    revenue_data.reverse()
+    revenue_data = timeseries.payment_revenue(today - timedelta(days=6), today)
     
     return render_template('accountant/dashboard.html',
                          stats=stats,
@@ -67,13 +56,14 @@ def dashboard():
 
 @accountant_bp.route('/bills')
 @login_required
+@query_budget(5)
 def manage_bills():
     """Manage bills."""
     if not current_user.can_manage_billing():
         flash('Access denied.', 'error')
         return redirect(url_for('main.dashboard'))
     
-    page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor', '', type=str)
     search = request.args.get('search', '', type=str)
     status_filter = request.args.get('status', '', type=str)
     
@@ -92,9 +82,7 @@ def manage_bills():
     if status_filter:
         query = query.filter(Bill.status == status_filter)
     
-    bills = query.order_by(Bill.created_at.desc()).paginate(
-        page=page, per_page=20, error_out=False
-    )
+    bills = keyset_paginate(BILL_ROWS.apply(query), Bill.created_at, cursor=cursor, per_page=20)
     
     return render_template('accountant/manage_bills.html',
                          bills=bills,
@@ -150,19 +138,23 @@ def create_bill():
             db.session.rollback()
             flash('Error creating bill. Please try again.', 'error')
     
-    # Get patients for dropdown
-    patients = Patient.query.filter(Patient.is_active == True).order_by(Patient.first_name).all()
-    return render_template('accountant/create_bill.html', patients=patients)
+    # The patient field is filled from /api/patients/options; only a preselected patient is loaded
+    selected_patient = None
+    patient_id = request.values.get('patient_id', type=int)
+    if patient_id:
+        selected_patient = Patient.query.get(patient_id)
+    return render_template('accountant/create_bill.html', selected_patient=selected_patient)
 
 @accountant_bp.route('/payments')
 @login_required
+@query_budget(5)
 def manage_payments():
     """Manage payments."""
     if not current_user.can_manage_billing():
         flash('Access denied.', 'error')
         return redirect(url_for('main.dashboard'))
     
-    page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor', '', type=str)
     date_filter = request.args.get('date', '', type=str)
     method_filter = request.args.get('method', '', type=str)
     
@@ -178,9 +170,7 @@ def manage_payments():
     if method_filter:
         query = query.filter(Payment.payment_method == method_filter)
     
-    payments = query.order_by(Payment.created_at.desc()).paginate(
-        page=page, per_page=20, error_out=False
-    )
+    payments = keyset_paginate(PAYMENT_ROWS.apply(query), Payment.created_at, cursor=cursor, per_page=20)
     
     return render_template('accountant/manage_payments.html',
                          payments=payments,
@@ -1,4 +1,4 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify
+from flask import Blueprint, current_app, render_template, redirect, url_for, flash, request, jsonify
 from flask_login import login_required, current_user
 from app import db
 from app.models.user import User
@@ -7,6 +7,12 @@ from app.models.appointment import Appointment
 from app.models.staff import Staff, AttendanceRecord
 from app.models.billing import Bill, Payment
 from app.models.inventory import InventoryItem
+from app.models.monitoring import SlowQuery
+from app.services.loading import APPOINTMENT_ROWS, STAFF_ROWS
+from app.services.pagination import keyset_paginate
+from app.services.profiler import PROFILE_COOKIE
+from app.services import cache, counters, stats, timeseries
+from app.services.query_budget import query_budget
 from datetime import date, datetime, timedelta
 from sqlalchemy import func
 
@@ -24,42 +30,28 @@ def admin_required(f):
 
 @admin_bp.route('/dashboard')
 @login_required
+@query_budget(20)
 @admin_required
 def dashboard():
     """Admin dashboard with system overview."""
     today = date.today()
     
     # Get basic statistics
+    counts = counters.cached_values()
     stats = {
-        'total_patients': Patient.query.filter(Patient.is_active == True).count(),
-        'total_staff': Staff.query.filter(Staff.is_active == True).count(),
-        'total_appointments_today': Appointment.query.filter(
-            Appointment.appointment_date == today
-        ).count(),
-        'pending_bills': Bill.query.filter(
-            Bill.status.in_(['pending', 'partially_paid'])
-        ).count(),
-        'low_stock_items': InventoryItem.query.filter(
-            InventoryItem.current_stock <= InventoryItem.minimum_stock,
-            InventoryItem.is_active == True
-        ).count()
+        'total_patients': counts['patients_active'],
+        'total_staff': counts['staff_active'],
+        'total_appointments_today': counts['appointments_today'],
+        'pending_bills': counts['bills_pending'],
+        'low_stock_items': counts['items_low_stock']
     }
     
     # Recent activities
     recent_patients = Patient.query.order_by(Patient.created_at.desc()).limit(5).all()
-    recent_appointments = Appointment.query.order_by(Appointment.created_at.desc()).limit(5).all()
-    
-    # Revenue data for chart
-    revenue_data = []
-    for i in range(7):
-        date_check = today - timedelta(days=i)
-        daily_revenue = db.session.query(func.sum(Payment.amount)).filter(
-            func.date(Payment.payment_date) == date_check
-        ).scalar() or 0
-        revenue_data.append({
-            'date': date_check.strftime('%Y-%m-%d'),
-            'revenue': float(daily_revenue)
-        })
+    recent_appointments = APPOINTMENT_ROWS.apply(Appointment.query).order_by(Appointment.created_at.desc()).limit(5).all()
+    
+    # Revenue data for chart, newest first
+    revenue_data = timeseries.payment_revenue(today - timedelta(days=6), today)[::-1]
     
     return render_template('admin/dashboard.html', 
                          stats=stats, 
@@ -69,10 +61,11 @@ def dashboard():
 
 @admin_bp.route('/users')
 @login_required
+@query_budget(5)
 @admin_required
 def manage_users():
     """Manage system users."""
-    page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor', '', type=str)
     search = request.args.get('search', '', type=str)
     role_filter = request.args.get('role', '', type=str)
     
@@ -89,9 +82,7 @@ def manage_users():
     if role_filter:
         query = query.filter(User.role == role_filter)
     
-    users = query.order_by(User.created_at.desc()).paginate(
-        page=page, per_page=20, error_out=False
-    )
+    users = keyset_paginate(query, User.created_at, cursor=cursor, per_page=20)
     
     return render_template('admin/manage_users.html', users=users, search=search, role_filter=role_filter)
 
@@ -128,10 +119,11 @@ def toggle_user_status(id):
 
 @admin_bp.route('/staff')
 @login_required
+@query_budget(6)
 @admin_required
 def manage_staff():
     """Manage hospital staff."""
-    page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor', '', type=str)
     search = request.args.get('search', '', type=str)
     department_filter = request.args.get('department', '', type=str)
     
@@ -150,9 +142,7 @@ def manage_staff():
     if department_filter:
         query = query.filter(Staff.department == department_filter)
     
-    staff = query.order_by(Staff.created_at.desc()).paginate(
-        page=page, per_page=20, error_out=False
-    )
+    staff = keyset_paginate(STAFF_ROWS.apply(query), Staff.created_at, cursor=cursor, per_page=20)
     
     # Get unique departments for filter
     departments = db.session.query(Staff.department).distinct().all()
@@ -166,6 +156,7 @@ def manage_staff():
 
 @admin_bp.route('/staff/<int:id>')
 @login_required
+@query_budget(8)
 @admin_required
 def view_staff(id):
     """View staff member details."""
@@ -179,7 +170,7 @@ def view_staff(id):
     # Get upcoming appointments (if doctor)
     upcoming_appointments = []
     if staff.user.role == 'doctor':
-        upcoming_appointments = staff.appointments.filter(
+        upcoming_appointments = APPOINTMENT_ROWS.apply(staff.appointments).filter(
             Appointment.appointment_date >= date.today(),
             Appointment.status.in_(['scheduled', 'confirmed'])
         ).order_by(Appointment.appointment_date, Appointment.appointment_time).limit(10).all()
@@ -254,6 +245,7 @@ def add_staff():
 
 @admin_bp.route('/reports')
 @login_required
+@query_budget(6)
 @admin_required
 def reports():
     """System reports and analytics."""
@@ -270,62 +262,59 @@ def reports():
     
     start_date_obj = datetime.strptime(start_date, '%Y-%m-%d').date()
     end_date_obj = datetime.strptime(end_date, '%Y-%m-%d').date()
+    bucket = request.args.get('bucket', 'day')
+    if bucket not in timeseries.BUCKETS:
+        bucket = 'day'
+    
+    # Patient, appointment and revenue figures in one statement
+    figures = cache.fetch(f'admin_report:{start_date_obj}:{end_date_obj}', lambda: stats.aggregate({
+        Patient: {
+            'total_registered': stats.count(),
+            'by_gender': stats.count_by(Patient.gender)
+        },
+        Appointment: {
+            'total_appointments': stats.count(),
+            'by_status': stats.count_by(Appointment.status),
+            'by_type': stats.count_by(Appointment.appointment_type)
+        },
+        Payment: {
+            'total_revenue': stats.total(Payment.amount),
+            'total_payments': stats.count()
+        }
+    }, where={
+        Patient: [Patient.created_at.between(start_date_obj, end_date_obj + timedelta(days=1))],
+        Appointment: [Appointment.appointment_date.between(start_date_obj, end_date_obj)],
+        Payment: [Payment.payment_date.between(start_date_obj, end_date_obj)]
+    }), tags=('patients', 'appointments', 'payments'))
     
     # Patient statistics
     patient_stats = {
-        'total_registered': Patient.query.filter(
-            Patient.created_at.between(start_date_obj, end_date_obj + timedelta(days=1))
-        ).count(),
-        'by_gender': db.session.query(
-            Patient.gender, func.count(Patient.id)
-        ).filter(
-            Patient.created_at.between(start_date_obj, end_date_obj + timedelta(days=1))
-        ).group_by(Patient.gender).all()
+        'total_registered': figures['total_registered'],
+        'by_gender': [(gender, total) for gender, total in figures['by_gender'].items() if total]
     }
     
     # Appointment statistics
     appointment_stats = {
-        'total_appointments': Appointment.query.filter(
-            Appointment.appointment_date.between(start_date_obj, end_date_obj)
-        ).count(),
-        'by_status': db.session.query(
-            Appointment.status, func.count(Appointment.id)
-        ).filter(
-            Appointment.appointment_date.between(start_date_obj, end_date_obj)
-        ).group_by(Appointment.status).all(),
-        'by_type': db.session.query(
-            Appointment.appointment_type, func.count(Appointment.id)
-        ).filter(
-            Appointment.appointment_date.between(start_date_obj, end_date_obj)
-        ).group_by(Appointment.appointment_type).all()
+        'total_appointments': figures['total_appointments'],
+        'by_status': [(status, total) for status, total in figures['by_status'].items() if total],
+        'by_type': [(kind, total) for kind, total in figures['by_type'].items() if total]
     }
     
     # Revenue statistics
-    revenue_stats = db.session.query(
-        func.sum(Payment.amount).label('total_revenue'),
-        func.count(Payment.id).label('total_payments')
-    ).filter(
-        Payment.payment_date.between(start_date_obj, end_date_obj)
-    ).first()
-    
-    # Daily revenue for chart
-    daily_revenue = []
-    current_date = start_date_obj
-    while current_date <= end_date_obj:
-        day_revenue = db.session.query(func.sum(Payment.amount)).filter(
-            Payment.payment_date == current_date
-        ).scalar() or 0
-        daily_revenue.append({
-            'date': current_date.strftime('%Y-%m-%d'),
-            'revenue': float(day_revenue)
-        })
-        current_date += timedelta(days=1)
+    revenue_stats = {
+        'total_revenue': figures['total_revenue'],
+        'total_payments': figures['total_payments']
+    }
+    
+    # Revenue for chart, per day, week or month
+    daily_revenue = timeseries.payment_revenue(start_date_obj, end_date_obj, bucket)
     
     return render_template('admin/reports.html',
                          patient_stats=patient_stats,
                          appointment_stats=appointment_stats,
                          revenue_stats=revenue_stats,
                          daily_revenue=daily_revenue,
+                         bucket=bucket,
                          start_date=start_date,
                          end_date=end_date)
 
@@ -347,8 +336,49 @@ def backup_system():
 
 @admin_bp.route('/logs')
 @login_required
+@query_budget(6)
 @admin_required
 def view_logs():
-    """View system logs."""
-    # In a real application, you would implement log viewing
-    return render_template('admin/logs.html')
\ No newline at end of file
+    """Browse the slow query log."""
+    cursor = request.args.get('cursor', '', type=str)
+    endpoint_filter = request.args.get('route', '', type=str)
+    min_ms = request.args.get('min_ms', 0, type=float)
+    
+    query = SlowQuery.query
+    if endpoint_filter:
+        query = query.filter(SlowQuery.endpoint == endpoint_filter)
+    if min_ms:
+        query = query.filter(SlowQuery.duration_ms >= min_ms)
+    
+    entries = keyset_paginate(query, SlowQuery.recorded_at, cursor=cursor, per_page=50)
+    
+    # Endpoints with slow queries, worst first
+    endpoints = db.session.query(
+        SlowQuery.endpoint,
+        func.count(SlowQuery.id),
+        func.max(SlowQuery.duration_ms),
+        func.avg(SlowQuery.duration_ms)
+    ).group_by(SlowQuery.endpoint).order_by(func.max(SlowQuery.duration_ms).desc()).limit(20).all()
+    
+    return render_template('admin/logs.html',
+                         entries=entries,
+                         endpoints=endpoints,
+                         endpoint_filter=endpoint_filter,
+                         min_ms=min_ms,
+                         threshold=current_app.config['SLOW_QUERY_MS'],
+                         keep_days=current_app.config['SLOW_QUERY_KEEP_DAYS'],
+                         profiling=request.cookies.get(PROFILE_COOKIE) == '1')
+
+@admin_bp.route('/profiler', methods=['POST'])
+@login_required
+@admin_required
+def toggle_profiler():
+    """Turn request profiling on or off for this browser."""
+    response = redirect(url_for('admin.view_logs'))
+    if request.form.get('enable') == '1':
+        response.set_cookie(PROFILE_COOKIE, '1', max_age=8 * 3600, httponly=True, samesite='Lax', secure=request.is_secure)
+        flash('Request profiling enabled for this browser.', 'info')
+    else:
+        response.delete_cookie(PROFILE_COOKIE)
+        flash('Request profiling disabled.', 'info')
+    return response
\ No newline at end of file
@@ -2,16 +2,52 @@ from flask import Blueprint, jsonify, request
 from flask_login import login_required, current_user
 from app import db
 from app.models.patient import Patient
-from app.models.appointment import Appointment
+from app.models.appointment import Appointment, WaitlistEntry
 from app.models.staff import Staff
+from app.models.user import User
 from app.models.billing import Bill
 from app.models.inventory import InventoryItem
+from app.services.patient_search import filter_patients, search_patients as find_patients
+from app.services.autocomplete import suggest
+from app.services.loading import APPOINTMENT_DICT, BILL_DICT, WAITLIST_DICT
+from app.services.pagination import keyset_paginate, stream_page
+from app.services.scheduling import availability_matrix, first_available, format_minutes, slots_for_doctors, to_minutes
+from app.services.booking_batch import apply_batch
+from app.services.recurrence import MAX_OCCURRENCES, book_series, expand_dates, plan_series
+from app.services.waitlist import accept_offer, cancel_entry, decline_offer
+from app.services import cache, counters, timeseries
+from app.services.booking import check_available, confirm_hold, find_conflicts, hold_slot, release_hold, BookingConflict, HoldExpired
+from app.services.query_budget import query_budget
 from datetime import date, datetime, timedelta
 
 api_bp = Blueprint('api', __name__)
 
+# Longest date range served by the appointment calendar
+CALENDAR_MAX_DAYS = 31
+
+# Furthest ahead and most results of a first-available search
+FIRST_AVAILABLE_MAX_DAYS = 60
+FIRST_AVAILABLE_MAX_RESULTS = 50
+
+# Most operations accepted by one appointment batch
+BATCH_MAX_OPERATIONS = 1000
+
+def _bookable_doctors(department='', specialization=''):
+    """Active, available doctors, optionally of one department or specialization."""
+    doctors = Staff.query.join(User, Staff.user_id == User.id).filter(
+        User.role == 'doctor',
+        Staff.is_active == True,
+        Staff.is_available == True
+    )
+    if department:
+        doctors = doctors.filter(Staff.department == department)
+    if specialization:
+        doctors = doctors.filter(Staff.specialization == specialization)
+    return doctors.order_by(Staff.first_name, Staff.last_name).all()
+
 @api_bp.route('/patients/search')
 @login_required
+@query_budget(4)
 def search_patients():
     """Search patients by name, ID, or phone."""
     if not current_user.can_manage_patients():
@@ -21,52 +57,138 @@ def search_patients():
     if len(query) < 2:
         return jsonify({'patients': []})
     
-    patients = Patient.query.filter(
-        db.or_(
-            Patient.first_name.ilike(f'%{query}%'),
-            Patient.last_name.ilike(f'%{query}%'),
-            Patient.patient_id.ilike(f'%{query}%'),
-            Patient.phone.ilike(f'%{query}%')
-        ),
-        Patient.is_active == True
-    ).limit(10).all()
+    patients = find_patients(query, limit=10, fuzzy=True)
     
     return jsonify({
         'patients': [patient.to_dict() for patient in patients]
     })
 
+@api_bp.route('/autocomplete/<kind>')
+@login_required
+@query_budget(4)
+def autocomplete(kind):
+    """Suggest patients or staff by name, ID, or phone prefix."""
+    if kind == 'patients':
+        allowed = current_user.can_manage_patients() or current_user.can_manage_billing()
+        source = 'patient'
+    elif kind == 'staff':
+        allowed = current_user.can_manage_appointments() or current_user.can_manage_staff()
+        source = 'staff'
+    else:
+        return jsonify({'error': 'Unknown autocomplete type'}), 404
+    
+    if not allowed:
+        return jsonify({'error': 'Access denied'}), 403
+    
+    query = request.args.get('q', '').strip()
+    limit = min(request.args.get('limit', 10, type=int), 50)
+    if len(query) < 2:
+        return jsonify({'results': []})
+    
+    return jsonify({
+        'results': [{'id': record_id, 'label': label} for record_id, label in suggest(source, query, limit)]
+    })
+
+@api_bp.route('/patients/options')
+@login_required
+@query_budget(4)
+def patient_options():
+    """Page through active patients for selection fields."""
+    if not (current_user.can_manage_patients() or current_user.can_manage_billing()):
+        return jsonify({'error': 'Access denied'}), 403
+    
+    query = filter_patients(Patient.query.filter(Patient.is_active == True), request.args.get('q', ''))
+    patients = keyset_paginate(query, Patient.first_name, Patient.last_name, descending=False,
+                               cursor=request.args.get('cursor', '', type=str),
+                               per_page=request.args.get('per_page', 20, type=int), total=None)
+    
+    return stream_page(patients, 'results', lambda patient: {
+        'id': patient.id,
+        'label': f'{patient.full_name} ({patient.patient_id})'
+    })
+
+@api_bp.route('/doctors/options')
+@login_required
+@query_budget(4)
+def doctor_options():
+    """Page through available doctors for selection fields."""
+    if not current_user.can_manage_appointments():
+        return jsonify({'error': 'Access denied'}), 403
+    
+    query = Staff.query.join(User, Staff.user_id == User.id).filter(
+        User.role == 'doctor',
+        Staff.is_active == True,
+        Staff.is_available == True
+    )
+    
+    search = request.args.get('q', '').strip()
+    if search:
+        query = query.filter(
+            db.or_(
+                Staff.first_name.ilike(f'{search}%'),
+                Staff.last_name.ilike(f'{search}%'),
+                Staff.department.ilike(f'{search}%')
+            )
+        )
+    
+    doctors = keyset_paginate(query, Staff.first_name, Staff.last_name, descending=False,
+                              cursor=request.args.get('cursor', '', type=str),
+                              per_page=request.args.get('per_page', 20, type=int), total=None)
+    
+    return stream_page(doctors, 'results', lambda doctor: {
+        'id': doctor.id,
+        'label': f'{doctor.full_name} - {doctor.department}'
+    })
+
 @api_bp.route('/doctors/available')
 @login_required
+@query_budget(5)
 def available_doctors():
-    """Get available doctors for appointment booking."""
+    """Get available doctors for appointment booking.
+    
+    Takes a date plus either one ``time`` or a ``start``/``end``/``step`` range
+    of slot times, and answers with a doctor x slot availability matrix.
+    """
     if not current_user.can_manage_appointments():
         return jsonify({'error': 'Access denied'}), 403
     
     date_str = request.args.get('date')
     time_str = request.args.get('time')
+    duration = request.args.get('duration', 30, type=int)
+    step = request.args.get('step', type=int) or duration
+    department = request.args.get('department', '')
+    
+    if not duration or duration <= 0 or step <= 0:
+        return jsonify({'error': 'Duration and step must be positive minutes'}), 400
     
     try:
         appointment_date = datetime.strptime(date_str, '%Y-%m-%d').date()
-        appointment_time = datetime.strptime(time_str, '%H:%M').time()
+        if time_str:
+            starts = [to_minutes(time_str)]
+        else:
+            range_start = to_minutes(request.args.get('start', ''))
+            range_end = to_minutes(request.args.get('end', ''))
+            starts = list(range(range_start, range_end - duration + 1, step))
     except (ValueError, TypeError):
         return jsonify({'error': 'Invalid date or time format'}), 400
     
-    # Get all doctors
-    doctors = Staff.query.filter(
-        Staff.user.has(role='doctor'),
-        Staff.is_active == True,
-        Staff.is_available == True
-    ).all()
+    if not starts or len(starts) > 288:
+        return jsonify({'error': 'Time range must contain between 1 and 288 slots'}), 400
+    
+    doctors = _bookable_doctors(department)
     
-    available_doctors = []
-    for doctor in doctors:
-        if doctor.is_available_at(appointment_date, appointment_time):
-            available_doctors.append(doctor.to_dict())
+    # One appointment query for every doctor, then in-memory interval checks
+    matrix = availability_matrix([doctor.id for doctor in doctors], appointment_date, starts, duration)
     
-    return jsonify({'doctors': available_doctors})
+    return jsonify({
+        'doctors': [doctor.to_dict() for doctor in doctors if any(matrix[doctor.id])],
+        'slots': [format_minutes(start) for start in starts],
+        'matrix': {str(doctor.id): matrix[doctor.id] for doctor in doctors}
+    })
 
 @api_bp.route('/appointments/slots')
 @login_required
+@query_budget(5)
 def available_slots():
     """Get available time slots for a doctor on a specific date."""
     if not current_user.can_manage_appointments():
@@ -74,10 +196,15 @@ def available_slots():
     
     doctor_id = request.args.get('doctor_id', type=int)
     date_str = request.args.get('date')
+    duration = request.args.get('duration', 30, type=int)
+    granularity = request.args.get('granularity', type=int)
     
     if not doctor_id or not date_str:
         return jsonify({'error': 'Doctor ID and date are required'}), 400
     
+    if not duration or duration <= 0 or (granularity is not None and granularity <= 0):
+        return jsonify({'error': 'Duration and granularity must be positive minutes'}), 400
+    
     try:
         appointment_date = datetime.strptime(date_str, '%Y-%m-%d').date()
     except ValueError:
@@ -88,98 +215,545 @@ def available_slots():
     if not doctor or doctor.user.role != 'doctor':
         return jsonify({'error': 'Doctor not found'}), 404
     
-    slots = Appointment.get_available_slots(doctor_id, appointment_date)
+    slots = Appointment.get_available_slots(doctor_id, appointment_date, duration, granularity)
     return jsonify({'slots': slots})
 
+@api_bp.route('/appointments/calendar')
+@login_required
+@query_budget(5)
+def appointment_calendar():
+    """Free slots for every doctor of a department or specialization over a date range."""
+    if not current_user.can_manage_appointments():
+        return jsonify({'error': 'Access denied'}), 403
+    
+    department = request.args.get('department', '')
+    specialization = request.args.get('specialization', '')
+    duration = request.args.get('duration', 30, type=int)
+    granularity = request.args.get('granularity', type=int)
+    
+    if not department and not specialization:
+        return jsonify({'error': 'Department or specialization is required'}), 400
+    
+    if not duration or duration <= 0 or (granularity is not None and granularity <= 0):
+        return jsonify({'error': 'Duration and granularity must be positive minutes'}), 400
+    
+    try:
+        start_date = datetime.strptime(request.args.get('start', ''), '%Y-%m-%d').date()
+        end_str = request.args.get('end')
+        end_date = datetime.strptime(end_str, '%Y-%m-%d').date() if end_str else start_date + timedelta(days=6)
+    except ValueError:
+        return jsonify({'error': 'Invalid date format'}), 400
+    
+    if end_date < start_date or (end_date - start_date).days >= CALENDAR_MAX_DAYS:
+        return jsonify({'error': f'Date range must cover 1 to {CALENDAR_MAX_DAYS} days'}), 400
+    
+    doctors = _bookable_doctors(department, specialization)
+    
+    # One range query for all appointments, grouped per doctor and day in memory
+    slots = slots_for_doctors([doctor.id for doctor in doctors], start_date, end_date, duration, granularity)
+    days = sorted({day for per_day in slots.values() for day in per_day})
+    
+    return jsonify({
+        'days': [day.isoformat() for day in days],
+        'doctors': [{
+            'id': doctor.id,
+            'name': doctor.full_name,
+            'department': doctor.department,
+            'specialization': doctor.specialization,
+            'slots': {
+                day.isoformat(): [format_minutes(start) for start in starts]
+                for day, starts in slots[doctor.id].items()
+            }
+        } for doctor in doctors]
+    })
+
+@api_bp.route('/appointments/first-available')
+@login_required
+@query_budget(2 + 2 * FIRST_AVAILABLE_MAX_DAYS, repeats=FIRST_AVAILABLE_MAX_DAYS)
+def first_available_slots():
+    """Earliest free slots with any doctor of a department or specialization."""
+    if not current_user.can_manage_appointments():
+        return jsonify({'error': 'Access denied'}), 403
+    
+    department = request.args.get('department', '')
+    specialization = request.args.get('specialization', '')
+    duration = request.args.get('duration', 30, type=int)
+    granularity = request.args.get('granularity', type=int)
+    limit = request.args.get('limit', 5, type=int)
+    days = request.args.get('days', 14, type=int)
+    
+    if not department and not specialization:
+        return jsonify({'error': 'Department or specialization is required'}), 400
+    
+    if not duration or duration <= 0 or (granularity is not None and granularity <= 0):
+        return jsonify({'error': 'Duration and granularity must be positive minutes'}), 400
+    
+    if not 1 <= limit <= FIRST_AVAILABLE_MAX_RESULTS or not 1 <= days <= FIRST_AVAILABLE_MAX_DAYS:
+        return jsonify({'error': f'Limit must be 1 to {FIRST_AVAILABLE_MAX_RESULTS} '
+                                 f'and days 1 to {FIRST_AVAILABLE_MAX_DAYS}'}), 400
+    
+    # Search from now by default; from midnight for a later start date
+    now = datetime.now()
+    try:
+        start_str = request.args.get('start')
+        start_date = datetime.strptime(start_str, '%Y-%m-%d').date() if start_str else now.date()
+        time_str = request.args.get('time')
+        if time_str:
+            not_before = to_minutes(time_str)
+        else:
+            not_before = to_minutes(now.time()) + 1 if start_date == now.date() else 0
+    except ValueError:
+        return jsonify({'error': 'Invalid date or time format'}), 400
+    
+    doctors = {doctor.id: doctor for doctor in _bookable_doctors(department, specialization)}
+    
+    slots = first_available(doctors, start_date, duration, limit, granularity, days, not_before)
+    
+    return jsonify({
+        'slots': [{
+            'date': day.isoformat(),
+            'time': format_minutes(start),
+            'doctor_id': doctor_id,
+            'doctor_name': doctors[doctor_id].full_name,
+            'department': doctors[doctor_id].department
+        } for day, start, doctor_id in slots]
+    })
+
+@api_bp.route('/appointments/conflicts')
+@login_required
+@query_budget(4)
+def appointment_conflicts():
+    """List appointments that would overlap a proposed booking."""
+    if not current_user.can_manage_appointments():
+        return jsonify({'error': 'Access denied'}), 403
+    
+    doctor_id = request.args.get('doctor_id', type=int)
+    duration = request.args.get('duration', 30, type=int)
+    exclude_id = request.args.get('exclude', type=int)
+    
+    try:
+        appointment_date = datetime.strptime(request.args.get('date', ''), '%Y-%m-%d').date()
+        appointment_time = datetime.strptime(request.args.get('time', ''), '%H:%M').time()
+    except ValueError:
+        return jsonify({'error': 'Invalid date or time format'}), 400
+    
+    if not doctor_id or not duration or duration <= 0:
+        return jsonify({'error': 'Doctor ID and a positive duration are required'}), 400
+    
+    conflicts = find_conflicts(doctor_id, appointment_date, appointment_time, duration, exclude_id)
+    return jsonify({
+        'available': not conflicts,
+        'conflicts': [appointment.to_dict() for appointment in APPOINTMENT_DICT.load(conflicts)]
+    })
+
+@api_bp.route('/appointments/batch', methods=['POST'])
+@login_required
+@query_budget(repeats=BATCH_MAX_OPERATIONS)
+def appointment_batch():
+    """Create, move and cancel many appointments in one transaction.
+    
+    Takes ``{"operations": [...], "atomic": false}``; with ``atomic`` nothing
+    is written unless every operation can be applied. Where INSERT ...
+    RETURNING isn't batched (SQLite) each created appointment is its own
+    INSERT, hence the repeat limit of one per operation.
+    """
+    if not current_user.can_manage_appointments():
+        return jsonify({'error': 'Access denied'}), 403
+    
+    data = request.get_json(silent=True) or {}
+    operations = data.get('operations')
+    if not isinstance(operations, list) or not 1 <= len(operations) <= BATCH_MAX_OPERATIONS:
+        return jsonify({'error': f'Between 1 and {BATCH_MAX_OPERATIONS} operations are required'}), 400
+    
+    try:
+        results, applied = apply_batch(operations, user_id=current_user.id, atomic=bool(data.get('atomic')))
+    except BookingConflict as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 409
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'Failed to apply appointment batch'}), 500
+    
+    failed = sum(1 for result in results if result['status'] == 'error')
+    return jsonify({'applied': applied, 'failed': failed, 'results': results}), 409 if failed and not applied else 200
+
+@api_bp.route('/appointments/series', methods=['POST'])
+@login_required
+@query_budget(20 + MAX_OCCURRENCES, repeats=MAX_OCCURRENCES)
+def create_appointment_series():
+    """Book a daily, weekly or biweekly series of appointments.
+    
+    Clashing occurrences are skipped (or, with ``atomic``, fail the whole
+    series) and reported with alternative times; ``dry_run`` only reports.
+    Where INSERT ... RETURNING isn't batched (SQLite) each occurrence is its
+    own INSERT, hence a budget that grows with the longest series.
+    """
+    if not current_user.can_manage_appointments():
+        return jsonify({'error': 'Access denied'}), 403
+    
+    data = request.get_json(silent=True) or {}
+    patient_id = data.get('patient_id')
+    doctor_id = data.get('doctor_id')
+    appointment_type = data.get('appointment_type')
+    duration = data.get('duration', 30)
+    count = data.get('count')
+    
+    try:
+        start_date = datetime.strptime(data.get('start_date', ''), '%Y-%m-%d').date()
+        appointment_time = datetime.strptime(data.get('time', ''), '%H:%M').time()
+        until = datetime.strptime(data['until'], '%Y-%m-%d').date() if data.get('until') else None
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid date or time format'}), 400
+    
+    if not all(isinstance(value, int) for value in (patient_id, doctor_id, duration)) or duration <= 0:
+        return jsonify({'error': 'Patient ID, doctor ID and a positive duration are required'}), 400
+    if count is not None and (not isinstance(count, int) or count <= 0):
+        return jsonify({'error': 'Count must be a positive number'}), 400
+    if not appointment_type:
+        return jsonify({'error': 'Appointment type is required'}), 400
+    
+    patient = Patient.query.get(patient_id)
+    doctor = Staff.query.get(doctor_id)
+    if not patient or not doctor:
+        return jsonify({'error': 'Invalid patient or doctor selected'}), 404
+    
+    try:
+        if data.get('dry_run'):
+            dates = expand_dates(start_date, data.get('frequency'), count, until)
+            free_dates, clashes = plan_series(doctor_id, dates, appointment_time, duration)
+            return jsonify({'bookable': [day.isoformat() for day in free_dates], 'clashes': clashes})
+        
+        series, appointments, clashes = book_series(
+            patient_id, doctor_id, start_date, appointment_time, appointment_type,
+            data.get('frequency'), count, until, duration,
+            atomic=bool(data.get('atomic')),
+            reason_for_visit=data.get('reason_for_visit', ''),
+            created_by=current_user.id
+        )
+        if series is None:
+            db.session.rollback()
+            return jsonify({'error': 'Doctor is not available for every occurrence', 'clashes': clashes}), 409
+        
+        # Serialized before commit expires the rows
+        result = {
+            'series': series.to_dict(),
+            'appointments': [{
+                'id': appointment.id,
+                'appointment_id': appointment.appointment_id,
+                'appointment_date': appointment.appointment_date.isoformat()
+            } for appointment in appointments],
+            'clashes': clashes
+        }
+        db.session.commit()
+    except BookingConflict as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 409
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify(result), 201
+
+@api_bp.route('/appointments/holds', methods=['POST'])
+@login_required
+@query_budget(10)
+def create_slot_hold():
+    """Hold a slot for a short while before booking it."""
+    if not current_user.can_manage_appointments():
+        return jsonify({'error': 'Access denied'}), 403
+    
+    data = request.get_json(silent=True) or {}
+    doctor_id = data.get('doctor_id')
+    patient_id = data.get('patient_id')
+    duration = data.get('duration', 30)
+    
+    try:
+        appointment_date = datetime.strptime(data.get('date', ''), '%Y-%m-%d').date()
+        appointment_time = datetime.strptime(data.get('time', ''), '%H:%M').time()
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid date or time format'}), 400
+    
+    if not isinstance(doctor_id, int) or not isinstance(duration, int) or duration <= 0:
+        return jsonify({'error': 'Doctor ID and a positive duration are required'}), 400
+    
+    try:
+        hold = hold_slot(doctor_id, appointment_date, appointment_time, duration,
+                         patient_id=patient_id, user_id=current_user.id)
+    except BookingConflict as e:
+        return jsonify({'error': str(e), 'conflicts': [c.appointment_id for c in e.conflicts]}), 409
+    
+    return jsonify(hold.to_dict()), 201
+
+@api_bp.route('/appointments/holds/<hold_token>/confirm', methods=['POST'])
+@login_required
+@query_budget(16)
+def confirm_slot_hold(hold_token):
+    """Turn a slot hold into an appointment."""
+    if not current_user.can_manage_appointments():
+        return jsonify({'error': 'Access denied'}), 403
+    
+    data = request.get_json(silent=True) or {}
+    appointment_type = data.get('appointment_type')
+    if not appointment_type:
+        return jsonify({'error': 'Appointment type is required'}), 400
+    
+    try:
+        appointment = confirm_hold(
+            hold_token,
+            appointment_type,
+            patient_id=data.get('patient_id'),
+            reason_for_visit=data.get('reason_for_visit', ''),
+            created_by=current_user.id
+        )
+        db.session.commit()
+    except HoldExpired as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 410
+    except BookingConflict as e:
+        db.session.rollback()
+        return jsonify({'error': str(e), 'conflicts': [c.appointment_id for c in e.conflicts]}), 409
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify({'success': True, 'appointment': appointment.to_dict()}), 201
+
+@api_bp.route('/appointments/holds/<hold_token>', methods=['DELETE'])
+@login_required
+@query_budget(4)
+def release_slot_hold(hold_token):
+    """Release a slot hold."""
+    if not current_user.can_manage_appointments():
+        return jsonify({'error': 'Access denied'}), 403
+    
+    if not release_hold(hold_token):
+        return jsonify({'error': 'Hold not found'}), 404
+    return jsonify({'success': True})
+
+@api_bp.route('/waitlist')
+@login_required
+@query_budget(5)
+def waitlist_entries():
+    """List waitlist entries, oldest first."""
+    if not current_user.can_manage_appointments():
+        return jsonify({'error': 'Access denied'}), 403
+    
+    query = WaitlistEntry.query.filter(WaitlistEntry.status == request.args.get('status', 'waiting'))
+    doctor_id = request.args.get('doctor_id', type=int)
+    department = request.args.get('department', '')
+    if doctor_id:
+        query = query.filter(WaitlistEntry.doctor_id == doctor_id)
+    if department:
+        query = query.filter(WaitlistEntry.department == department)
+    
+    entries = keyset_paginate(WAITLIST_DICT.apply(query), WaitlistEntry.created_at, descending=False,
+                              cursor=request.args.get('cursor', '', type=str),
+                              per_page=request.args.get('per_page', 20, type=int))
+    
+    return jsonify({
+        'entries': [entry.to_dict() for entry in entries],
+        'pagination': entries.to_dict()
+    })
+
+@api_bp.route('/waitlist', methods=['POST'])
+@login_required
+def add_waitlist_entry():
+    """Put a patient on the waitlist for a doctor or a department."""
+    if not current_user.can_manage_appointments():
+        return jsonify({'error': 'Access denied'}), 403
+    
+    data = request.get_json(silent=True) or {}
+    patient = Patient.query.get(data.get('patient_id') or 0)
+    doctor = Staff.query.get(data['doctor_id']) if data.get('doctor_id') else None
+    department = doctor.department if doctor else data.get('department', '')
+    duration = data.get('duration', 30)
+    priority = data.get('priority', 'medium')
+    
+    if not patient or (data.get('doctor_id') and not doctor):
+        return jsonify({'error': 'Invalid patient or doctor selected'}), 404
+    if not department:
+        return jsonify({'error': 'Doctor or department is required'}), 400
+    if not data.get('appointment_type'):
+        return jsonify({'error': 'Appointment type is required'}), 400
+    if not isinstance(duration, int) or duration <= 0:
+        return jsonify({'error': 'Duration must be a positive number of minutes'}), 400
+    if priority not in ('low', 'medium', 'high', 'urgent'):
+        return jsonify({'error': 'Invalid priority'}), 400
+    
+    try:
+        earliest_date = datetime.strptime(data.get('earliest_date', ''), '%Y-%m-%d').date()
+        latest_date = datetime.strptime(data.get('latest_date', ''), '%Y-%m-%d').date()
+        window_start = datetime.strptime(data['window_start'], '%H:%M').time() if data.get('window_start') else None
+        window_end = datetime.strptime(data['window_end'], '%H:%M').time() if data.get('window_end') else None
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid date or time format'}), 400
+    
+    if latest_date < earliest_date or (window_start and window_end and window_end <= window_start):
+        return jsonify({'error': 'Dates and time window must not be reversed'}), 400
+    
+    entry = WaitlistEntry(
+        patient_id=patient.id,
+        doctor_id=doctor.id if doctor else None,
+        department=department,
+        earliest_date=earliest_date,
+        latest_date=latest_date,
+        window_start=window_start,
+        window_end=window_end,
+        duration=duration,
+        appointment_type=data['appointment_type'],
+        reason_for_visit=data.get('reason_for_visit', ''),
+        priority=priority,
+        auto_book=bool(data.get('auto_book')),
+        created_by=current_user.id
+    )
+    db.session.add(entry)
+    db.session.commit()
+    return jsonify(entry.to_dict()), 201
+
+@api_bp.route('/waitlist/<int:entry_id>/accept', methods=['POST'])
+@login_required
+def accept_waitlist_offer(entry_id):
+    """Book the slot offered to a waitlist entry."""
+    if not current_user.can_manage_appointments():
+        return jsonify({'error': 'Access denied'}), 403
+    
+    entry = WaitlistEntry.query.get_or_404(entry_id)
+    try:
+        appointment = accept_offer(entry, user_id=current_user.id)
+        db.session.commit()
+    except HoldExpired as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 410
+    except BookingConflict as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 409
+    
+    return jsonify({'success': True, 'appointment': appointment.to_dict()})
+
+@api_bp.route('/waitlist/<int:entry_id>/decline', methods=['POST'])
+@login_required
+def decline_waitlist_offer(entry_id):
+    """Turn down an offer; the slot goes to the next waiting patient."""
+    if not current_user.can_manage_appointments():
+        return jsonify({'error': 'Access denied'}), 403
+    
+    entry = WaitlistEntry.query.get_or_404(entry_id)
+    try:
+        decline_offer(entry)
+        db.session.commit()
+    except HoldExpired as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 410
+    
+    return jsonify({'success': True})
+
+@api_bp.route('/waitlist/<int:entry_id>', methods=['DELETE'])
+@login_required
+def remove_waitlist_entry(entry_id):
+    """Take a patient off the waitlist."""
+    if not current_user.can_manage_appointments():
+        return jsonify({'error': 'Access denied'}), 403
+    
+    entry = WaitlistEntry.query.get_or_404(entry_id)
+    try:
+        cancel_entry(entry)
+        db.session.commit()
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify({'success': True})
+
 @api_bp.route('/inventory/low-stock')
 @login_required
+@query_budget(5)
 def low_stock_items():
     """Get low stock inventory items."""
     if not current_user.can_manage_inventory():
         return jsonify({'error': 'Access denied'}), 403
     
-    items = InventoryItem.query.filter(
+    query = InventoryItem.query.filter(
         InventoryItem.current_stock <= InventoryItem.minimum_stock,
         InventoryItem.is_active == True
-    ).all()
+    )
+    items = keyset_paginate(query, InventoryItem.name, descending=False,
+                            cursor=request.args.get('cursor', '', type=str),
+                            per_page=request.args.get('per_page', 50, type=int))
     
     return jsonify({
-        'items': [item.to_dict() for item in items]
+        'items': [item.to_dict() for item in items],
+        'pagination': items.to_dict()
     })
 
 @api_bp.route('/bills/patient/<int:patient_id>')
 @login_required
-def patient_bills():
+@query_budget(6)
+def patient_bills(patient_id):
     """Get bills for a specific patient."""
     if not current_user.can_manage_billing():
         return jsonify({'error': 'Access denied'}), 403
     
     patient = Patient.query.get_or_404(patient_id)
-    bills = patient.bills.order_by(Bill.created_at.desc()).limit(10).all()
+    bills = keyset_paginate(BILL_DICT.apply(Bill.query.filter(Bill.patient_id == patient.id)), Bill.created_at,
+                            cursor=request.args.get('cursor', '', type=str),
+                            per_page=request.args.get('per_page', 10, type=int), total=None)
     
     return jsonify({
-        'bills': [bill.to_dict() for bill in bills]
+        'bills': [bill.to_dict() for bill in bills],
+        'pagination': bills.to_dict()
     })
 
 @api_bp.route('/dashboard/stats')
 @login_required
+@query_budget(4 + counters.RECOUNT_STATEMENTS)
 def dashboard_stats():
     """Get dashboard statistics based on user role."""
-    today = date.today()
+    counts = counters.cached_values()
     stats = {}
     
     if current_user.can_manage_patients():
         stats['patients'] = {
-            'total': Patient.query.filter(Patient.is_active == True).count(),
-            'new_today': Patient.query.filter(
-                db.func.date(Patient.created_at) == today
-            ).count()
+            'total': counts['patients_active'],
+            'new_today': counts['patients_new_today']
         }
     
     if current_user.can_manage_appointments():
         stats['appointments'] = {
-            'today': Appointment.query.filter(
-                Appointment.appointment_date == today
-            ).count(),
-            'pending': Appointment.query.filter(
-                Appointment.appointment_date >= today,
-                Appointment.status == 'scheduled'
-            ).count()
+            'today': counts['appointments_today'],
+            'pending': counts['appointments_pending']
         }
     
     if current_user.can_manage_billing():
         stats['billing'] = {
-            'pending_bills': Bill.query.filter(
-                Bill.status.in_(['pending', 'partially_paid'])
-            ).count(),
-            'overdue_bills': Bill.query.filter(
-                Bill.due_date < today,
-                Bill.status.in_(['pending', 'partially_paid'])
-            ).count()
+            'pending_bills': counts['bills_pending'],
+            'overdue_bills': counts['bills_overdue']
         }
     
     if current_user.can_manage_inventory():
         stats['inventory'] = {
-            'low_stock': InventoryItem.query.filter(
-                InventoryItem.current_stock <= InventoryItem.minimum_stock,
-                InventoryItem.is_active == True
-            ).count(),
-            'out_of_stock': InventoryItem.query.filter(
-                InventoryItem.current_stock <= 0,
-                InventoryItem.is_active == True
-            ).count()
+            'low_stock': counts['items_low_stock'],
+            'out_of_stock': counts['items_out_of_stock']
         }
     
     return jsonify(stats)
 
+@api_bp.route('/cache/stats')
+@login_required
+@query_budget(2)
+def cache_stats():
+    """Payload cache hit/miss counters of this worker."""
+    if not current_user.can_access_admin():
+        return jsonify({'error': 'Access denied'}), 403
+    
+    return jsonify(cache.get_cache().stats())
+
 @api_bp.route('/appointments/<int:appointment_id>/status', methods=['POST'])
 @login_required
-def update_appointment_status():
+def update_appointment_status(appointment_id):
     """Update appointment status."""
     if not current_user.can_manage_appointments():
         return jsonify({'error': 'Access denied'}), 403
     
-    appointment_id = request.view_args['appointment_id']
     appointment = Appointment.query.get_or_404(appointment_id)
     
     new_status = request.json.get('status')
@@ -187,6 +761,11 @@ def update_appointment_status():
         return jsonify({'error': 'Invalid status'}), 400
     
     try:
+        # Reviving a cancelled appointment must not double-book the doctor
+        if appointment.status == 'cancelled' and new_status != 'cancelled':
+            check_available(appointment.doctor_id, appointment.appointment_date,
+                            appointment.appointment_time, appointment.duration, exclude_id=appointment.id)
+        
         appointment.status = new_status
         if new_status == 'completed':
             diagnosis = request.json.get('diagnosis')
@@ -199,6 +778,9 @@ def update_appointment_status():
         db.session.commit()
         return jsonify({'success': True, 'message': f'Appointment status updated to {new_status}'})
     
+    except BookingConflict as e:
+        db.session.rollback()
+        return jsonify({'error': str(e), 'conflicts': [c.appointment_id for c in e.conflicts]}), 409
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': 'Failed to update appointment status'}), 500
@@ -243,42 +825,41 @@ def update_inventory_stock():
 
 @api_bp.route('/patients/<int:patient_id>/appointments')
 @login_required
-def patient_appointments():
+@query_budget(5)
+def patient_appointments(patient_id):
     """Get appointments for a specific patient."""
     if not current_user.can_manage_patients():
         return jsonify({'error': 'Access denied'}), 403
     
     patient = Patient.query.get_or_404(patient_id)
-    appointments = patient.appointments.order_by(
-        Appointment.appointment_date.desc(),
-        Appointment.appointment_time.desc()
-    ).limit(10).all()
+    appointments = keyset_paginate(
+        APPOINTMENT_DICT.apply(Appointment.query.filter(Appointment.patient_id == patient.id)),
+        Appointment.appointment_date, Appointment.appointment_time,
+        cursor=request.args.get('cursor', '', type=str),
+        per_page=request.args.get('per_page', 10, type=int), total=None
+    )
     
     return jsonify({
-        'appointments': [appointment.to_dict() for appointment in appointments]
+        'appointments': [appointment.to_dict() for appointment in appointments],
+        'pagination': appointments.to_dict()
     })
 
 @api_bp.route('/reports/revenue-chart')
 @login_required
+@query_budget(4)
 def revenue_chart_data():
     """Get revenue data for charts."""
     if not current_user.can_view_reports():
         return jsonify({'error': 'Access denied'}), 403
     
-    days = request.args.get('days', 30, type=int)
+    days = min(max(request.args.get('days', 30, type=int), 1), timeseries.MAX_DAYS)
+    bucket = request.args.get('bucket', 'day')
+    if bucket not in timeseries.BUCKETS:
+        return jsonify({'error': f'bucket must be one of {", ".join(timeseries.BUCKETS)}'}), 400
     today = date.today()
     
-    revenue_data = []
-    for i in range(days):
-        check_date = today - timedelta(days=i)
-        daily_revenue = db.session.query(db.func.sum(Bill.paid_amount)).filter(
-            db.func.date(Bill.created_at) == check_date
-        ).scalar() or 0
-        
-        revenue_data.append({
-            'date': check_date.strftime('%Y-%m-%d'),
-            'revenue': float(daily_revenue)
-        })
-    
-    revenue_data.reverse()  # Show oldest to newest
+    # Paid amounts by bill date, oldest to newest
+    revenue_data = timeseries.series(
+        Bill.created_at, Bill.paid_amount, today - timedelta(days=days - 1), today, bucket, name='revenue'
+    )
     return jsonify({'data': revenue_data})
\ No newline at end of file
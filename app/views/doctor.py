@@ -4,12 +4,15 @@ from app import db
 from app.models.patient import Patient, MedicalRecord
 from app.models.appointment import Appointment
 from app.models.staff import Staff
+from app.services.loading import APPOINTMENT_ROWS, RECORD_ROWS
+from app.services.query_budget import query_budget
 from datetime import date, datetime, timedelta
 
 doctor_bp = Blueprint('doctor', __name__)
 
 @doctor_bp.route('/dashboard')
 @login_required
+@query_budget(8)
 def dashboard():
     """Doctor dashboard."""
     # Get doctor's staff record
@@ -21,20 +24,20 @@ def dashboard():
     today = date.today()
     
     # Today's appointments
-    today_appointments = staff.appointments.filter(
+    today_appointments = APPOINTMENT_ROWS.apply(staff.appointments).filter(
         Appointment.appointment_date == today
     ).order_by(Appointment.appointment_time).all()
     
     # Upcoming appointments
-    upcoming_appointments = staff.appointments.filter(
+    upcoming_appointments = APPOINTMENT_ROWS.apply(staff.appointments).filter(
         Appointment.appointment_date > today,
         Appointment.status.in_(['scheduled', 'confirmed'])
     ).order_by(Appointment.appointment_date, Appointment.appointment_time).limit(5).all()
     
     # Recent medical records
-    recent_records = staff.medical_records.order_by(
-        MedicalRecord.created_at.desc()
-    ).limit(5).all()
+    recent_records = RECORD_ROWS.apply(MedicalRecord.query).filter(
+        MedicalRecord.doctor_id == staff.id
+    ).order_by(MedicalRecord.created_at.desc()).limit(5).all()
     
     stats = {
         'appointments_today': len(today_appointments),
@@ -52,6 +55,7 @@ def dashboard():
 
 @doctor_bp.route('/appointments')
 @login_required
+@query_budget(5)
 def appointments():
     """View appointments."""
     staff = Staff.query.filter_by(user_id=current_user.id).first()
@@ -64,7 +68,7 @@ def appointments():
     except ValueError:
         filter_date = date.today()
     
-    appointments = staff.appointments.filter(
+    appointments = APPOINTMENT_ROWS.apply(staff.appointments).filter(
         Appointment.appointment_date == filter_date
     ).order_by(Appointment.appointment_time).all()
     
@@ -88,6 +92,7 @@ def view_appointment(id):
 
 @doctor_bp.route('/patients/<int:id>')
 @login_required
+@query_budget(8)
 def view_patient(id):
     """View patient details."""
     patient = Patient.query.get_or_404(id)
@@ -1,12 +1,14 @@
-from flask import Blueprint, render_template, redirect, url_for, jsonify, request
+import json
+import time
+from flask import Blueprint, Response, current_app, render_template, redirect, url_for, jsonify, request, stream_with_context
 from flask_login import login_required, current_user
 from app import db
-from app.models.patient import Patient
-from app.models.appointment import Appointment
 from app.models.staff import Staff
-from app.models.billing import Bill
-from app.models.inventory import InventoryItem
-from datetime import date, datetime, timedelta
+from app.services.patient_search import search_patients
+from app.services import counters, events
+from app.services.events import ALERTS_SHOWN
+from app.services.query_budget import query_budget
+from datetime import datetime
 
 main_bp = Blueprint('main', __name__)
 
@@ -48,14 +50,7 @@ def search():
     
     # Search patients (if user can manage patients)
     if current_user.can_manage_patients():
-        patients = Patient.query.filter(
-            db.or_(
-                Patient.first_name.ilike(f'%{query}%'),
-                Patient.last_name.ilike(f'%{query}%'),
-                Patient.patient_id.ilike(f'%{query}%'),
-                Patient.phone.ilike(f'%{query}%')
-            )
-        ).limit(10).all()
+        patients = search_patients(query, limit=10, active_only=False)
         
         for patient in patients:
             results.append({
@@ -88,130 +83,181 @@ def search():
     
     return jsonify({'results': results})
 
-@main_bp.route('/notifications')
-@login_required
-def notifications():
-    """Get user notifications."""
+def _doctor_staff_id():
+    """Staff id of the current user if they are a doctor."""
+    if current_user.role != 'doctor':
+        return None
+    staff = Staff.query.filter_by(user_id=current_user.id).first()
+    return staff.id if staff else None
+
+def _visible_notifications(alerts, staff_id=None):
+    """The current user's notifications from the shared alert lists, keyed by a stable id."""
     notifications = []
-    today = date.today()
     
     # Low stock alerts (for nurses and admin)
     if current_user.can_manage_inventory():
-        low_stock_items = InventoryItem.query.filter(
-            InventoryItem.current_stock <= InventoryItem.minimum_stock,
-            InventoryItem.is_active == True
-        ).limit(5).all()
-        
-        for item in low_stock_items:
+        for item in alerts['low_stock'][:ALERTS_SHOWN]:
             notifications.append({
+                'id': f"low-stock-{item['id']}",
                 'type': 'warning',
                 'title': 'Low Stock Alert',
-                'message': f'{item.name} is running low (Current: {item.current_stock})',
-                'timestamp': datetime.now().isoformat(),
+                'message': f"{item['name']} is running low (Current: {item['current_stock']})",
                 'url': url_for('nurse.inventory')
             })
     
     # Today's appointments (for doctors and receptionists)
     if current_user.role in ['doctor', 'receptionist']:
-        today_appointments = Appointment.query.filter(
-            Appointment.appointment_date == today,
-            Appointment.status.in_(['scheduled', 'confirmed'])
-        )
-        
-        if current_user.role == 'doctor':
+        appointments = alerts['appointments_today']['all']
+        if current_user.role == 'doctor' and staff_id is not None:
             # Only show appointments for this doctor
-            staff = Staff.query.filter_by(user_id=current_user.id).first()
-            if staff:
-                today_appointments = today_appointments.filter(
-                    Appointment.doctor_id == staff.id
-                )
+            appointments = alerts['appointments_today']['by_doctor'].get(staff_id, [])
         
-        today_appointments = today_appointments.limit(5).all()
-        
-        for appointment in today_appointments:
+        for appointment in appointments[:ALERTS_SHOWN]:
             notifications.append({
+                'id': f"appointment-{appointment['id']}",
                 'type': 'info',
                 'title': 'Today\'s Appointment',
-                'message': f'{appointment.patient.full_name} at {appointment.appointment_time.strftime("%H:%M")}',
-                'timestamp': datetime.now().isoformat(),
-                'url': url_for('doctor.view_appointment', id=appointment.id) if current_user.role == 'doctor' else url_for('receptionist.view_appointment', id=appointment.id)
+                'message': f"{appointment['patient']} at {appointment['time']}",
+                'url': url_for('doctor.view_appointment', id=appointment['id']) if current_user.role == 'doctor' else url_for('receptionist.view_appointment', id=appointment['id'])
+            })
+    
+    # Open waitlist offers waiting on staff (for receptionists and admin)
+    if current_user.can_manage_appointments():
+        for entry in alerts['waitlist_offers'][:ALERTS_SHOWN]:
+            notifications.append({
+                'id': f"waitlist-{entry['id']}",
+                'type': 'info',
+                'title': 'Waitlist Offer',
+                'message': f"Offer a freed slot to {entry['patient']} (expires {entry['expires']} UTC)",
+                'url': url_for('api.waitlist_entries', status='offered')
             })
     
     # Overdue bills (for accountants and admin)
     if current_user.can_manage_billing():
-        overdue_bills = Bill.query.filter(
-            Bill.due_date < today,
-            Bill.status.in_(['pending', 'partially_paid'])
-        ).limit(5).all()
-        
-        for bill in overdue_bills:
+        for bill in alerts['overdue_bills'][:ALERTS_SHOWN]:
             notifications.append({
+                'id': f"bill-{bill['id']}",
                 'type': 'error',
                 'title': 'Overdue Bill',
-                'message': f'Bill {bill.bill_number} for {bill.patient.full_name} is overdue',
-                'timestamp': datetime.now().isoformat(),
-                'url': url_for('accountant.view_bill', id=bill.id)
+                'message': f"Bill {bill['bill_number']} for {bill['patient']} is overdue",
+                'url': url_for('accountant.view_bill', id=bill['id'])
             })
     
-    return jsonify({'notifications': notifications})
+    return notifications
 
-@main_bp.route('/quick-stats')
-@login_required
-def quick_stats():
-    """Get quick statistics for dashboard widgets."""
+def _visible_stats(figures):
+    """The current user's quick statistics from the shared dashboard figures."""
     stats = {}
-    today = date.today()
     
     # Patient stats
     if current_user.can_manage_patients():
-        stats['total_patients'] = Patient.query.filter(Patient.is_active == True).count()
-        stats['new_patients_today'] = Patient.query.filter(
-            db.func.date(Patient.created_at) == today
-        ).count()
+        stats['total_patients'] = figures['patients_active']
+        stats['new_patients_today'] = figures['patients_new_today']
     
     # Appointment stats
     if current_user.can_manage_appointments():
-        stats['total_appointments_today'] = Appointment.query.filter(
-            Appointment.appointment_date == today
-        ).count()
-        stats['pending_appointments'] = Appointment.query.filter(
-            Appointment.appointment_date >= today,
-            Appointment.status == 'scheduled'
-        ).count()
+        stats['total_appointments_today'] = figures['appointments_today']
+        stats['pending_appointments'] = figures['appointments_pending']
     
     # Billing stats
     if current_user.can_manage_billing():
-        stats['pending_bills'] = Bill.query.filter(
-            Bill.status.in_(['pending', 'partially_paid'])
-        ).count()
+        stats['pending_bills'] = figures['bills_pending']
         
         # Total revenue today
-        today_payments = db.session.query(db.func.sum(Bill.paid_amount)).filter(
-            db.func.date(Bill.created_at) == today
-        ).scalar() or 0
-        stats['revenue_today'] = float(today_payments)
+        stats['revenue_today'] = float(figures['bills_paid_today'])
     
     # Inventory stats
     if current_user.can_manage_inventory():
-        stats['low_stock_items'] = InventoryItem.query.filter(
-            InventoryItem.current_stock <= InventoryItem.minimum_stock,
-            InventoryItem.is_active == True
-        ).count()
-        stats['out_of_stock_items'] = InventoryItem.query.filter(
-            InventoryItem.current_stock <= 0,
-            InventoryItem.is_active == True
-        ).count()
+        stats['low_stock_items'] = figures['items_low_stock']
+        stats['out_of_stock_items'] = figures['items_out_of_stock']
     
     # Staff stats (admin only)
     if current_user.can_manage_staff():
-        stats['total_staff'] = Staff.query.filter(Staff.is_active == True).count()
-        stats['available_doctors'] = Staff.query.filter(
-            Staff.is_active == True,
-            Staff.is_available == True,
-            Staff.user.has(role='doctor')
-        ).count()
-    
-    return jsonify(stats)
+        stats['total_staff'] = figures['staff_active']
+        stats['available_doctors'] = figures['available_doctors']
+    
+    return stats
+
+@main_bp.route('/notifications')
+@login_required
+@query_budget(8)
+def notifications():
+    """Get user notifications."""
+    timestamp = datetime.now().isoformat()
+    notifications = [
+        dict(notification, timestamp=timestamp)
+        for notification in _visible_notifications(events.alerts(), _doctor_staff_id())
+    ]
+    return jsonify({'notifications': notifications})
+
+@main_bp.route('/quick-stats')
+@login_required
+@query_budget(4 + counters.RECOUNT_STATEMENTS)
+def quick_stats():
+    """Get quick statistics for dashboard widgets."""
+    return jsonify(_visible_stats(events.figures()))
+
+def _sse(event, data):
+    return f'event: {event}\ndata: {json.dumps(data, default=str)}\n\n'
+
+@main_bp.route('/events')
+@login_required
+def event_stream():
+    """Server-sent events with the user's quick statistics and notifications.
+    
+    Sends ``stats`` (changed figures only), ``notification`` (added or changed)
+    and ``notification-removed`` events; the first ones carry everything. The
+    stream holds a worker until it ends after ``EVENTS_STREAM_SECONDS``, and
+    the browser reconnects after ``EVENTS_RETRY_MS``.
+    """
+    config = current_app.config
+    feed = events.get_feed()
+    subscription = feed.subscribe()
+    staff_id = _doctor_staff_id()
+    current = events.snapshot()
+    # Streams can stay open for minutes; don't hold a pooled connection meanwhile.
+    # Loading the user first keeps its role readable once detached.
+    db.session.refresh(current_user._get_current_object())
+    db.session.close()
+    
+    def stream():
+        try:
+            yield f"retry: {config['EVENTS_RETRY_MS']}\n\n"
+            sent_stats = {}
+            sent_notifications = {}
+            deadline = time.monotonic() + config['EVENTS_STREAM_SECONDS']
+            snapshot = current
+            while True:
+                if snapshot is None:
+                    yield ': keepalive\n\n'
+                else:
+                    stats = _visible_stats(snapshot['figures'])
+                    changed = {key: value for key, value in stats.items() if sent_stats.get(key) != value}
+                    if changed:
+                        sent_stats.update(changed)
+                        yield _sse('stats', changed)
+                    
+                    notifications = {item['id']: item for item in _visible_notifications(snapshot['alerts'], staff_id)}
+                    for notification_id in sent_notifications.keys() - notifications.keys():
+                        yield _sse('notification-removed', {'id': notification_id})
+                    timestamp = datetime.now().isoformat()
+                    for notification_id, item in notifications.items():
+                        if sent_notifications.get(notification_id) != item:
+                            yield _sse('notification', dict(item, timestamp=timestamp))
+                    sent_notifications = notifications
+                
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                snapshot = subscription.get(timeout=min(config['EVENTS_HEARTBEAT_SECONDS'], remaining))
+        finally:
+            feed.unsubscribe(subscription)
+    
+    return Response(stream_with_context(stream()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        # Stop nginx from buffering the stream
+        'X-Accel-Buffering': 'no'
+    })
 
 @main_bp.errorhandler(403)
 def forbidden(error):
@@ -4,12 +4,18 @@ from app import db
 from app.models.patient import Patient
 from app.models.inventory import InventoryItem, UsageRecord, ReorderRequest
 from app.models.staff import Staff
+from app.services.patient_search import filter_patients
+from app.services.loading import REORDER_ROWS, USAGE_ROWS
+from app.services.pagination import keyset_paginate
+from app.services import counters
+from app.services.query_budget import query_budget
 from datetime import date, datetime, timedelta
 
 nurse_bp = Blueprint('nurse', __name__)
 
 @nurse_bp.route('/dashboard')
 @login_required
+@query_budget(6 + counters.RECOUNT_STATEMENTS)
 def dashboard():
     """Nurse dashboard."""
     if not current_user.can_manage_inventory():
@@ -19,19 +25,12 @@ def dashboard():
     today = date.today()
     
     # Inventory statistics
+    counts = counters.cached_values()
     stats = {
-        'total_items': InventoryItem.query.filter(InventoryItem.is_active == True).count(),
-        'low_stock_items': InventoryItem.query.filter(
-            InventoryItem.current_stock <= InventoryItem.minimum_stock,
-            InventoryItem.is_active == True
-        ).count(),
-        'out_of_stock': InventoryItem.query.filter(
-            InventoryItem.current_stock <= 0,
-            InventoryItem.is_active == True
-        ).count(),
-        'pending_reorders': ReorderRequest.query.filter(
-            ReorderRequest.status == 'pending'
-        ).count()
+        'total_items': counts['items_active'],
+        'low_stock_items': counts['items_low_stock'],
+        'out_of_stock': counts['items_out_of_stock'],
+        'pending_reorders': counts['reorders_pending']
     }
     
     # Low stock alerts
@@ -41,12 +40,12 @@ def dashboard():
     ).limit(10).all()
     
     # Recent usage
-    recent_usage = UsageRecord.query.order_by(
+    recent_usage = USAGE_ROWS.apply(UsageRecord.query).order_by(
         UsageRecord.created_at.desc()
     ).limit(10).all()
     
     # Pending reorder requests
-    pending_reorders = ReorderRequest.query.filter(
+    pending_reorders = REORDER_ROWS.apply(ReorderRequest.query).filter(
         ReorderRequest.status == 'pending'
     ).order_by(ReorderRequest.created_at.desc()).limit(5).all()
     
@@ -58,13 +57,14 @@ def dashboard():
 
 @nurse_bp.route('/inventory')
 @login_required
+@query_budget(6)
 def inventory():
     """Manage inventory."""
     if not current_user.can_manage_inventory():
         flash('Access denied.', 'error')
         return redirect(url_for('main.dashboard'))
     
-    page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor', '', type=str)
     search = request.args.get('search', '', type=str)
     category_filter = request.args.get('category', '', type=str)
     stock_filter = request.args.get('stock', '', type=str)
@@ -88,9 +88,7 @@ def inventory():
     elif stock_filter == 'out':
         query = query.filter(InventoryItem.current_stock <= 0)
     
-    items = query.order_by(InventoryItem.name).paginate(
-        page=page, per_page=20, error_out=False
-    )
+    items = keyset_paginate(query, InventoryItem.name, descending=False, cursor=cursor, per_page=20)
     
     # Get categories for filter
     categories = db.session.query(InventoryItem.category).distinct().all()
@@ -105,6 +103,7 @@ def inventory():
 
 @nurse_bp.route('/inventory/<int:id>')
 @login_required
+@query_budget(6)
 def view_item(id):
     """View inventory item details."""
     if not current_user.can_manage_inventory():
@@ -114,7 +113,7 @@ def view_item(id):
     item = InventoryItem.query.get_or_404(id)
     
     # Get usage history
-    usage_history = item.usage_records.order_by(
+    usage_history = USAGE_ROWS.apply(item.usage_records).order_by(
         UsageRecord.created_at.desc()
     ).limit(20).all()
     
@@ -184,22 +183,14 @@ def patients():
         flash('Access denied.', 'error')
         return redirect(url_for('main.dashboard'))
     
-    page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor', '', type=str)
     search = request.args.get('search', '', type=str)
     
     query = Patient.query.filter(Patient.is_active == True)
     
     if search:
-        query = query.filter(
-            db.or_(
-                Patient.first_name.ilike(f'%{search}%'),
-                Patient.last_name.ilike(f'%{search}%'),
-                Patient.patient_id.ilike(f'%{search}%')
-            )
-        )
+        query = filter_patients(query, search)
     
-    patients = query.order_by(Patient.created_at.desc()).paginate(
-        page=page, per_page=20, error_out=False
-    )
+    patients = keyset_paginate(query, Patient.created_at, cursor=cursor, per_page=20)
     
     return render_template('nurse/patients.html', patients=patients, search=search)
\ No newline at end of file
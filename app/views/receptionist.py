@@ -5,6 +5,13 @@ from app.models.patient import Patient
 from app.models.appointment import Appointment
 from app.models.staff import Staff
 from app.models.billing import Bill
+from app.services.patient_search import filter_patients
+from app.services.phone_numbers import find_patient_by_phone
+from app.services.booking import BookingConflict, HoldExpired, confirm_hold, create_appointment
+from app.services.loading import APPOINTMENT_ROWS
+from app.services.pagination import keyset_paginate
+from app.services import counters
+from app.services.query_budget import query_budget
 from datetime import date, datetime, timedelta
 
 receptionist_bp = Blueprint('receptionist', __name__)
@@ -21,28 +28,23 @@ def receptionist_required(f):
 
 @receptionist_bp.route('/dashboard')
 @login_required
+@query_budget(6 + counters.RECOUNT_STATEMENTS)
 @receptionist_required
 def dashboard():
     """Receptionist dashboard."""
     today = date.today()
     
     # Today's statistics
+    counts = counters.cached_values()
     stats = {
-        'total_patients': Patient.query.filter(Patient.is_active == True).count(),
-        'new_patients_today': Patient.query.filter(
-            db.func.date(Patient.created_at) == today
-        ).count(),
-        'appointments_today': Appointment.query.filter(
-            Appointment.appointment_date == today
-        ).count(),
-        'pending_appointments': Appointment.query.filter(
-            Appointment.appointment_date >= today,
-            Appointment.status == 'scheduled'
-        ).count()
+        'total_patients': counts['patients_active'],
+        'new_patients_today': counts['patients_new_today'],
+        'appointments_today': counts['appointments_today'],
+        'pending_appointments': counts['appointments_pending']
     }
     
     # Today's appointments
-    today_appointments = Appointment.query.filter(
+    today_appointments = APPOINTMENT_ROWS.apply(Appointment.query).filter(
         Appointment.appointment_date == today
     ).order_by(Appointment.appointment_time).all()
     
@@ -51,7 +53,7 @@ def dashboard():
     
     # Upcoming appointments (next 7 days)
     week_end = today + timedelta(days=7)
-    upcoming_appointments = Appointment.query.filter(
+    upcoming_appointments = APPOINTMENT_ROWS.apply(Appointment.query).filter(
         Appointment.appointment_date.between(today, week_end),
         Appointment.status.in_(['scheduled', 'confirmed'])
     ).order_by(Appointment.appointment_date, Appointment.appointment_time).limit(10).all()
@@ -67,25 +69,15 @@ def dashboard():
 @receptionist_required
 def manage_patients():
     """Manage patients."""
-    page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor', '', type=str)
     search = request.args.get('search', '', type=str)
     
     query = Patient.query.filter(Patient.is_active == True)
     
     if search:
-        query = query.filter(
-            db.or_(
-                Patient.first_name.ilike(f'%{search}%'),
-                Patient.last_name.ilike(f'%{search}%'),
-                Patient.patient_id.ilike(f'%{search}%'),
-                Patient.phone.ilike(f'%{search}%'),
-                Patient.email.ilike(f'%{search}%')
-            )
-        )
+        query = filter_patients(query, search)
     
-    patients = query.order_by(Patient.created_at.desc()).paginate(
-        page=page, per_page=20, error_out=False
-    )
+    patients = keyset_paginate(query, Patient.created_at, cursor=cursor, per_page=20)
     
     return render_template('receptionist/manage_patients.html', patients=patients, search=search)
 
@@ -127,7 +119,7 @@ def add_patient():
             return render_template('receptionist/add_patient.html')
         
         # Check if patient with same phone already exists
-        existing_patient = Patient.query.filter_by(phone=phone).first()
+        existing_patient = find_patient_by_phone(phone)
         if existing_patient:
             flash('A patient with this phone number already exists.', 'warning')
             return redirect(url_for('receptionist.view_patient', id=existing_patient.id))
@@ -164,13 +156,14 @@ def add_patient():
 
 @receptionist_bp.route('/patients/<int:id>')
 @login_required
+@query_budget(6)
 @receptionist_required
 def view_patient(id):
     """View patient details."""
     patient = Patient.query.get_or_404(id)
     
     # Get recent appointments
-    recent_appointments = patient.appointments.order_by(
+    recent_appointments = APPOINTMENT_ROWS.apply(patient.appointments).order_by(
         Appointment.appointment_date.desc(),
         Appointment.appointment_time.desc()
     ).limit(10).all()
@@ -224,6 +217,7 @@ def edit_patient(id):
 
 @receptionist_bp.route('/appointments')
 @login_required
+@query_budget(6)
 @receptionist_required
 def manage_appointments():
     """Manage appointments."""
@@ -237,7 +231,7 @@ def manage_appointments():
     except ValueError:
         filter_date = date.today()
     
-    query = Appointment.query.filter(Appointment.appointment_date == filter_date)
+    query = APPOINTMENT_ROWS.apply(Appointment.query).filter(Appointment.appointment_date == filter_date)
     
     if status_filter:
         query = query.filter(Appointment.status == status_filter)
@@ -273,13 +267,19 @@ def book_appointment():
         appointment_date = request.form.get('appointment_date')
         appointment_time = request.form.get('appointment_time')
         appointment_type = request.form.get('appointment_type')
+        duration = request.form.get('duration', 30, type=int)
         reason_for_visit = request.form.get('reason_for_visit', '')
+        hold_token = request.form.get('hold_token', '').strip()
         
         # Validation
         if not all([patient_id, doctor_id, appointment_date, appointment_time, appointment_type]):
             flash('All required fields must be filled.', 'error')
             return render_template('receptionist/book_appointment.html')
         
+        if not duration or duration <= 0:
+            flash('Duration must be a positive number of minutes.', 'error')
+            return render_template('receptionist/book_appointment.html')
+        
         try:
             apt_date = datetime.strptime(appointment_date, '%Y-%m-%d').date()
             apt_time = datetime.strptime(appointment_time, '%H:%M').time()
@@ -295,41 +295,58 @@ def book_appointment():
             flash('Invalid patient or doctor selected.', 'error')
             return render_template('receptionist/book_appointment.html')
         
-        # Check if doctor is available
-        if not doctor.is_available_at(apt_date, apt_time):
+        if not doctor.is_available:
             flash('Doctor is not available at the selected time.', 'error')
             return render_template('receptionist/book_appointment.html')
         
         try:
-            # Create appointment
-            appointment = Appointment(
-                patient_id=patient_id,
-                doctor_id=doctor_id,
-                appointment_date=apt_date,
-                appointment_time=apt_time,
-                appointment_type=appointment_type,
-                reason_for_visit=reason_for_visit,
-                created_by=current_user.id
-            )
-            db.session.add(appointment)
+            # Create appointment; overlapping bookings are rejected after claiming the doctor
+            if hold_token:
+                # The slot was held while the form was filled in
+                appointment = confirm_hold(
+                    hold_token,
+                    appointment_type,
+                    patient_id=patient_id,
+                    reason_for_visit=reason_for_visit,
+                    created_by=current_user.id
+                )
+            else:
+                appointment = create_appointment(
+                    patient_id=patient_id,
+                    doctor_id=doctor_id,
+                    appointment_date=apt_date,
+                    appointment_time=apt_time,
+                    appointment_type=appointment_type,
+                    duration=duration,
+                    reason_for_visit=reason_for_visit,
+                    created_by=current_user.id
+                )
             db.session.commit()
             
             flash(f'Appointment booked successfully for {patient.full_name}!', 'success')
             return redirect(url_for('receptionist.view_appointment', id=appointment.id))
             
+        except (BookingConflict, HoldExpired) as e:
+            db.session.rollback()
+            flash(str(e), 'error')
+            return render_template('receptionist/book_appointment.html')
         except Exception as e:
             db.session.rollback()
             flash('Error booking appointment. Please try again.', 'error')
     
-    # Get patients and doctors for form
-    patients = Patient.query.filter(Patient.is_active == True).order_by(Patient.first_name).all()
-    doctors = Staff.query.filter(
-        Staff.user.has(role='doctor'),
-        Staff.is_active == True,
-        Staff.is_available == True
-    ).order_by(Staff.first_name).all()
+    # Patient and doctor fields are filled from /api/patients/options and
+    # /api/doctors/options; only preselected records are loaded
+    selected_patient = selected_doctor = None
+    patient_id = request.values.get('patient_id', type=int)
+    doctor_id = request.values.get('doctor_id', type=int)
+    if patient_id:
+        selected_patient = Patient.query.get(patient_id)
+    if doctor_id:
+        selected_doctor = Staff.query.get(doctor_id)
     
-    return render_template('receptionist/book_appointment.html', patients=patients, doctors=doctors)
+    return render_template('receptionist/book_appointment.html',
+                         selected_patient=selected_patient,
+                         selected_doctor=selected_doctor)
 
 @receptionist_bp.route('/appointments/<int:id>')
 @login_required
@@ -0,0 +1,34 @@
+"""Autocomplete index memory, lookup latency and the cost of committing a change."""
+
+import tracemalloc
+from datetime import date
+from common import add_patients, arguments, make_app, timed
+
+def main():
+    args = arguments(__doc__, patients=20000)
+    app = make_app(args)
+    with app.app_context():
+        from app import db
+        from app.models.patient import Patient
+        from app.services import autocomplete
+        
+        add_patients(args.patients)
+        tracemalloc.start()
+        indexes = autocomplete._build()
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        patients = indexes['patient']
+        keys = sum(len(keys) for keys in patients._entry_keys.values())
+        print(f'{len(patients)} patients, {keys} keys, {size / 2**20:.1f} MB')
+        
+        autocomplete._rebuild(autocomplete._state())
+        for label, term in {'name prefix "smi"': 'smi', 'full name': 'mary jones', 'phone digits': '55'}.items():
+            timed(label, lambda: autocomplete.suggest('patient', term), args.repeat)
+        
+        def commit_one():
+            db.session.add(Patient('Bench', 'Mark', date(1980, 1, 1), 'Female', '555-0199'))
+            db.session.commit()
+        timed('commit adding one patient', commit_one, args.repeat)
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
@@ -0,0 +1,21 @@
+"""Doctor x slot availability matrix for one day, by number of doctors and slots."""
+
+from datetime import date, timedelta
+from common import add_appointments, add_doctors, add_patients, arguments, make_app, timed
+
+def main():
+    args = arguments(__doc__, doctors=100, per_day=8, patients=1000)
+    app = make_app(args)
+    with app.app_context():
+        from app.services.scheduling import availability_matrix
+        
+        day = date.today() + timedelta(days=1)
+        doctors = add_doctors(args.doctors)
+        add_appointments(doctors, add_patients(args.patients), day, 1, args.per_day)
+        print(f'{args.doctors} doctors, {args.per_day} appointments each')
+        timed('one time', lambda: availability_matrix(doctors, day, [10 * 60]), args.repeat)
+        timed('09:00-17:00 every 30 min', lambda: availability_matrix(doctors, day, range(9 * 60, 17 * 60, 30)), args.repeat)
+        timed('whole day every 5 min', lambda: availability_matrix(doctors, day, range(0, 24 * 60, 5)), args.repeat)
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
@@ -0,0 +1,35 @@
+"""Overlap checks and conflict-checked booking against a filled diary."""
+
+from datetime import date, time, timedelta
+from common import add_appointments, add_doctors, add_patients, arguments, make_app, timed
+
+def main():
+    args = arguments(__doc__, doctors=30, days=90, per_day=8, patients=1000)
+    app = make_app(args)
+    with app.app_context():
+        from app import db
+        from app.models.appointment import Appointment
+        from app.services.booking import create_appointment, find_conflicts
+        
+        start = date.today() + timedelta(days=1)
+        doctors = add_doctors(args.doctors)
+        patients = add_patients(args.patients)
+        add_appointments(doctors, patients, start, args.days, args.per_day)
+        print(f'{Appointment.query.count()} appointments')
+        
+        day = start + timedelta(days=args.days // 2)
+        booked = Appointment.query.filter_by(doctor_id=doctors[0], appointment_date=day).first()
+        free = next(
+            time(minutes // 60, minutes % 60) for minutes in range(9 * 60, 17 * 60, 30)
+            if not find_conflicts(doctors[0], day, time(minutes // 60, minutes % 60))
+        )
+        timed('find_conflicts, free slot', lambda: find_conflicts(doctors[0], day, free), args.repeat)
+        timed('find_conflicts, booked slot', lambda: find_conflicts(doctors[0], day, booked.appointment_time), args.repeat)
+        
+        def book():
+            create_appointment(patients[0], doctors[0], day, free, 'Consultation')
+            db.session.rollback()
+        timed('create_appointment, rolled back', book, args.repeat)
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
@@ -0,0 +1,48 @@
+"""Bulk create and move batches through apply_batch."""
+
+import itertools
+from datetime import date, timedelta
+from common import add_doctors, add_patients, arguments, make_app, timed
+
+def main():
+    args = arguments(__doc__, operations=1000, doctors=10, patients=1000)
+    app = make_app(args)
+    with app.app_context():
+        from app import db
+        from app.models.appointment import Appointment
+        from app.services.booking_batch import apply_batch
+        
+        doctors = add_doctors(args.doctors)
+        patients = add_patients(args.patients)
+        start = date.today() + timedelta(days=1)
+        slots = [f'{9 + minutes // 60:02d}:{minutes % 60:02d}' for minutes in range(0, 8 * 60, 30)]
+        days_per_batch = -(-args.operations // (args.doctors * len(slots)))
+        blocks = itertools.count()
+        created = []
+        
+        def create():
+            first_day = start + timedelta(days=next(blocks) * days_per_batch)
+            operations = [
+                {'op': 'create', 'patient_id': patients[i % len(patients)], 'doctor_id': doctor_id,
+                 'date': (first_day + timedelta(days=offset)).isoformat(), 'time': slot, 'appointment_type': 'Consultation'}
+                for i, (offset, doctor_id, slot) in enumerate(itertools.product(range(days_per_batch), doctors, slots))
+            ][:args.operations]
+            results, applied = apply_batch(operations)
+            assert applied == len(operations), results[:3]
+            created.append([result['appointment_id'] for result in results])
+        
+        print(f'{args.operations} operations per batch, {args.doctors} doctors')
+        timed('create batch', create, args.repeat)
+        
+        moved = iter(created)
+        
+        def move():
+            rows = db.session.query(Appointment.id, Appointment.appointment_date).filter(Appointment.appointment_id.in_(next(moved)))
+            # Well past every created block, so nothing is in the way
+            operations = [{'op': 'move', 'id': id, 'date': (day + timedelta(days=3650)).isoformat()} for id, day in rows]
+            results, applied = apply_batch(operations)
+            assert applied == len(operations), results[:3]
+        timed('move batch', move, args.repeat)
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
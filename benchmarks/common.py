@@ -0,0 +1,117 @@
+"""
+Shared setup for the benchmark scripts.
+
+Each script builds the app on a throwaway SQLite file, fills it with
+synthetic rows and times one code path, so that figures quoted for a change
+can be reproduced on other hardware::
+    
+    python benchmarks/patient_search.py --patients 300000
+
+``--database`` runs against another, empty, database URL instead. Times are
+wall-clock, the median and the slowest of ``--repeat`` runs.
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+FIRST_NAMES = ['John', 'Jon', 'Mary', 'Maria', 'James', 'Linda', 'Robert', 'Patricia', 'Michael', 'Jennifer',
+               'William', 'Elizabeth', 'David', 'Susan', 'Richard', 'Jessica', 'Joseph', 'Sarah', 'Thomas', 'Karen']
+LAST_NAMES = ['Smith', 'Smyth', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis', 'Rodriguez',
+              'Martinez', 'Hernandez', 'Lopez', 'Gonzalez', 'Wilson', 'Anderson', 'Thomas', 'Taylor', 'Moore', 'Jackson']
+DEPARTMENTS = ['Cardiology', 'Neurology', 'Pediatrics', 'Orthopedics', 'General Medicine']
+
+def arguments(description, **options):
+    """Parse the common options plus ``options`` (name: default) of the script."""
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('--database', help='database URL (default: a temporary SQLite file)')
+    parser.add_argument('--repeat', type=int, default=20, help='timed runs per case')
+    parser.add_argument('--seed', type=int, default=1, help='random seed for the synthetic rows')
+    for name, default in options.items():
+        parser.add_argument('--' + name.replace('_', '-'), type=type(default), default=default)
+    return parser.parse_args()
+
+def make_app(args):
+    """The app on an empty database with its tables created."""
+    # Read by config at import time, so set before the app is imported
+    os.environ['DATABASE_URL'] = args.database or 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='hms-bench-'), 'bench.db')
+    random.seed(args.seed)
+    from app import create_app, db
+    app = create_app('production')
+    with app.app_context():
+        db.create_all()
+    return app
+
+def add_patients(count, batch=5000):
+    """Insert synthetic patients through the ORM, so their search indexes are kept; returns their ids."""
+    from app import db
+    from app.models.patient import Patient
+    ids = []
+    for start in range(0, count, batch):
+        patients = [
+            Patient(
+                random.choice(FIRST_NAMES),
+                random.choice(LAST_NAMES),
+                date(1940, 1, 1) + timedelta(days=random.randrange(30000)),
+                random.choice(['Male', 'Female']),
+                f'({random.randrange(200, 999)}) {random.randrange(100, 999)}-{random.randrange(10000):04d}',
+                email=f'patient{start + i}@example.com'
+            )
+            for i in range(min(batch, count - start))
+        ]
+        db.session.add_all(patients)
+        db.session.commit()
+        ids.extend(patient.id for patient in patients)
+    return ids
+
+def add_doctors(count):
+    """Insert doctors spread over the departments; returns their staff ids."""
+    from app import db
+    from app.models.staff import Staff
+    from app.models.user import User
+    # Login isn't benchmarked, so skip the deliberately slow password hashing
+    users = db.session.execute(
+        User.__table__.insert().returning(User.__table__.c.id),
+        [{'username': f'doctor{i}', 'email': f'doctor{i}@example.com', 'password_hash': '!', 'role': 'doctor', 'is_active': True}
+         for i in range(count)]
+    ).scalars().all()
+    doctors = [
+        Staff(user_id, random.choice(FIRST_NAMES), random.choice(LAST_NAMES), 'Female', '555-0100',
+              f'doctor{i}@example.com', DEPARTMENTS[i % len(DEPARTMENTS)])
+        for i, user_id in enumerate(users)
+    ]
+    db.session.add_all(doctors)
+    db.session.commit()
+    return [doctor.id for doctor in doctors]
+
+def timed(label, function, repeat):
+    """Run ``function`` ``repeat`` times and print the median and slowest wall time."""
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - started)
+    print(f'{label:<40} median {statistics.median(times) * 1000:8.2f} ms   max {max(times) * 1000:8.2f} ms')
+    return times
+
+def add_appointments(doctor_ids, patient_ids, start_date, days, per_day):
+    """Book ``per_day`` non-overlapping half-hour appointments per doctor and day, 09:00-17:00."""
+    from datetime import time
+    from app import db
+    from app.models.appointment import Appointment
+    starts = [time(9 + minutes // 60, minutes % 60) for minutes in range(0, 8 * 60, 30)]
+    for offset in range(days):
+        day = start_date + timedelta(days=offset)
+        db.session.add_all(
+            Appointment(random.choice(patient_ids), doctor_id, day, start, 'Consultation', duration=30)
+            for doctor_id in doctor_ids
+            for start in random.sample(starts, min(per_day, len(starts)))
+        )
+        db.session.commit()
\ No newline at end of file
@@ -0,0 +1,36 @@
+"""Dashboard counters: stored reads against full recounts, and the cost they add to a commit."""
+
+from datetime import date, timedelta
+from common import add_appointments, add_doctors, add_patients, arguments, make_app, timed
+
+def main():
+    args = arguments(__doc__, patients=20000, doctors=30, days=30, per_day=8)
+    app = make_app(args)
+    with app.app_context():
+        from app import db
+        from app.models.dashboard import DashboardCounter
+        from app.models.patient import Patient
+        from app.services import counters
+        
+        patients = add_patients(args.patients)
+        add_appointments(add_doctors(args.doctors), patients, date.today() - timedelta(days=args.days // 2), args.days, args.per_day)
+        names = list(counters.COUNTERS_BY_NAME)
+        print(f'{args.patients} patients, {args.doctors * args.days * args.per_day} appointments, {len(names)} counters')
+        
+        counters.read()
+        timed('read, stored rows', counters.read, args.repeat)
+        timed('recount every counter', lambda: counters.recount(names), args.repeat)
+        
+        def read_after_reset():
+            DashboardCounter.query.delete()
+            db.session.commit()
+            counters.read()
+        timed('read with every row missing', read_after_reset, args.repeat)
+        
+        def commit_one():
+            db.session.add(Patient('Bench', 'Mark', date(1980, 1, 1), 'Female', '555-0199'))
+            db.session.commit()
+        timed('commit adding one patient', commit_one, args.repeat)
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
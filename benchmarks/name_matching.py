@@ -0,0 +1,23 @@
+"""Typo-tolerant name search latency: exact, misspelt and sound-alike names."""
+
+from common import add_patients, arguments, make_app, timed
+
+def main():
+    args = arguments(__doc__, patients=20000)
+    app = make_app(args)
+    with app.app_context():
+        from app.services.name_matching import fuzzy_search
+        
+        add_patients(args.patients)
+        print(f'{args.patients} patients')
+        cases = {
+            'exact "John Smith"': 'John Smith',
+            'sound-alike "Jon Smyth"': 'Jon Smyth',
+            'typo "Jhon Smiht"': 'Jhon Smiht',
+            'single name "Garcia"': 'Garcia',
+        }
+        for label, term in cases.items():
+            timed(label, lambda: fuzzy_search(term, limit=10), args.repeat)
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
@@ -0,0 +1,27 @@
+"""Patient search latency by kind of term (indexed search service)."""
+
+import random
+from common import add_patients, arguments, make_app, timed
+
+def main():
+    args = arguments(__doc__, patients=20000)
+    app = make_app(args)
+    with app.app_context():
+        from app.models.patient import Patient
+        from app.services.patient_search import search_patients
+        
+        add_patients(args.patients)
+        sample = random.choice(Patient.query.limit(1000).all())
+        print(f'{args.patients} patients')
+        cases = {
+            'last name prefix "smi"': 'smi',
+            'first and last name': f'{sample.first_name} {sample.last_name}',
+            'short prefix "jo"': 'jo',
+            'patient id prefix': sample.patient_id[:-2],
+            'email': sample.email,
+        }
+        for label, term in cases.items():
+            timed(label, lambda: search_patients(term, limit=10), args.repeat)
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
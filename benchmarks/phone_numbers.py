@@ -0,0 +1,24 @@
+"""Phone number lookups on the digits columns: duplicate checks and prefix searches."""
+
+import random
+from common import add_patients, arguments, make_app, timed
+
+def main():
+    args = arguments(__doc__, patients=20000)
+    app = make_app(args)
+    with app.app_context():
+        from app.models.patient import Patient
+        from app.services.patient_search import search_patients
+        from app.services.phone_numbers import find_patient_by_phone
+        
+        add_patients(args.patients)
+        phone = random.choice(Patient.query.limit(1000).all()).phone
+        digits = ''.join(char for char in phone if char.isdigit())
+        print(f'{args.patients} patients')
+        timed('duplicate check, other format', lambda: find_patient_by_phone(f'{digits[:3]}.{digits[3:6]}.{digits[6:]}'), args.repeat)
+        timed('search by area code', lambda: search_patients(phone[:5]), args.repeat)
+        timed('search by full number', lambda: search_patients(phone), args.repeat)
+        timed('search by last digits', lambda: search_patients(digits[-4:]), args.repeat)
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
@@ -0,0 +1,22 @@
+"""Free slot computation for many doctors over a date range."""
+
+from datetime import date, timedelta
+from common import add_appointments, add_doctors, add_patients, arguments, make_app, timed
+
+def main():
+    args = arguments(__doc__, doctors=30, days=31, per_day=8, patients=1000)
+    app = make_app(args)
+    with app.app_context():
+        from app.services.scheduling import available_slots, slots_for_doctors
+        
+        start = date.today() + timedelta(days=1)
+        end = start + timedelta(days=args.days - 1)
+        doctors = add_doctors(args.doctors)
+        add_appointments(doctors, add_patients(args.patients), start, args.days, args.per_day)
+        print(f'{args.doctors} doctors x {args.days} days, {args.per_day} appointments per doctor and day')
+        timed('slots_for_doctors, whole range', lambda: slots_for_doctors(doctors, start, end), args.repeat)
+        timed('slots_for_doctors, 15 min grid', lambda: slots_for_doctors(doctors, start, end, granularity=15), args.repeat)
+        timed('available_slots, one doctor and day', lambda: available_slots(doctors[0], start), args.repeat)
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
@@ -18,9 +18,58 @@ class Config:
     # Security settings
     WTF_CSRF_ENABLED = True
     WTF_CSRF_TIME_LIMIT = 3600
+    
+    # Autocomplete settings
+    AUTOCOMPLETE_REFRESH_SECONDS = int(os.environ.get('AUTOCOMPLETE_REFRESH_SECONDS') or 600)
+    
+    # Appointment scheduling
+    APPOINTMENT_DAY_START = os.environ.get('APPOINTMENT_DAY_START') or '09:00'
+    APPOINTMENT_DAY_END = os.environ.get('APPOINTMENT_DAY_END') or '17:00'
+    APPOINTMENT_SLOT_GRANULARITY = int(os.environ.get('APPOINTMENT_SLOT_GRANULARITY') or 0)  # 0: step by duration
+    SCHEDULE_CACHE_SECONDS = int(os.environ.get('SCHEDULE_CACHE_SECONDS') or 300)
+    SLOT_HOLD_SECONDS = int(os.environ.get('SLOT_HOLD_SECONDS') or 120)
+    BOOKING_RETRY_LIMIT = int(os.environ.get('BOOKING_RETRY_LIMIT') or 10)
+    WAITLIST_OFFER_SECONDS = int(os.environ.get('WAITLIST_OFFER_SECONDS') or 1800)
+    
+    # Payload cache settings
+    CACHE_BACKEND = os.environ.get('CACHE_BACKEND') or 'memory'  # memory, sqlite or redis
+    CACHE_URL = os.environ.get('CACHE_URL') or ''  # SQLite file path or redis:// URL
+    CACHE_TTL_SECONDS = int(os.environ.get('CACHE_TTL_SECONDS') or 60)
+    CACHE_STALE_SECONDS = int(os.environ.get('CACHE_STALE_SECONDS') or 30)
+    CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES') or 1024)
+    
+    # Live update stream settings
+    EVENTS_SYNC_SECONDS = int(os.environ.get('EVENTS_SYNC_SECONDS') or 30)  # rebuild even without local commits
+    EVENTS_DEBOUNCE_SECONDS = float(os.environ.get('EVENTS_DEBOUNCE_SECONDS') or 0.5)
+    EVENTS_HEARTBEAT_SECONDS = int(os.environ.get('EVENTS_HEARTBEAT_SECONDS') or 15)
+    # Each stream holds a worker; the default ends it within Gunicorn's 30 s sync worker timeout and
+    # browsers reconnect. Raise it only with threaded or gevent workers.
+    EVENTS_STREAM_SECONDS = int(os.environ.get('EVENTS_STREAM_SECONDS') or 25)
+    EVENTS_RETRY_MS = int(os.environ.get('EVENTS_RETRY_MS') or 3000)
+    
+    # Record code settings
+    ID_BLOCK_SIZE = int(os.environ.get('ID_BLOCK_SIZE') or 100)  # numbers reserved per process at a time
+    
+    # Relationship loading settings
+    # Raise on relationships a serializer's loading policy doesn't declare (see services.loading)
+    EAGER_LOADING_STRICT = os.environ.get('EAGER_LOADING_STRICT', 'false').lower() in ['true', 'on', '1']
+    
+    # Query budget settings (see services.query_budget)
+    SQLALCHEMY_RECORD_QUERIES = os.environ.get('SQLALCHEMY_RECORD_QUERIES', 'false').lower() in ['true', 'on', '1']
+    QUERY_REPEAT_LIMIT = int(os.environ.get('QUERY_REPEAT_LIMIT') or 10)  # same statement shape per request
+    QUERY_BUDGET_RAISE = False  # log breaches; tests raise instead
+    
+    # Slow query log settings (see services.profiler)
+    SLOW_QUERY_MS = int(os.environ.get('SLOW_QUERY_MS') or 500)  # 0 turns the log off
+    SLOW_QUERY_KEEP_DAYS = int(os.environ.get('SLOW_QUERY_KEEP_DAYS') or 30)
+    
+    # Pagination settings
+    PAGINATION_COUNT_TTL = int(os.environ.get('PAGINATION_COUNT_TTL') or 60)
 
 class DevelopmentConfig(Config):
     DEBUG = True
+    EAGER_LOADING_STRICT = True
+    SQLALCHEMY_RECORD_QUERIES = True
 
 class ProductionConfig(Config):
     DEBUG = False
@@ -28,6 +77,9 @@ class ProductionConfig(Config):
 class TestingConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    EAGER_LOADING_STRICT = True
+    SQLALCHEMY_RECORD_QUERIES = True
+    QUERY_BUDGET_RAISE = True
 
 config = {
     'development': DevelopmentConfig,
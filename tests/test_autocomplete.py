@@ -0,0 +1,99 @@
+"""Autocomplete prefix index: lookups, phone queries and commit-time changes."""
+
+import random
+from datetime import date
+import pytest
+from app import create_app, db
+from app.models.patient import Patient
+from app.services import autocomplete
+from app.services.autocomplete import PrefixIndex, normalize_query, suggest
+
+@pytest.fixture
+def app():
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        patients = [
+            Patient('John', 'Smith', date(1980, 1, 1), 'Male', '(555) 123-4567'),
+            Patient('Mary', 'Jones', date(1985, 1, 1), 'Female', '555.987.6543'),
+        ]
+        db.session.add_all(patients)
+        db.session.commit()
+        app.config['PATIENT_IDS'] = [patient.id for patient in patients]
+        app.config['PATIENT_CODES'] = [patient.patient_id for patient in patients]
+    yield app
+    with app.app_context():
+        db.drop_all()
+
+def suggested_ids(term):
+    return [record_id for record_id, _ in suggest('patient', term)]
+
+def test_names_codes_and_phone_digits_are_found_by_prefix(app):
+    john, mary = app.config['PATIENT_IDS']
+    with app.app_context():
+        assert suggested_ids('jo') == [john, mary]
+        assert suggested_ids('Smith J') == [john]
+        assert suggested_ids('mary jo') == [mary]
+        assert suggested_ids(app.config['PATIENT_CODES'][1]) == [mary]
+        assert suggested_ids('smyth') == []
+        assert suggest('patient', 'john')[0][1] == f"John Smith ({app.config['PATIENT_CODES'][0]})"
+
+def test_phone_queries_are_reduced_to_digits(app):
+    john, mary = app.config['PATIENT_IDS']
+    assert normalize_query('(555) 123-45') == '55512345'
+    assert normalize_query('  Mary   JONES ') == 'mary jones'
+    with app.app_context():
+        assert suggested_ids('555-123') == [john]
+        assert suggested_ids('555 98') == [mary]
+        assert sorted(suggested_ids('(555)')) == [john, mary]
+
+def test_committed_changes_are_applied(app):
+    john, mary = app.config['PATIENT_IDS']
+    with app.app_context():
+        suggested_ids('jo')
+        db.session.get(Patient, john).last_name = 'Smyth'
+        db.session.get(Patient, mary).is_active = False
+        db.session.commit()
+        assert suggested_ids('smyth') == [john]
+        assert suggested_ids('smith') == []
+        assert suggested_ids('mary') == []
+
+def test_rolled_back_changes_are_discarded(app):
+    john, _ = app.config['PATIENT_IDS']
+    with app.app_context():
+        suggested_ids('jo')
+        db.session.get(Patient, john).last_name = 'Smyth'
+        db.session.add(Patient('Joan', 'Baker', date(1990, 1, 1), 'Female', '555-0100'))
+        db.session.flush()
+        db.session.rollback()
+        db.session.commit()
+        assert suggested_ids('smyth') == []
+        assert suggested_ids('joan') == []
+        assert suggested_ids('smith') == [john]
+
+def test_index_matches_a_plain_sorted_list_across_chunks(monkeypatch):
+    monkeypatch.setattr(autocomplete, 'CHUNK_SIZE', 3)
+    random.seed(7)
+    names = ['ann', 'anna', 'bob', 'bobby', 'carl', 'carla', 'dan']
+    entries = {}
+    index = PrefixIndex()
+    index.load([])
+    for _ in range(300):
+        record_id = random.randrange(40)
+        if random.random() < 0.3:
+            entries.pop(record_id, None)
+            changes = [(record_id, None)]
+        else:
+            keys = random.sample(names, 2)
+            entries[record_id] = keys
+            changes = [(record_id, (record_id, f'Record {record_id}', keys))]
+        index.apply(changes)
+        
+        pairs = sorted((key, record_id) for record_id, keys in entries.items() for key in keys)
+        keys = [key for chunk in index._chunks for key in chunk]
+        ids = [record_id for chunk in index._chunk_ids for record_id in chunk]
+        assert keys == [key for key, _ in pairs] and sorted(zip(keys, ids)) == pairs
+        assert all(0 < len(chunk) <= 6 for chunk in index._chunks)
+        for prefix in ('a', 'anna', 'b', 'c', 'z', ''):
+            found = [record_id for record_id, _ in index.search(prefix, limit=100)]
+            assert sorted(found) == sorted({record_id for key, record_id in pairs if key.startswith(prefix)})
\ No newline at end of file
@@ -0,0 +1,151 @@
+"""Slot holds and bookings racing for one slot."""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, time, timedelta
+import pytest
+import config
+from app import create_app, db
+from app.models.appointment import Appointment, SlotHold
+from app.models.patient import Patient
+from app.models.staff import Staff
+from app.models.user import User
+from app.services.booking import (
+    BookingConflict, HoldExpired, claim_doctor, confirm_hold, create_appointment, hold_slot, hold_stress,
+    place_hold, release_hold, sweep_expired_holds
+)
+
+SLOT_DATE = date.today() + timedelta(days=30)
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    # Threads need a database file; each in-memory connection is a database of its own
+    monkeypatch.setattr(config.TestingConfig, 'SQLALCHEMY_DATABASE_URI', f"sqlite:///{tmp_path / 'booking.db'}")
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        doctor = User('doctor', 'doctor@example.com', 'secret', 'doctor')
+        db.session.add(doctor)
+        db.session.commit()
+        staff = Staff(doctor.id, 'John', 'Smith', 'Male', '555-0101', 'john.smith@example.com', 'Cardiology')
+        patients = [Patient(f'Patient{i}', 'Test', date(1980, 1, 1), 'Female', f'555-010{i}') for i in range(2)]
+        db.session.add_all([staff] + patients)
+        db.session.commit()
+        app.config['DOCTOR_ID'] = staff.id
+        app.config['PATIENT_IDS'] = [patient.id for patient in patients]
+    yield app
+    with app.app_context():
+        db.drop_all()
+
+def race(app, attempt, attempts=20):
+    """Run ``attempt()`` from ``attempts`` threads at once; returns the outcome of each."""
+    start = threading.Barrier(attempts)
+    
+    def run(_):
+        with app.app_context():
+            start.wait(timeout=5)
+            try:
+                return attempt()
+            except (BookingConflict, HoldExpired) as e:
+                db.session.rollback()
+                return type(e).__name__
+            finally:
+                db.session.remove()
+    
+    with ThreadPoolExecutor(max_workers=attempts) as executor:
+        return list(executor.map(run, range(attempts)))
+
+def test_concurrent_holds_one_wins(app):
+    counts, errors = hold_stress(app, app.config['DOCTOR_ID'], SLOT_DATE, time(10), attempts=40, workers=20)
+    assert counts == {'won': 1, 'conflict': 39, 'error': 0}, errors
+    with app.app_context():
+        # The winner was released afterwards
+        assert SlotHold.query.count() == 0
+
+def test_concurrent_bookings_one_wins(app):
+    doctor_id = app.config['DOCTOR_ID']
+    patient_id = app.config['PATIENT_IDS'][0]
+    
+    def book():
+        create_appointment(patient_id, doctor_id, SLOT_DATE, time(10), 'Consultation')
+        db.session.commit()
+        return 'booked'
+    
+    outcomes = race(app, book)
+    assert outcomes.count('booked') == 1
+    assert set(outcomes) == {'booked', 'BookingConflict'}
+    with app.app_context():
+        assert Appointment.query.filter_by(appointment_date=SLOT_DATE).count() == 1
+
+def test_concurrent_confirms_of_one_hold_one_wins(app):
+    with app.app_context():
+        token = hold_slot(app.config['DOCTOR_ID'], SLOT_DATE, time(10), patient_id=app.config['PATIENT_IDS'][0]).hold_token
+    
+    def confirm():
+        confirm_hold(token, 'Consultation')
+        db.session.commit()
+        return 'booked'
+    
+    outcomes = race(app, confirm)
+    assert outcomes.count('booked') == 1
+    assert set(outcomes) <= {'booked', 'BookingConflict', 'HoldExpired'}
+    with app.app_context():
+        assert Appointment.query.filter_by(appointment_date=SLOT_DATE).count() == 1
+        assert SlotHold.query.count() == 0
+
+def test_hold_blocks_other_bookings(app):
+    doctor_id = app.config['DOCTOR_ID']
+    first, second = app.config['PATIENT_IDS']
+    with app.app_context():
+        hold = hold_slot(doctor_id, SLOT_DATE, time(10), patient_id=first)
+        with pytest.raises(BookingConflict):
+            create_appointment(second, doctor_id, SLOT_DATE, time(10, 15), 'Consultation')
+        db.session.rollback()
+        with pytest.raises(BookingConflict):
+            hold_slot(doctor_id, SLOT_DATE, time(9, 45))
+        
+        appointment = confirm_hold(hold.hold_token, 'Consultation')
+        db.session.commit()
+        assert appointment.patient_id == first
+        with pytest.raises(HoldExpired):
+            confirm_hold(hold.hold_token, 'Consultation')
+
+def test_expired_hold_can_be_retaken(app):
+    doctor_id = app.config['DOCTOR_ID']
+    with app.app_context():
+        lapsed = hold_slot(doctor_id, SLOT_DATE, time(10), seconds=-1)
+        retaken = hold_slot(doctor_id, SLOT_DATE, time(10))
+        assert retaken.hold_token != lapsed.hold_token
+        with pytest.raises(HoldExpired):
+            confirm_hold(lapsed.hold_token, 'Consultation', patient_id=app.config['PATIENT_IDS'][0])
+
+def test_sweep_frees_the_slot(app):
+    doctor_id = app.config['DOCTOR_ID']
+    with app.app_context():
+        hold_slot(doctor_id, SLOT_DATE, time(10), seconds=-1)
+        active = hold_slot(doctor_id, SLOT_DATE, time(11))
+        assert sweep_expired_holds() == 1
+        assert [hold.hold_token for hold in SlotHold.query] == [active.hold_token]
+        
+        create_appointment(app.config['PATIENT_IDS'][0], doctor_id, SLOT_DATE, time(10), 'Consultation')
+        db.session.commit()
+        with pytest.raises(BookingConflict):
+            create_appointment(app.config['PATIENT_IDS'][1], doctor_id, SLOT_DATE, time(11), 'Consultation')
+
+def test_release_frees_the_slot(app):
+    doctor_id = app.config['DOCTOR_ID']
+    with app.app_context():
+        hold = hold_slot(doctor_id, SLOT_DATE, time(10))
+        assert release_hold(hold.hold_token)
+        assert not release_hold(hold.hold_token)
+        place_hold(doctor_id, SLOT_DATE, time(10))
+        db.session.commit()
+
+def test_claim_doctor_bumps_version(app):
+    with app.app_context():
+        doctor = db.session.get(Staff, app.config['DOCTOR_ID'])
+        version = doctor.booking_version
+        assert claim_doctor(doctor.id) == version + 1
+        db.session.commit()
+        with pytest.raises(BookingConflict):
+            claim_doctor(doctor.id + 1000)
\ No newline at end of file
@@ -0,0 +1,108 @@
+"""Bulk appointment changes: the in-memory timeline and partial versus atomic batches."""
+
+from datetime import date, time, timedelta
+import pytest
+from app import create_app, db
+from app.models.appointment import Appointment
+from app.models.patient import Patient
+from app.models.staff import Staff
+from app.models.user import User
+from app.services.booking import create_appointment
+from app.services.booking_batch import _Timeline, apply_batch
+
+SLOT_DATE = date.today() + timedelta(days=14)
+
+@pytest.fixture
+def app():
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        doctor = User('doctor', 'doctor@example.com', 'secret', 'doctor')
+        db.session.add(doctor)
+        db.session.commit()
+        staff = Staff(doctor.id, 'John', 'Smith', 'Male', '555-0101', 'john.smith@example.com', 'Cardiology')
+        patient = Patient('Mary', 'Jones', date(1980, 1, 1), 'Female', '555-0102')
+        db.session.add_all([staff, patient])
+        db.session.commit()
+        booked = create_appointment(patient.id, staff.id, SLOT_DATE, time(10), 'Consultation')
+        db.session.commit()
+        app.config['DOCTOR_ID'] = staff.id
+        app.config['PATIENT_ID'] = patient.id
+        app.config['BOOKED_ID'] = booked.id
+    yield app
+    with app.app_context():
+        db.drop_all()
+
+def create(app, at, day=SLOT_DATE, **fields):
+    return dict({
+        'op': 'create', 'patient_id': app.config['PATIENT_ID'], 'doctor_id': app.config['DOCTOR_ID'],
+        'date': day.isoformat(), 'time': at, 'appointment_type': 'Consultation'
+    }, **fields)
+
+def test_timeline_overlap_is_half_open():
+    timeline = _Timeline()
+    timeline.add(600, 630, 'a')
+    timeline.add(700, 760, 'b')
+    assert timeline.overlapping(630, 700) == []
+    assert timeline.overlapping(570, 600) == []
+    assert timeline.overlapping(629, 701) == ['b', 'a']
+    assert timeline.overlapping(600, 630, ignore='a') == []
+
+def test_timeline_finds_long_intervals_starting_well_before():
+    timeline = _Timeline()
+    timeline.add(0, 1000, 'long')
+    for start in range(100, 900, 30):
+        timeline.add(start, start + 15, start)
+    assert timeline.overlapping(950, 960) == ['long']
+    timeline.remove(0, 1000, 'long')
+    assert timeline.overlapping(950, 960) == []
+    assert timeline.overlapping(105, 110) == [100]
+
+def test_partial_batch_applies_accepted_operations(app):
+    with app.app_context():
+        results, applied = apply_batch([
+            create(app, '10:15'),
+            create(app, '11:00'),
+            {'op': 'cancel', 'id': app.config['BOOKED_ID']},
+            # The slot the cancel above just freed
+            create(app, '10:00'),
+            create(app, '11:15'),
+            {'op': 'bogus'},
+        ])
+        assert [result['status'] for result in results] == ['error', 'ok', 'ok', 'ok', 'error', 'error']
+        assert results[0]['conflicts'] == [db.session.get(Appointment, app.config['BOOKED_ID']).appointment_id]
+        assert results[4]['conflicts'] == ['operation 1']
+        assert applied == 3
+        
+        active = Appointment.query.filter(Appointment.status != 'cancelled').order_by(Appointment.appointment_time)
+        assert [appointment.appointment_time for appointment in active] == [time(10), time(11)]
+        assert db.session.get(Appointment, app.config['BOOKED_ID']).status == 'cancelled'
+
+def test_atomic_batch_writes_nothing_when_one_operation_fails(app):
+    with app.app_context():
+        results, applied = apply_batch([
+            create(app, '11:00'),
+            {'op': 'move', 'id': app.config['BOOKED_ID'], 'time': '12:00'},
+            create(app, '11:15'),
+        ], atomic=True)
+        assert applied == 0
+        assert [result['status'] for result in results] == ['skipped', 'skipped', 'error']
+        assert Appointment.query.count() == 1
+        assert db.session.get(Appointment, app.config['BOOKED_ID']).appointment_time == time(10)
+        
+        results, applied = apply_batch([
+            create(app, '11:00'),
+            {'op': 'move', 'id': app.config['BOOKED_ID'], 'time': '12:00'},
+        ], atomic=True)
+        assert applied == 2
+        assert db.session.get(Appointment, app.config['BOOKED_ID']).appointment_time == time(12)
+
+def test_moves_see_appointments_running_past_midnight(app):
+    with app.app_context():
+        results, applied = apply_batch([
+            create(app, '23:30', duration=120),
+            {'op': 'move', 'id': app.config['BOOKED_ID'], 'date': (SLOT_DATE + timedelta(days=1)).isoformat(), 'time': '01:00'},
+            {'op': 'move', 'id': app.config['BOOKED_ID'], 'date': (SLOT_DATE + timedelta(days=1)).isoformat(), 'time': '01:30'},
+        ])
+        assert [result['status'] for result in results] == ['ok', 'error', 'ok']
+        assert applied == 2
\ No newline at end of file
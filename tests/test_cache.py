@@ -0,0 +1,66 @@
+"""Payload cache: tag invalidation shared between workers through the backend."""
+
+import time
+import pytest
+from app.services.cache import Cache, MemoryBackend, SQLiteBackend
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def backends(request, tmp_path):
+    """Two workers' backends over the same store."""
+    if request.param == 'memory':
+        backend = MemoryBackend()
+        return backend, backend
+    path = str(tmp_path / 'cache.sqlite')
+    return SQLiteBackend(path), SQLiteBackend(path)
+
+def test_fetch_caches_until_a_tag_is_invalidated(backends):
+    first, second = (Cache(backend, ttl=60, stale=60) for backend in backends)
+    calls = []
+    
+    def compute():
+        calls.append(1)
+        return len(calls)
+    
+    assert first.fetch('figures', compute, tags=('patients',)) == 1
+    assert second.fetch('figures', compute, tags=('patients',)) == 1
+    assert first.invalidate(['appointments']) == 0
+    assert second.fetch('figures', compute, tags=('patients',)) == 1
+    
+    assert first.invalidate(['patients']) == 1
+    assert second.fetch('figures', compute, tags=('patients',)) == 2
+
+def test_value_computed_across_another_workers_invalidation_is_not_stored(backends):
+    first, second = (Cache(backend, ttl=60, stale=60) for backend in backends)
+    
+    def compute_while_invalidated():
+        # The other worker commits a change to the table while this one computes
+        first.invalidate(['patients'])
+        return 'stale'
+    
+    assert second.fetch('figures', compute_while_invalidated, tags=('patients',)) == 'stale'
+    assert first.fetch('figures', lambda: 'current', tags=('patients',)) == 'current'
+    assert second.fetch('figures', lambda: 'recomputed', tags=('patients',)) == 'current'
+
+def test_clear_drops_entries_and_in_flight_values(backends):
+    first, second = (Cache(backend, ttl=60, stale=60) for backend in backends)
+    first.fetch('figures', lambda: 1)
+    
+    def compute_while_cleared():
+        first.clear()
+        return 2
+    
+    assert second.fetch('other', compute_while_cleared) == 2
+    assert len(backends[0]) == 0
+
+def test_version_only_grows(backends):
+    backend = backends[0]
+    version = backend.version(['patients', 'bills'])
+    backend.invalidate(['patients'])
+    assert backend.version(['patients', 'bills']) == version + 1
+    assert backend.version(['bills']) == version
+    
+    now = time.time()
+    backend.set('figures', 1, now + 60, now + 120, ['bills'], version)
+    assert backend.get('figures')[0] == 1
+    backend.set('figures', 2, now + 60, now + 120, ['patients'], version)
+    assert backend.get('figures')[0] == 1
\ No newline at end of file
@@ -0,0 +1,84 @@
+"""Dashboard counters kept by flush deltas and recounted on a new day."""
+
+from datetime import date, time, timedelta
+import pytest
+import config
+from app import create_app, db
+from app.models.appointment import Appointment
+from app.models.dashboard import DashboardCounter
+from app.models.patient import Patient
+from app.models.staff import Staff
+from app.models.user import User
+from app.services import counters
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    # A database file, so a concurrent writer has a connection of its own
+    monkeypatch.setattr(config.TestingConfig, 'SQLALCHEMY_DATABASE_URI', f"sqlite:///{tmp_path / 'counters.db'}")
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        doctor = User('doctor', 'doctor@example.com', 'secret', 'doctor')
+        db.session.add(doctor)
+        db.session.commit()
+        staff = Staff(doctor.id, 'John', 'Smith', 'Male', '555-0101', 'john.smith@example.com', 'Cardiology')
+        patient = Patient('Jane', 'Doe', date(1980, 1, 1), 'Female', '555-0102')
+        db.session.add_all([staff, patient])
+        db.session.commit()
+        app.config['DOCTOR_ID'] = staff.id
+        app.config['PATIENT_ID'] = patient.id
+    yield app
+    with app.app_context():
+        db.drop_all()
+
+def book_today(app, hour):
+    db.session.add(Appointment(app.config['PATIENT_ID'], app.config['DOCTOR_ID'], date.today(), time(hour), 'Consultation'))
+    db.session.commit()
+
+def test_flush_deltas_keep_counters_current(app):
+    with app.app_context():
+        assert counters.read()['appointments_today'] == 0
+        book_today(app, 9)
+        book_today(app, 10)
+        assert counters.read('appointments_today') == {'appointments_today': 2}
+        assert counters.reconcile() == {}
+
+def test_new_day_recounts_stale_rows(app):
+    with app.app_context():
+        book_today(app, 9)
+        counters.read()
+        row = db.session.get(DashboardCounter, 'appointments_today')
+        row.as_of = date.today() - timedelta(days=1)
+        row.value = 7
+        db.session.commit()
+        
+        # A delta doesn't apply to a figure counted for another day
+        book_today(app, 10)
+        assert db.session.get(DashboardCounter, 'appointments_today').value == 7
+        assert counters.read('appointments_today') == {'appointments_today': 2}
+        # Stored on a connection of its own
+        db.session.expire_all()
+        assert db.session.get(DashboardCounter, 'appointments_today').as_of == date.today()
+
+def test_recount_keeps_change_committed_while_counting(app, monkeypatch):
+    with app.app_context():
+        counters.read()
+        db.session.get(DashboardCounter, 'appointments_today').as_of = date.today() - timedelta(days=1)
+        db.session.commit()
+    
+    recount = counters.recount
+    
+    def recount_then_book(names, day=None):
+        values = recount(names, day)
+        # Another request books between the recount and its write
+        with app.app_context():
+            book_today(app, 11)
+        return values
+    monkeypatch.setattr(counters, 'recount', recount_then_book)
+    
+    with app.app_context():
+        assert counters.read('appointments_today') == {'appointments_today': 0}
+        monkeypatch.setattr(counters, 'recount', recount)
+        db.session.remove()
+        assert counters.read('appointments_today') == {'appointments_today': 1}
+        assert counters.reconcile() == {}
\ No newline at end of file
@@ -0,0 +1,60 @@
+"""Live dashboard feed: commits reaching subscriptions and the /events stream."""
+
+from datetime import date
+import pytest
+import config
+from app import create_app, db
+from app.models.patient import Patient
+from app.models.user import User
+from app.services import events
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    # The feed rebuilds snapshots on its own thread and connection
+    monkeypatch.setattr(config.TestingConfig, 'SQLALCHEMY_DATABASE_URI', f"sqlite:///{tmp_path / 'events.db'}")
+    app = create_app('testing')
+    # Only commits may wake the feed during a test
+    app.config.update(EVENTS_SYNC_SECONDS=60, EVENTS_DEBOUNCE_SECONDS=0, EVENTS_HEARTBEAT_SECONDS=1)
+    with app.app_context():
+        db.create_all()
+        admin = User('admin', 'admin@example.com', 'secret', 'admin')
+        db.session.add(admin)
+        db.session.commit()
+        app.config['ADMIN_ID'] = admin.id
+    yield app
+    with app.app_context():
+        db.drop_all()
+
+def add_patient(name):
+    db.session.add(Patient(name, 'Test', date(1980, 1, 1), 'Female', '555-0100'))
+    db.session.commit()
+
+def test_committed_change_reaches_subscription(app):
+    with app.app_context():
+        feed = events.get_feed()
+        subscription = feed.subscribe()
+        try:
+            before = events.figures()['patients_active']
+            add_patient('First')
+            snapshot = subscription.get(timeout=5)
+            assert snapshot is not None
+            assert snapshot['figures']['patients_active'] == before + 1
+            
+            add_patient('Second')
+            assert subscription.get(timeout=5)['figures']['patients_active'] == before + 2
+        finally:
+            feed.unsubscribe(subscription)
+
+def test_stream_sends_everything_then_ends_for_reconnect(app):
+    app.config['EVENTS_STREAM_SECONDS'] = 1
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(app.config['ADMIN_ID'])
+    
+    response = client.get('/events')
+    body = response.get_data(as_text=True)
+    assert response.mimetype == 'text/event-stream'
+    assert body.startswith(f"retry: {app.config['EVENTS_RETRY_MS']}")
+    assert 'event: stats' in body
+    with app.app_context():
+        assert not events.get_feed()._subscribers
\ No newline at end of file
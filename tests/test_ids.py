@@ -0,0 +1,69 @@
+"""Record codes: numbers from reserved blocks, unique across blocks, sessions and rollbacks."""
+
+from datetime import date
+import pytest
+from app import create_app, db
+from app.models.sequence import IdSequence
+from app.services.ids import NUMBER_WIDTH, allocate_id, next_number
+
+@pytest.fixture
+def app():
+    app = create_app('testing')
+    app.config['ID_BLOCK_SIZE'] = 3
+    with app.app_context():
+        db.create_all()
+    yield app
+    with app.app_context():
+        db.drop_all()
+
+def numbers(count):
+    return [next_number('T') for _ in range(count)]
+
+def test_code_shape(app):
+    with app.app_context():
+        assert allocate_id('APT', date(2026, 10, 17)) == 'APT20261017' + '1'.zfill(NUMBER_WIDTH)
+        assert allocate_id('APT').startswith('APT' + date.today().strftime('%Y%m%d'))
+
+def test_numbers_run_on_across_blocks(app):
+    with app.app_context():
+        taken = numbers(4)
+        db.session.commit()
+        taken += numbers(4)
+        db.session.commit()
+        assert taken == list(range(1, 9))
+        # Three blocks of three reserved
+        assert db.session.get(IdSequence, 'T').next_value == 10
+
+def test_sessions_never_share_numbers(app):
+    with app.app_context():
+        first = numbers(2)
+        db.session.commit()
+        db.session.remove()
+        second = numbers(2)
+        db.session.commit()
+        db.session.remove()
+        assert not set(first) & set(second)
+
+def test_rolled_back_block_is_not_handed_out(app):
+    with app.app_context():
+        numbers(1)
+        db.session.rollback()
+        # The reservation was undone, so the numbers are free again
+        assert numbers(1) == [1]
+        db.session.commit()
+
+def test_block_reserved_in_a_rolled_back_savepoint_is_dropped(app):
+    with app.app_context():
+        # Uses up the first block; the second is reserved inside the savepoint
+        mine = numbers(3)
+        savepoint = db.session.begin_nested()
+        numbers(1)
+        savepoint.rollback()
+        mine += numbers(1)
+        db.session.commit()
+        db.session.remove()
+        
+        theirs = numbers(3)
+        db.session.commit()
+        assert len(set(mine)) == 4
+        assert not set(mine) & set(theirs)
\ No newline at end of file
@@ -0,0 +1,51 @@
+"""Typo-tolerant name search over the phonetic key index."""
+
+from datetime import date
+import pytest
+from app import create_app, db
+from app.models.patient import Patient
+from app.services import name_matching
+from app.services.name_matching import fuzzy_search, lookup_keys, phonetic_key
+
+@pytest.fixture
+def app():
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+    yield app
+    with app.app_context():
+        db.drop_all()
+
+def add_patients(*names):
+    patients = [Patient(first, last, date(1980, 1, 1), 'Female', f'555-01{i:02d}') for i, (first, last) in enumerate(names)]
+    db.session.add_all(patients)
+    db.session.commit()
+    return patients
+
+def test_phonetic_keys_of_sound_alikes():
+    assert phonetic_key('John') == phonetic_key('Jon')
+    assert phonetic_key('Smith') == phonetic_key('Smyth')
+    assert phonetic_key('Smiht') in lookup_keys('smiht') and phonetic_key('Smith') in lookup_keys('smiht')
+
+def test_sound_alikes_and_typos_rank_after_exact_names(app):
+    with app.app_context():
+        smyth, smith, other = add_patients(('Jon', 'Smyth'), ('John', 'Smith'), ('Mary', 'Jones'))
+        assert fuzzy_search('John Smith') == [smith, smyth]
+        assert fuzzy_search('Jhon Smiht') == [smith, smyth]
+        assert fuzzy_search('Jones')[0] == other
+
+def test_exact_names_survive_the_candidate_limit(app, monkeypatch):
+    monkeypatch.setattr(name_matching, 'CANDIDATE_LIMIT', 3)
+    with app.app_context():
+        # Sound-alikes with lower ids would fill the limit if rows were read unordered
+        add_patients(*[('Smyth', 'Smyth')] * 3)
+        smith, = add_patients(('Smith', 'Smith'))
+        assert fuzzy_search('Smith', limit=1) == [smith]
+
+def test_inactive_and_excluded_patients_are_left_out(app):
+    with app.app_context():
+        active, inactive = add_patients(('John', 'Smith'), ('John', 'Smith'))
+        inactive.is_active = False
+        db.session.commit()
+        assert fuzzy_search('John Smith') == [active]
+        assert fuzzy_search('John Smith', active_only=False, exclude_ids={active.id}) == [inactive]
\ No newline at end of file
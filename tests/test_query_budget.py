@@ -0,0 +1,69 @@
+"""Per-request statement budgets, checked through the test client."""
+
+from datetime import date
+import pytest
+from flask import jsonify
+from app import create_app, db
+from app.models.patient import Patient
+from app.models.user import User
+from app.services.query_budget import QueryBudgetExceeded, query_budget, statement_shape
+
+@pytest.fixture
+def app():
+    app = create_app('testing')
+    
+    @app.route('/_test/patients/<int:rounds>')
+    @query_budget(2)
+    def count_patients(rounds):
+        return jsonify([Patient.query.count() for _ in range(rounds)])
+    
+    @app.route('/_test/repeated/<int:rounds>')
+    @query_budget(repeats=2)
+    def repeat_patients(rounds):
+        return jsonify([Patient.query.count() for _ in range(rounds)])
+    
+    with app.app_context():
+        db.create_all()
+        admin = User('admin', 'admin@example.com', 'secret', 'admin')
+        db.session.add(admin)
+        db.session.add_all([Patient(f'Patient{i}', 'Test', date(1980, 1, 1), 'Female', f'555-010{i}') for i in range(3)])
+        db.session.commit()
+        app.config['ADMIN_ID'] = admin.id
+    yield app
+    with app.app_context():
+        db.drop_all()
+
+def test_within_budget(app):
+    response = app.test_client().get('/_test/patients/2')
+    assert response.status_code == 200
+    assert response.get_json() == [3, 3]
+
+def test_statement_budget_breach_raises(app):
+    with pytest.raises(QueryBudgetExceeded, match='3 statements, budget 2'):
+        app.test_client().get('/_test/patients/3')
+
+def test_repeat_limit_breach_raises(app):
+    client = app.test_client()
+    assert client.get('/_test/repeated/2').status_code == 200
+    with pytest.raises(QueryBudgetExceeded, match=r'3x \(limit 2\)'):
+        client.get('/_test/repeated/3')
+
+def test_log_does_not_carry_over_between_requests(app):
+    client = app.test_client()
+    for _ in range(3):
+        assert client.get('/_test/patients/2').status_code == 200
+
+def test_api_route_within_its_budget(app):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(app.config['ADMIN_ID'])
+    
+    response = client.get('/api/patients/options?q=Patient')
+    assert response.status_code == 200
+
+def test_statement_shape_collapses_values_and_in_lists():
+    assert statement_shape('SELECT * FROM patients WHERE id IN (?, ?, ?) AND age > 30') == \
+        statement_shape('SELECT * FROM patients WHERE id IN (?) AND age > 41')
+    assert statement_shape("SELECT  id\n FROM patients WHERE last_name = 'O''Brien'") == \
+        'SELECT id FROM patients WHERE last_name = ?'
+    assert statement_shape('SELECT * FROM t WHERE a IN (%(a_1)s, %(a_2)s)') == 'SELECT * FROM t WHERE a IN (?)'
\ No newline at end of file
@@ -0,0 +1,107 @@
+"""Recurring series: rule expansion, clashes with alternatives, and booking."""
+
+from datetime import date, time, timedelta
+import pytest
+from app import create_app, db
+from app.models.appointment import Appointment
+from app.models.patient import Patient
+from app.models.staff import Staff
+from app.models.user import User
+from app.services import counters
+from app.services.booking import BookingConflict, create_appointment
+from app.services.recurrence import MAX_OCCURRENCES, book_series, expand_dates, plan_series
+
+# A Monday well ahead, so every occurrence is in the future
+START = date.today() + timedelta(days=28 - date.today().weekday())
+
+@pytest.fixture
+def app():
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        doctor = User('doctor', 'doctor@example.com', 'secret', 'doctor')
+        db.session.add(doctor)
+        db.session.commit()
+        staff = Staff(doctor.id, 'John', 'Smith', 'Male', '555-0101', 'john.smith@example.com', 'Cardiology')
+        patients = [Patient(f'Patient{i}', 'Test', date(1980, 1, 1), 'Female', f'555-010{i}') for i in range(2)]
+        db.session.add_all([staff] + patients)
+        db.session.commit()
+        app.config['DOCTOR_ID'] = staff.id
+        app.config['PATIENT_IDS'] = [patient.id for patient in patients]
+    yield app
+    with app.app_context():
+        db.drop_all()
+
+def test_expand_dates_by_count_and_until():
+    assert expand_dates(START, 'daily', count=3) == [START + timedelta(days=i) for i in range(3)]
+    assert expand_dates(START, 'weekly', count=3) == [START + timedelta(weeks=i) for i in range(3)]
+    assert expand_dates(START, 'biweekly', until=START + timedelta(days=30)) == [START + timedelta(weeks=i) for i in (0, 2, 4)]
+    # Whichever limit comes first
+    assert len(expand_dates(START, 'daily', count=10, until=START + timedelta(days=4))) == 5
+
+@pytest.mark.parametrize('frequency, count, until, message', [
+    ('monthly', 3, None, 'Frequency'),
+    ('weekly', None, None, 'count or an end date'),
+    ('weekly', None, START - timedelta(days=1), 'before the start date'),
+    ('daily', MAX_OCCURRENCES + 1, None, 'at most'),
+])
+def test_expand_dates_rejects_invalid_rules(frequency, count, until, message):
+    with pytest.raises(ValueError, match=message):
+        expand_dates(START, frequency, count, until)
+
+def test_plan_series_reports_clashes_with_nearest_alternatives(app):
+    doctor_id = app.config['DOCTOR_ID']
+    with app.app_context():
+        second_week = START + timedelta(weeks=1)
+        create_appointment(app.config['PATIENT_IDS'][1], doctor_id, second_week, time(10), 'Consultation', duration=60)
+        db.session.commit()
+        
+        dates = expand_dates(START, 'weekly', count=3)
+        free_dates, clashes = plan_series(doctor_id, dates, time(10, 30))
+        assert free_dates == [dates[0], dates[2]]
+        assert clashes == [{'date': second_week.isoformat(), 'alternatives': ['09:30', '11:00', '11:30']}]
+
+def test_plan_series_sees_appointments_running_past_midnight(app):
+    doctor_id = app.config['DOCTOR_ID']
+    with app.app_context():
+        create_appointment(app.config['PATIENT_IDS'][1], doctor_id, START, time(23, 30), 'Surgery', duration=120)
+        db.session.commit()
+        
+        free_dates, clashes = plan_series(doctor_id, expand_dates(START, 'daily', count=2), time(0, 30))
+        assert free_dates == [START]
+        assert [clash['date'] for clash in clashes] == [(START + timedelta(days=1)).isoformat()]
+
+def test_book_series_skips_clashes_and_counts_bookings(app):
+    doctor_id = app.config['DOCTOR_ID']
+    patient_id = app.config['PATIENT_IDS'][0]
+    with app.app_context():
+        before = counters.read()['appointments_pending']
+        create_appointment(app.config['PATIENT_IDS'][1], doctor_id, START + timedelta(weeks=1), time(10), 'Consultation')
+        db.session.commit()
+        
+        series, appointments, clashes = book_series(patient_id, doctor_id, START, time(10), 'Follow-up', 'weekly', count=4)
+        db.session.commit()
+        assert [appointment.appointment_date for appointment in appointments] == [START + timedelta(weeks=i) for i in (0, 2, 3)]
+        assert len(clashes) == 1
+        assert series.appointments.count() == 3
+        assert len({appointment.appointment_id for appointment in appointments}) == 3
+        # Flush events keep the counters without any help from the caller
+        assert counters.read()['appointments_pending'] == before + 4
+
+def test_atomic_series_books_nothing_on_a_clash(app):
+    doctor_id = app.config['DOCTOR_ID']
+    with app.app_context():
+        create_appointment(app.config['PATIENT_IDS'][1], doctor_id, START + timedelta(days=2), time(10), 'Consultation')
+        db.session.commit()
+        
+        series, appointments, clashes = book_series(app.config['PATIENT_IDS'][0], doctor_id, START, time(10),
+                                                    'Follow-up', 'daily', count=5, atomic=True)
+        db.session.commit()
+        assert series is None and appointments == []
+        assert len(clashes) == 1
+        assert Appointment.query.count() == 1
+
+def test_book_series_for_unknown_doctor(app):
+    with app.app_context():
+        with pytest.raises(BookingConflict):
+            book_series(app.config['PATIENT_IDS'][0], app.config['DOCTOR_ID'] + 1000, START, time(10), 'Follow-up', 'weekly', count=2)
\ No newline at end of file
@@ -0,0 +1,92 @@
+"""Statement counts of the conditional aggregation module and the dashboard stats API."""
+
+from datetime import date, time, timedelta
+from decimal import Decimal
+import pytest
+from app import create_app, db
+from app.models.appointment import Appointment
+from app.models.billing import Bill, Payment
+from app.models.patient import Patient
+from app.models.staff import Staff
+from app.models.user import User
+from app.services import stats
+from app.services.query_budget import current_log, start_log
+
+@pytest.fixture
+def app():
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        admin = User('admin', 'admin@example.com', 'secret', 'admin')
+        doctor = User('doctor', 'doctor@example.com', 'secret', 'doctor')
+        db.session.add_all([admin, doctor])
+        db.session.commit()
+        staff = Staff(doctor.id, 'John', 'Smith', 'Male', '555-0101', 'john.smith@example.com', 'Cardiology')
+        patients = [Patient(f'Patient{i}', 'Test', date(1980, 1, 1), 'Female', f'555-010{i}') for i in range(3)]
+        db.session.add_all([staff] + patients)
+        db.session.commit()
+        today = date.today()
+        db.session.add_all([
+            Appointment(patient.id, staff.id, today + timedelta(days=i), time(9), 'Consultation')
+            for i, patient in enumerate(patients)
+        ])
+        bill = Bill(patients[0].id, today)
+        db.session.add(bill)
+        db.session.flush()
+        db.session.add_all([Payment(bill.id, Decimal('10.25')), Payment(bill.id, Decimal('5'))])
+        db.session.commit()
+        app.config['ADMIN_ID'] = admin.id
+    yield app
+    with app.app_context():
+        db.drop_all()
+
+@pytest.fixture
+def statement_counts(app):
+    """Statements run by each request, in order."""
+    counts = []
+    
+    @app.after_request
+    def record(response):
+        counts.append(len(current_log()))
+        return response
+    return counts
+
+def test_aggregate_over_several_tables_is_one_statement(app):
+    today = date.today()
+    with app.test_request_context():
+        start_log()
+        figures = stats.aggregate({
+            Patient: {'total': stats.count(), 'by_gender': stats.count_by(Patient.gender)},
+            Appointment: {'today': stats.count(Appointment.appointment_date == today), 'by_status': stats.count_by(Appointment.status)},
+            Payment: {'revenue': stats.total(Payment.amount), 'large': stats.total(Payment.amount, Payment.amount > 6)}
+        })
+        assert len(current_log()) == 1
+    
+    assert figures['total'] == 3
+    assert figures['by_gender']['Female'] == 3
+    assert figures['today'] == 1
+    assert figures['by_status']['scheduled'] == 3
+    assert figures['revenue'] == Decimal('15.25')
+    assert figures['large'] == Decimal('10.25')
+
+def test_aggregate_without_filter_clauses_matches(app, monkeypatch):
+    tables = {
+        Appointment: {'by_status': stats.count_by(Appointment.status)},
+        Payment: {'large': stats.total(Payment.amount, Payment.amount > 6), 'count': stats.count()}
+    }
+    with app.app_context():
+        filtered = stats.aggregate(tables)
+        monkeypatch.setattr(stats, 'FILTER_DIALECTS', ())
+        assert stats.aggregate(tables) == filtered
+
+def test_dashboard_stats_statement_count(app, statement_counts):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(app.config['ADMIN_ID'])
+    
+    # The first read of the day recounts the counters; later ones read them
+    assert client.get('/api/dashboard/stats').status_code == 200
+    response = client.get('/api/dashboard/stats')
+    assert response.status_code == 200
+    assert response.get_json()['patients']['total'] == 3
+    assert statement_counts[-1] <= 3
\ No newline at end of file
@@ -0,0 +1,147 @@
+"""Cancellation backfill: offers, declines, lapsed offers and auto-booking."""
+
+from datetime import date, datetime, time, timedelta
+import pytest
+from app import create_app, db
+from app.models.appointment import Appointment, SlotHold, WaitlistEntry
+from app.models.patient import Patient
+from app.models.staff import Staff
+from app.models.user import User
+from app.services import waitlist
+from app.services.waitlist import decline_offer, expire_offers
+
+SLOT_DATE = date.today() + timedelta(days=7)
+
+@pytest.fixture
+def app():
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        doctor = User('doctor', 'doctor@example.com', 'secret', 'doctor')
+        db.session.add(doctor)
+        db.session.commit()
+        staff = Staff(doctor.id, 'John', 'Smith', 'Male', '555-0101', 'john.smith@example.com', 'Cardiology')
+        patients = [Patient(f'Patient{i}', 'Test', date(1980, 1, 1), 'Female', f'555-010{i}') for i in range(4)]
+        db.session.add_all([staff] + patients)
+        db.session.commit()
+        appointment = Appointment(patients[0].id, staff.id, SLOT_DATE, time(10), 'Consultation')
+        db.session.add(appointment)
+        db.session.commit()
+        app.config['DOCTOR_ID'] = staff.id
+        app.config['PATIENT_IDS'] = [patient.id for patient in patients]
+        app.config['APPOINTMENT_ID'] = appointment.id
+    yield app
+    with app.app_context():
+        db.drop_all()
+
+def add_entry(app, patient_index, priority='medium', **kwargs):
+    entry = WaitlistEntry(
+        patient_id=app.config['PATIENT_IDS'][patient_index],
+        doctor_id=app.config['DOCTOR_ID'],
+        department='Cardiology',
+        earliest_date=SLOT_DATE - timedelta(days=1),
+        latest_date=SLOT_DATE + timedelta(days=1),
+        appointment_type='Follow-up',
+        priority=priority,
+        **kwargs
+    )
+    db.session.add(entry)
+    db.session.commit()
+    return entry.id
+
+def cancel_appointment(app):
+    assert db.session.get(Appointment, app.config['APPOINTMENT_ID']).cancel()
+
+def booking_version(app):
+    return db.session.get(Staff, app.config['DOCTOR_ID']).booking_version
+
+def test_cancel_offers_slot_to_best_candidate(app):
+    with app.app_context():
+        low = add_entry(app, 1, 'low')
+        high = add_entry(app, 2, 'high')
+        cancel_appointment(app)
+        
+        offered = db.session.get(WaitlistEntry, high)
+        assert offered.status == 'offered'
+        assert offered.hold.appointment_time == time(10)
+        assert db.session.get(WaitlistEntry, low).status == 'waiting'
+
+def test_declined_offer_moves_to_next_candidate(app):
+    with app.app_context():
+        low = add_entry(app, 1, 'low')
+        high = add_entry(app, 2, 'high')
+        cancel_appointment(app)
+        
+        decline_offer(db.session.get(WaitlistEntry, high))
+        db.session.commit()
+        assert db.session.get(WaitlistEntry, high).status == 'waiting'
+        assert db.session.get(WaitlistEntry, low).status == 'offered'
+        assert SlotHold.query.count() == 1
+
+def test_lapsed_offer_moves_to_next_candidate(app):
+    with app.app_context():
+        first = add_entry(app, 1, 'high')
+        second = add_entry(app, 2)
+        cancel_appointment(app)
+        
+        entry = db.session.get(WaitlistEntry, first)
+        entry.offer_expires_at = entry.hold.expires_at = datetime.utcnow() - timedelta(seconds=1)
+        db.session.commit()
+        assert expire_offers() == 1
+        assert db.session.get(WaitlistEntry, first).status == 'waiting'
+        assert db.session.get(WaitlistEntry, second).status == 'offered'
+
+def test_auto_book_entry_is_booked(app):
+    with app.app_context():
+        entry_id = add_entry(app, 1, auto_book=True)
+        cancel_appointment(app)
+        
+        entry = db.session.get(WaitlistEntry, entry_id)
+        assert entry.status == 'booked'
+        assert entry.appointment.appointment_time == time(10)
+        assert entry.appointment.patient_id == app.config['PATIENT_IDS'][1]
+
+def test_backfill_claims_doctor_only_for_a_candidate(app):
+    with app.app_context():
+        version = booking_version(app)
+        appointment = db.session.get(Appointment, app.config['APPOINTMENT_ID'])
+        appointment.status = 'confirmed'
+        db.session.commit()
+        assert booking_version(app) == version
+        
+        # Nobody waiting: the cancellation alone doesn't claim the doctor
+        cancel_appointment(app)
+        assert booking_version(app) == version
+        assert SlotHold.query.count() == 0
+
+def test_rolled_back_cancellation_offers_nothing(app):
+    with app.app_context():
+        entry_id = add_entry(app, 1)
+        db.session.get(Appointment, app.config['APPOINTMENT_ID']).status = 'cancelled'
+        db.session.flush()
+        db.session.rollback()
+        db.session.commit()
+        assert db.session.get(WaitlistEntry, entry_id).status == 'waiting'
+
+def test_started_slot_is_not_offered(app):
+    with app.app_context():
+        entry = db.session.get(WaitlistEntry, add_entry(app, 1))
+        entry.earliest_date = date.today() - timedelta(days=1)
+        appointment = Appointment(app.config['PATIENT_IDS'][3], app.config['DOCTOR_ID'], date.today() - timedelta(days=1), time(10), 'Consultation')
+        db.session.add(appointment)
+        db.session.commit()
+        
+        appointment.status = 'cancelled'
+        db.session.commit()
+        assert entry.status == 'waiting'
+
+def test_failed_backfill_keeps_the_cancellation(app, monkeypatch):
+    def fail(*args, **kwargs):
+        raise RuntimeError('backfill failed')
+    monkeypatch.setattr(waitlist, 'fill_slot', fail)
+    
+    with app.app_context():
+        add_entry(app, 1)
+        cancel_appointment(app)
+        db.session.remove()
+        assert db.session.get(Appointment, app.config['APPOINTMENT_ID']).status == 'cancelled'
\ No newline at end of file